@@ -0,0 +1,94 @@
+"""
+Measures per-request latency of ElasticSearchBackend against a local stand-in server,
+comparing a fresh client per request (the previous behaviour) with the shared,
+pooled client.
+
+Run from the repository root:
+
+    TERRANOVA_CONF=./SAMPLE_CONFIG.yml python -m benchmarks.elasticsearch_client
+"""
+
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from terranova.backends.elasticsearch import ElasticSearchBackend
+
+REQUESTS = 500
+QUERY = {"bool": {"filter": [{"term": {"mapId": "abcdefg"}}]}}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every request with an empty search result, like an idle cluster would"""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; don't let Nagle delay the body
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StandInHandler.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        self.rfile.read(length)
+        body = json.dumps({"hits": {"hits": []}}).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("x-elastic-product", "Elasticsearch")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label, backend_factory, url):
+    StandInHandler.connections = 0
+    timings = []
+    backend = backend_factory(url)
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        backend.query("terranova-map-*", QUERY)
+        timings.append((time.perf_counter() - start) * 1000)
+        backend = backend_factory(url, backend)
+    print(
+        "%-14s mean %.3fms  p50 %.3fms  p95 %.3fms  connections opened: %d"
+        % (
+            label,
+            statistics.mean(timings),
+            statistics.median(timings),
+            statistics.quantiles(timings, n=20)[-1],
+            StandInHandler.connections,
+        )
+    )
+
+
+def fresh_client(url, previous=None):
+    # a new backend per request has no cached client, like the old `es` property
+    return ElasticSearchBackend(url=url, user="user", password="password")
+
+
+def shared_client(url, previous=None):
+    return previous or ElasticSearchBackend(url=url, user="user", password="password")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d" % server.server_address[1]
+
+    print("%d requests against %s" % (REQUESTS, url))
+    run("fresh client", fresh_client, url)
+    run("shared client", shared_client, url)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
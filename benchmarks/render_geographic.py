@@ -0,0 +1,105 @@
+"""
+Measures GoogleSheetsBackend._render_geographic over a synthetic 10k-edge sheet, with
+node SVG rendering memoized on the values each template reads and node sizes parsed
+once per distinct svg, against rendering the template once per node and compiling the
+data-width / data-height regexes for every endpoint (the previous behaviour).
+
+Run from the repository root:
+
+    TERRANOVA_CONF=./SAMPLE_CONFIG.yml python -m benchmarks.render_geographic
+"""
+
+import copy
+import importlib
+import random
+import re
+import statistics
+import time
+
+from terranova.datasources.google_sheets.backend import GoogleSheetsBackend
+from terranova.settings import DEFAULT_NODE_TEMPLATES
+
+# the package exports a `backend` instance that shadows the module of the same name
+google_sheets = importlib.import_module("terranova.datasources.google_sheets.backend")
+
+EDGES = 10000
+SITES = 3000
+RUNS = 5
+
+TEMPLATES = {
+    # reads no variables: every node renders the same
+    "default geographic": DEFAULT_NODE_TEMPLATES["GEOGRAPHIC"],
+    # reads a couple of low-cardinality fields
+    "styled by site type": """<g data-width="{{ 12 if meta.site_type == 'hub' else 8 }}">
+        <circle r="{{ 6 if meta.site_type == 'hub' else 4 }}" class="{{ meta['region'] }}" />
+        </g>""",
+    # reads the (unique) node name: nothing to share, shows the overhead
+    "default logical": DEFAULT_NODE_TEMPLATES["LOGICAL"],
+}
+
+
+def previous_parse_node_size(svg):
+    def parse_attr_to_int(template, attr):
+        regex = re.compile(r'%s="(\d+)"' % attr)
+        match = regex.findall(template)
+        if match:
+            return int(match[0])
+        return None
+
+    return parse_attr_to_int(svg, "data-width"), parse_attr_to_int(svg, "data-height")
+
+
+def make_sheet():
+    random.seed(0)
+    sites = [
+        {
+            "name": "site-%d" % i,
+            "latitude": str(random.uniform(25, 50)),
+            "longitude": str(random.uniform(-125, -65)),
+            "site_type": random.choice(["hub", "pop", "customer"]),
+            "region": "region-%d" % random.randrange(10),
+            "svg": '<g data-width="30" data-height="15"></g>',
+        }
+        for i in range(SITES)
+    ]
+    return [
+        {
+            "id": "edge-%d" % i,
+            "name": "edge %d" % i,
+            "endpoints": [dict(site) for site in random.sample(sites, 2)],
+            "meta": {"circuit_speed": random.choice([10, 100, 400])},
+        }
+        for i in range(EDGES)
+    ]
+
+
+def measure(backend, sheet, template):
+    timings = []
+    for _ in range(RUNS):
+        edges = copy.deepcopy(sheet)  # rendering annotates the endpoints in place
+        start = time.perf_counter()
+        backend._render_geographic(edges, template, [])
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    backend = GoogleSheetsBackend()
+    sheet = make_sheet()
+    render_key, parse_node_size = google_sheets.render_key, google_sheets.parse_node_size
+    print("%d edges, %d sites, median of %d runs" % (EDGES, SITES, RUNS))
+    for label, template in TEMPLATES.items():
+        google_sheets.render_key = lambda *args: None  # render every node
+        google_sheets.parse_node_size = previous_parse_node_size
+        previous = measure(backend, sheet, template)
+        google_sheets.render_key = render_key
+        google_sheets.parse_node_size = parse_node_size
+        memoized = measure(backend, sheet, template)
+        print(
+            "  %-20s previous %7.1fms  memoized %7.1fms  (%.1fx)"
+            % (label, previous, memoized, previous / memoized)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Measures GoogleSheetsBackend.query over a synthetic 100k-edge sheet, with filters
+matched against the indexed endpoint and value tables and rows ordered by edge id,
+against matching them in the JSON edge documents and ordering by their "id" field (the
+previous behaviour). Also measures listing the distinct values of a column from the
+same indexes, against reading them out of every JSON document, and counting the
+matches in the same statement as the page of rows, against a separate count.
+
+Run from the repository root:
+
+    TERRANOVA_CONF=./SAMPLE_CONFIG.yml python -m benchmarks.sheets_query
+"""
+
+import importlib
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from terranova.abstract_models import QueryFilter, InputModifier
+
+# the package exports `backend` and `fetch`, which shadow the modules of the same name
+google_sheets = importlib.import_module("terranova.datasources.google_sheets.backend")
+fetcher = importlib.import_module("terranova.datasources.google_sheets.fetcher")
+
+EDGES = 100000
+SITES = 3000
+RUNS = 5
+LIMIT = 100
+
+FILTERS = {
+    "name": [QueryFilter(field="name", value=["edge 4242"])],
+    "name like": [QueryFilter(field="name", operator=InputModifier.like, value=["edge 999"])],
+    "speed (custom)": [QueryFilter(field="speed", value=["400"])],
+    "endpoint name": [QueryFilter(field="endpoints_name", value=["site-17"])],
+    "endpoint not": [
+        QueryFilter(field="endpoints_name", operator=InputModifier.not_equal, value=["site-17"])
+    ],
+    "speed + endpoint": [
+        QueryFilter(field="speed", value=["10"]),
+        QueryFilter(field="endpoints_region", value=["region-3"]),
+    ],
+}
+
+
+def make_sheet():
+    random.seed(0)
+    sites = [
+        {
+            "name": "site-%d" % i,
+            "latitude": str(random.uniform(25, 50)),
+            "longitude": str(random.uniform(-125, -65)),
+            "region": "region-%d" % random.randrange(10),
+        }
+        for i in range(SITES)
+    ]
+    return [
+        {
+            "name": "edge %d" % i,
+            "description": "",
+            "endpoints": [dict(site) for site in random.sample(sites, 2)],
+            "speed": random.choice(["10", "100", "400"]),
+        }
+        for i in range(EDGES)
+    ]
+
+
+def write_cache(path):
+    fetcher.GOOGLE_SHEETS_CACHE_FILE = path
+    writer = fetcher.CacheWriter()
+    writer.begin_refresh()
+    writer.stage_sheet(
+        "bench",
+        {
+            "name": "bench",
+            "columns": ["name", "description", "speed", "endpoints_name", "endpoints_region"],
+            "types": ["scalar"] * 5,
+            "version": "1",
+            "modified_time": None,
+        },
+        make_sheet(),
+    )
+    writer.finish_refresh()
+    writer.conn.close()
+
+
+def previous_query(backend, filters):
+    query = backend.session.query(google_sheets.EdgeTable.edge).filter_by(sheet_id="bench")
+    query = google_sheets.SQLiteCacheDatasource.apply_filters(backend, query, filters, True)
+    query = query.order_by(google_sheets.EdgeTable.edge["id"])
+    count = query.count()
+    return count, query.limit(LIMIT).all()
+
+
+def indexed_query(backend, filters):
+    result = backend.query(filters, limit=LIMIT, sheet_id="bench")
+    return result.count, result.data
+
+
+def separate_count(backend, filters):
+    query = backend.session.query(google_sheets.EdgeTable.edge).filter_by(sheet_id="bench")
+    query = backend.apply_filters(query, filters, True, "bench")
+    query = query.order_by(google_sheets.EdgeTable.id)
+    count = query.count()
+    return count, query.limit(LIMIT).all()
+
+
+DISTINCT = ["speed", "endpoints_name", "endpoints_region"]
+
+
+def previous_distinct(backend, field):
+    values = google_sheets.SQLiteCacheDatasource.get_unique_values(
+        backend, field, [], extra_criteria=[{"sheet_id": "bench"}]
+    )
+    return len(values), values
+
+
+def indexed_distinct(backend, field):
+    values = backend.get_unique_values(field, [], extra_criteria=[{"sheet_id": "bench"}])
+    return len(values), values
+
+
+def measure(query, backend, filters):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        count, _ = query(backend, filters)
+        timings.append((time.perf_counter() - start) * 1000)
+    return count, statistics.median(timings)
+
+
+def main():
+    temp_fd, path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(temp_fd)
+    try:
+        start = time.perf_counter()
+        write_cache(path)
+        print("wrote %d edges in %.1fs" % (EDGES, time.perf_counter() - start))
+
+        backend = google_sheets.GoogleSheetsBackend()
+        engine = create_engine("sqlite:///" + path, poolclass=NullPool)
+        backend.session = sessionmaker(bind=engine)()
+        print("%d edges, %d sites, first %d rows, median of %d runs" % (EDGES, SITES, LIMIT, RUNS))
+        for label, filters in FILTERS.items():
+            _, previous = measure(previous_query, backend, filters)
+            count, indexed = measure(indexed_query, backend, filters)
+            print(
+                "  %-18s %6d rows  previous %7.1fms  indexed %7.1fms  (%.1fx)"
+                % (label, count, previous, indexed, previous / indexed)
+            )
+        print("count and first page")
+        for label, filters in FILTERS.items():
+            _, previous = measure(separate_count, backend, filters)
+            count, single = measure(indexed_query, backend, filters)
+            print(
+                "  %-18s %6d rows  separate %7.1fms  single %7.1fms  (%.1fx)"
+                % (label, count, previous, single, previous / single)
+            )
+        print("distinct values")
+        for field in DISTINCT:
+            _, previous = measure(previous_distinct, backend, field)
+            count, indexed = measure(indexed_distinct, backend, field)
+            print(
+                "  %-18s %6d values  previous %7.1fms  indexed %7.1fms  (%.1fx)"
+                % (field, count, previous, indexed, previous / indexed)
+            )
+        backend.session.close()
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Measures map reads against the SQLite storage backend while another process keeps
+saving new map revisions, comparing SQLite's default connection settings (the previous
+behaviour) with the tuned profile from the `storage.sqlite_*` settings.
+
+Each reader and the writer run in their own process, like uvicorn workers do.
+
+Run from the repository root:
+
+    TERRANOVA_CONF=./SAMPLE_CONFIG.yml python -m benchmarks.sqlite_concurrency
+"""
+
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from terranova.backends.sqlite import SQLiteBackend
+
+MAPS = 200
+READERS = 4
+DURATION = 5  # seconds
+# a realistic map revision carries a few tens of KB of configuration
+CONFIGURATION = {"layers": [{"name": "layer %d" % i, "mapjson": "x" * 2000} for i in range(10)]}
+
+PROFILES = {
+    # what sqlite3.connect() gives you without any configuration
+    "sqlite defaults": {
+        "journal_mode": "delete",
+        "synchronous": "full",
+        "busy_timeout": 5000,
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "statement_cache_size": 128,
+    },
+    # the defaults of the storage.sqlite_* settings
+    "tuned profile": {},
+}
+
+
+def map_revision(map_id, version):
+    return {
+        "mapId": map_id,
+        "name": "benchmark map",
+        "version": version,
+        "configuration": CONFIGURATION,
+        "overrides": {},
+        "lastUpdatedBy": "benchmark",
+        "lastUpdatedOn": "2000-01-01T00:00:00",
+        "public": False,
+    }
+
+
+def reader(path, profile, deadline, results):
+    backend = SQLiteBackend(path, **profile)
+    timings, errors = [], 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            backend.get_maps(map_id="map-%d" % random.randrange(MAPS))
+        except Exception:
+            errors += 1
+        timings.append((time.perf_counter() - start) * 1000)
+    results.put(("read", timings, errors))
+
+
+def writer(path, profile, deadline, results):
+    backend = SQLiteBackend(path, **profile)
+    versions = {}
+    timings, errors = [], 0
+    while time.time() < deadline:
+        map_id = "map-%d" % random.randrange(MAPS)
+        versions[map_id] = versions.get(map_id, 1) + 1
+        start = time.perf_counter()
+        try:
+            backend.create("map", backend.generate_id(), map_revision(map_id, versions[map_id]))
+        except Exception:
+            errors += 1
+        timings.append((time.perf_counter() - start) * 1000)
+    results.put(("write", timings, errors))
+
+
+def run(label, profile):
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    backend = SQLiteBackend(path, **profile)
+    backend.bulk_create("map", {"map-%d" % i: map_revision("map-%d" % i, 1) for i in range(MAPS)})
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + DURATION
+    processes = [
+        multiprocessing.Process(target=reader, args=(path, profile, deadline, results))
+        for _ in range(READERS)
+    ]
+    processes.append(
+        multiprocessing.Process(target=writer, args=(path, profile, deadline, results))
+    )
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    reads = [t for kind, timings, _ in collected if kind == "read" for t in timings]
+    writes = [t for kind, timings, _ in collected if kind == "write" for t in timings]
+    read_errors = sum(errors for kind, _, errors in collected if kind == "read")
+    write_errors = sum(errors for kind, _, errors in collected if kind == "write")
+    print(label)
+    print(
+        "  reads:  %7.0f/s  p50 %.2fms  p99 %.2fms  max %.1fms  errors %d"
+        % (
+            len(reads) / DURATION,
+            statistics.median(reads),
+            statistics.quantiles(reads, n=100)[-1],
+            max(reads),
+            read_errors,
+        )
+    )
+    print(
+        "  writes: %7.0f/s  p50 %.2fms  p99 %.2fms  max %.1fms  errors %d"
+        % (
+            len(writes) / DURATION,
+            statistics.median(writes),
+            statistics.quantiles(writes, n=100)[-1],
+            max(writes),
+            write_errors,
+        )
+    )
+
+
+def main():
+    print("%d reader processes and 1 writer process, %ds per profile" % (READERS, DURATION))
+    for label, profile in PROFILES.items():
+        run(label, profile)
+
+
+if __name__ == "__main__":
+    main()
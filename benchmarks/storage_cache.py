@@ -0,0 +1,88 @@
+"""
+Measures a hit in the storage cache, which unpickles a copy of the cached revision,
+against reading the same dataset revision from the SQLite storage backend, for datasets
+carrying snapshots of increasing size.
+
+The backend is called directly, so the comparison leaves out the worker thread hop an
+API request makes for every storage read.
+
+Run from the repository root:
+
+    TERRANOVA_CONF=./SAMPLE_CONFIG.yml python -m benchmarks.storage_cache
+"""
+
+import os
+import statistics
+import tempfile
+import time
+
+from terranova.backends.cache import StorageCache
+from terranova.backends.sqlite import SQLiteBackend
+
+SNAPSHOT_SIZES = [0, 100, 1000, 10000]  # edges in the dataset's results
+RUNS = 200
+
+
+def edge(i):
+    return {
+        "id": str(i),
+        "name": "edge %d" % i,
+        "description": "",
+        "endpoints": [
+            {"name": "site-%d" % (i % 300), "latitude": 41.8, "longitude": -87.6},
+            {"name": "site-%d" % ((i + 1) % 300), "latitude": 39.7, "longitude": -104.9},
+        ],
+        "source": "site-%d" % (i % 300),
+        "destination": "site-%d" % ((i + 1) % 300),
+        "speed": "100",
+    }
+
+
+def dataset(dataset_id, edges):
+    return {
+        "datasetId": dataset_id,
+        "name": "benchmark dataset",
+        "version": 1,
+        "query": {"endpoint": "google_sheets?sheet_id=bench", "filters": []},
+        "results": [edge(i) for i in range(edges)],
+        "lastUpdatedBy": "benchmark",
+        "lastUpdatedOn": "2000-01-01T00:00:00",
+    }
+
+
+def measure(read):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        read()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    temp_fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(temp_fd)
+    try:
+        backend = SQLiteBackend(path)
+        cache = StorageCache(max_entries=len(SNAPSHOT_SIZES), ttl=3600)
+        print("median of %d reads of one dataset revision" % RUNS)
+        for edges in SNAPSHOT_SIZES:
+            dataset_id = "bench%d" % edges
+            backend.create("dataset", dataset_id, dataset(dataset_id, edges))
+            key = ("dataset", dataset_id, "1")
+            cache.set(key, backend.get_datasets(dataset_id=dataset_id, version="1"))
+
+            storage = measure(lambda: backend.get_datasets(dataset_id=dataset_id, version="1"))
+            hit = measure(lambda: cache.get(key))
+            print(
+                "  %6d edges  storage %7.3fms  cache hit %7.3fms  (%.1fx)"
+                % (edges, storage, hit, storage / hit)
+            )
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,6 @@
 #!/bin/sh
 
 echo "Caching Datasources..."
-# run terranova datasource caching
-PYTHONPATH=/terranova /usr/local/bin/cache-datasources
-
-echo "Datasource cache complete. Next run in 2 minutes."
-# sleep for two minutes
-sleep 120
-# exit with non-zero so we are recycled by supervisor
-exit 1
\ No newline at end of file
+# run the terranova datasource cache scheduler; it refreshes every datasource
+# on its own interval (see datacacher in settings.yml) until it is stopped
+PYTHONPATH=/terranova exec /usr/local/bin/cache-datasources
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Annotated
 from enum import Enum
-from typing import List, Union, Dict, Any
+from typing import List, Union, Dict, Any, NamedTuple
 from dataclasses import make_dataclass, asdict
 from fastapi import Query, HTTPException
 from sqlalchemy import func, text, column, exists, and_, or_
@@ -12,6 +12,7 @@ from collections import defaultdict
 import pygraphviz
 from terranova.request import get_request
 from contextvars import ContextVar
+import functools
 import orjson as json
 
 
@@ -89,6 +90,14 @@ class BaseDatasource(ABC):
     def apply_layout(self, layout: TerranovaLayout, topology: Topology) -> Topology:
         pass
 
+    def cache_version(self):
+        """
+        Returns a value that changes whenever the data this datasource queries changes,
+        e.g. when its cache is refreshed. Rendered live topologies are only cached for
+        datasources that implement this; None means unknown.
+        """
+        return None
+
 
 class SQLiteCacheDatasource(BaseDatasource):
     # this is the recommended decorator combination for "abstract property"
@@ -107,84 +116,47 @@ class SQLiteCacheDatasource(BaseDatasource):
     def json_column(self):
         pass
 
+    def filter_values(self, filter: QueryFilter, apply_templated_filters=True) -> List[str]:
+        """
+        Returns the values a filter matches: its own, or for a templated filter those of
+        the query parameter of the same name in the current request. Templated filters
+        match nothing (and should be skipped) unless apply_templated_filters is set.
+        """
+        if not filter.templated:
+            return filter.value
+        if not apply_templated_filters:
+            return []
+        request = get_request()
+        if filter.field not in request.query_params:
+            raise HTTPException(
+                status_code=400,
+                detail="Malformed request. Expected '?%s=' in query parameters." % filter.field,
+            )
+        return request.query_params.getlist(filter.field)
+
     def apply_filters(
         self, query: SQLQuery, filters: list[QueryFilter], apply_templated_filters=True
     ) -> SQLQuery:
         for filter in filters:
-            field = filter.field
-            operator = filter.operator
-            value = filter.value
-            templated = filter.templated
-            request = get_request()
-            if templated:
-                if not apply_templated_filters:
-                    continue
-                if field not in request.query_params:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Malformed request. Expected '?%s=' in query parameters." % field,
-                    )
-                value = request.query_params.getlist(field)
+            value = self.filter_values(filter, apply_templated_filters)
 
-            if value == []:
+            if not value:
                 continue
 
-            # print(f"{filter=} {operator=} {value=}")
-
-            NOT = operator == InputModifier.not_equal
-            NLIKE = operator == InputModifier.not_like
-            LIKE = operator == InputModifier.like
-
-            if LIKE or NLIKE:
+            plan = filter_plan(self.record_model, filter.field, filter.operator)
+            if plan.like:
                 # Add SQL search tokens around each value
                 value = ["%" + v + "%" for v in value]
 
-            LOGIC = or_
-            if NOT or NLIKE:
-                LOGIC = and_
-
-            COMPARATOR = "="
-            if NOT:
-                COMPARATOR = "!="
-            if LIKE:
-                COMPARATOR = "like"
-            if NLIKE:
-                COMPARATOR = "not like"
-
-            exceptional_fields = group_fields_by_type(self.record_model)
             # Hack to work with JSON schema
-            # TODO: this sort of hack appears in a few places, could this be
-            # abstracted away into a class / model?
             # ie endpoints.location_name => we really care about the "location_name" inside
             # of the endpoints array objects
-            if field in exceptional_fields["object_array"]:
-                parent = exceptional_fields["object_array"][field]
-                prefix = "%s_" % parent
-                json_selector = "$.%s" % parent
-                # if field.startswith("endpoints_"):
-                filter_fieldname = field.split(prefix)[1]
-                # When we're dealing with the array of endpoints, we're always doing
-                # a positive match on the inner criteria
-                LOCAL_COMPARATOR = "="
-                if LIKE:
-                    LOCAL_COMPARATOR = "like"
-
-                # Similar to the above, when we're dealing with an array we're default to
-                # AND since we want everything in the array to match, unless we're in a
-                # negation context in which we want any of the matches to disqualify
-                LOCAL_LOGIC = and_
-                if NOT or NLIKE:
-                    LOCAL_LOGIC = or_
-
-                filter = LOCAL_LOGIC(
+            if plan.kind == "object_array":
+                filter = plan.element_logic(
                     exists()
-                    .select_from(
-                        func.json_each(func.json_extract(self.json_column, json_selector))
-                    )
+                    .select_from(func.json_each(func.json_extract(self.json_column, plan.path)))
                     .where(
-                        func.json_extract(text("value"), f"$.{filter_fieldname}").op(
-                            LOCAL_COMPARATOR
-                        )(v)
+                        func.json_extract(text("value"), plan.child).op(plan.element_comparator)(v)
                     )
                     for v in value
                 )
@@ -195,39 +167,24 @@ class SQLiteCacheDatasource(BaseDatasource):
                 # "NOT any endpoint.type == Organization"
                 # vs
                 # "any endpoint_type != Organization"
-                if NOT or NLIKE:
+                if plan.negated:
                     query = query.filter(~filter)
                 else:
                     query = query.filter(filter)
 
-            elif field in exceptional_fields["child_model"]:
-                parent = exceptional_fields["child_model"][field]
-                prefix = "%s_" % parent
-                child = field.split(prefix)[1]
-
-                query = query.filter(
-                    LOGIC(
-                        func.json_extract(self.json_column, f"$.{parent}.{child}").op(COMPARATOR)(
-                            v
-                        )
-                        for v in value
-                    )
-                )
-
             # Also hack to work with JSON schemas. These are array fields so need to be unwound
-            elif field in exceptional_fields["string_array"]:
-                # elif "tags" in field:
+            elif plan.kind == "string_array":
                 query = query.filter(
                     exists()
-                    .select_from(func.json_each(func.json_extract(self.json_column, f"$.{field}")))
-                    .where(LOGIC(column("value").op(COMPARATOR)(v) for v in value))
+                    .select_from(func.json_each(func.json_extract(self.json_column, plan.path)))
+                    .where(plan.logic(column("value").op(plan.comparator)(v) for v in value))
                 )
 
-            # every other field type
+            # child model fields and every other field type
             else:
                 query = query.filter(
-                    LOGIC(
-                        func.json_extract(self.json_column, f"$.{field}").op(COMPARATOR)(v)
+                    plan.logic(
+                        func.json_extract(self.json_column, plan.path).op(plan.comparator)(v)
                         for v in value
                     )
                 )
@@ -402,6 +359,9 @@ class BaseTypeFilters:
     pass
 
 
+# building a model's JSON schema is slow, and a model's fields don't change: each model
+# is classified once, when its datasource plugin creates its TypeFilters
+@functools.lru_cache(maxsize=None)
 def group_fields_by_type(model_class):
     schema = model_class.model_json_schema()
     properties = schema["properties"]
@@ -432,7 +392,77 @@ def group_fields_by_type(model_class):
                 for modifier in InputModifier:
                     modified_child_field = "%s_%s" % (child_field, modifier.name)
                     fields["child_model"][modified_child_field] = field_name
-    return fields
+    # the classification is shared by every caller, so it isn't a defaultdict they could add to
+    return {
+        kind: dict(fields[kind])
+        for kind in ("string_array", "object_array", "object_array_prefixes", "child_model")
+    }
+
+
+class FilterPlan(NamedTuple):
+    """How SQLiteCacheDatasource.apply_filters matches a field of a record model"""
+
+    kind: str  # "object_array", "string_array" or "scalar" (child model fields included)
+    path: str  # the JSON path of the field, or of the array holding it
+    child: str | None  # the JSON path of the field inside each element of an object array
+    comparator: str  # compares the field with each value...
+    logic: Any  # ...and combines the comparisons (or_ / and_)
+    element_comparator: str  # object arrays: compares an element's field with each value
+    element_logic: Any  # object arrays: combines the elements that match each value
+    negated: bool  # object arrays: exclude the records with a matching element
+    like: bool  # values are wrapped in SQL search tokens
+
+
+@functools.lru_cache(maxsize=4096)
+def filter_plan(model_class, field: str, operator: InputModifier | None) -> FilterPlan:
+    """Returns the FilterPlan for a (field, operator) of a record model, computed once"""
+    NOT = operator == InputModifier.not_equal
+    NLIKE = operator == InputModifier.not_like
+    LIKE = operator == InputModifier.like
+
+    LOGIC = or_
+    if NOT or NLIKE:
+        LOGIC = and_
+
+    COMPARATOR = "="
+    if NOT:
+        COMPARATOR = "!="
+    if LIKE:
+        COMPARATOR = "like"
+    if NLIKE:
+        COMPARATOR = "not like"
+
+    # When we're dealing with an array of objects we're always doing a positive match on
+    # the inner criteria, with AND since we want every value to match one of the
+    # elements, unless we're in a negation context in which we want any of the matches
+    # to disqualify
+    element_comparator = "like" if LIKE or NLIKE else "="
+    element_logic = or_ if NOT or NLIKE else and_
+
+    exceptional_fields = group_fields_by_type(model_class)
+    kind, child = "scalar", None
+    if field in exceptional_fields["object_array"]:
+        parent = exceptional_fields["object_array"][field]
+        kind, path = "object_array", "$.%s" % parent
+        child = "$.%s" % field.split("%s_" % parent)[1]
+    elif field in exceptional_fields["child_model"]:
+        parent = exceptional_fields["child_model"][field]
+        path = "$.%s.%s" % (parent, field.split("%s_" % parent)[1])
+    elif field in exceptional_fields["string_array"]:
+        kind, path = "string_array", "$.%s" % field
+    else:
+        path = "$.%s" % field
+    return FilterPlan(
+        kind,
+        path,
+        child,
+        COMPARATOR,
+        LOGIC,
+        element_comparator,
+        element_logic,
+        NOT or NLIKE,
+        LIKE or NLIKE,
+    )
 
 
 def enumerate_fields(schema, definitions, prefix=""):
@@ -541,6 +571,8 @@ def create_type_filters(model_class, backend):
     filterable_fields = flatten_fields(properties, definitions)
     curval = _all_filterable_fields.get()
     _all_filterable_fields.set(curval + filterable_fields)
+    # classify the model's fields now, rather than in the first request that filters on it
+    group_fields_by_type(model_class)
 
     # Helper function to make it more transparent to things outside of this class
     # what the inputs and their intents were. Translates things like "circuit_name_not"
@@ -1,6 +1,7 @@
 import os
 import sys
-from terranova.backends.storage import backend
+from contextlib import asynccontextmanager
+from terranova.backends.storage import backend, async_backend
 from terranova.settings import STORAGE_BACKEND
 
 # Only check Elasticsearch connection if using Elasticsearch backend
@@ -26,6 +27,8 @@ from terranova.api.routers import (
     userdata,
     templates,
     output,
+    imports,
+    cache,
     basic_auth,
     datasources as datasources_router,
 )
@@ -46,11 +49,19 @@ if STORAGE_BACKEND == "elasticsearch":
 # Seed default node templates if none exist (safe to run on every startup)
 backend.initialize_templates()
 
-app = FastAPI(title="Terranova API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # the routers use the async backend, which owns connections / worker threads
+    await async_backend.close()
+
+
+app = FastAPI(title="Terranova API", lifespan=lifespan)
 app.add_middleware(RequestContextMiddleware)
 
 # attach our sub routers onto the fastapi app
-for lib in [maps, datasources_router, datasets, templates, output, userdata]:
+for lib in [maps, datasources_router, datasets, templates, output, userdata, imports, cache]:
     app.include_router(lib.router)
 
 for ds in datasources:
@@ -118,7 +129,9 @@ def _get_current_trace():
 @app.middleware("http")
 async def add_response_headers(request: Request, call_next):
     response = await call_next(request)
-    response.headers["Cache-control"] = "no-store"
+    # routes that serve revalidatable output (ETag) set their own Cache-Control
+    if "cache-control" not in response.headers:
+        response.headers["Cache-control"] = "no-store"
     response.headers["X-Trace-Id"] = _get_current_trace()
     return response
 
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Security
+from terranova.settings import TOKEN_SCOPES
+from fastapi_versioning import version
+
+from terranova.backends.auth import User, auth_check
+from terranova.datacacher import read_status
+from terranova.backends.storage import async_backend as storage_backend
+
+router = APIRouter(tags=["Terranova Storage Cache"])
+
+
+@router.get("/cache/", summary="Hit/miss metrics of this process' storage cache")
+@version(1)
+async def cache_stats(user: User = Security(auth_check, scopes=[TOKEN_SCOPES["admin"]])) -> dict:
+    cache = getattr(storage_backend, "cache", None)
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@router.get("/cache/datasources/", summary="Outcome of each datasource's latest cache refresh")
+@version(1)
+def datasource_cache_status(
+    user: User = Security(auth_check, scopes=[TOKEN_SCOPES["admin"]])
+) -> dict:
+    return read_status()
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Security
 from terranova.settings import TOKEN_SCOPES
 from fastapi_versioning import version
+from starlette.concurrency import run_in_threadpool
 from typing import List, Any
 from urllib.parse import parse_qs
 
 from terranova.backends.auth import User, auth_check
-from terranova.backends.storage import backend as storage_backend
+from terranova.backends.storage import async_backend as storage_backend
 from terranova.backends.datasources import datasources
 from terranova.models import (
     Dataset,
@@ -50,14 +51,14 @@ def parse_dataset_endpoint(endpoint_string):
 
 @router.get("/datasets/", summary="Gets all datasets, optionally filtered")
 @version(1)
-def datasets(
+async def datasets(
     version: TerranovaVersion = Depends(),
     fields: List[DatasetFieldEnum] = Query(default_fields),
     filters: DatasetFilters = Depends(),
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["read"]]),
 ) -> List[dict[str, Any]]:
 
-    result = storage_backend.get_datasets(
+    result = await storage_backend.get_datasets(
         fields=[f.name for f in fields], filters=filters, version=version
     )
 
@@ -66,10 +67,10 @@ def datasets(
 
 @router.get("/dataset/id/{datasetId}/", summary="Gets a single dataset by its ID")
 @version(1)
-def dataset_by_id(
+async def dataset_by_id(
     datasetId: str, user: User = Security(auth_check, scopes=[TOKEN_SCOPES["read"]])
 ) -> Dataset:
-    result = storage_backend.get_datasets(dataset_id=datasetId)
+    result = await storage_backend.get_datasets(dataset_id=datasetId)
     if len(result) < 1:
         raise HTTPException(status_code=404, detail="Dataset with id %s not found" % datasetId)
     return result[0]
@@ -80,25 +81,32 @@ def dataset_by_id(
     summary="Creates a new version of an existing dataset based on the dataset ID",
 )
 @version(1)
-def update_dataset(
+async def update_dataset(
     datasetId: str,
     datasetRevision: DatasetRevision,
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["write"]]),
 ):
     try:
         endpoint, context = parse_dataset_endpoint(datasetRevision.query.endpoint)
-        query_results = datasources[endpoint].backend.query(
-            datasetRevision.query.filters, limit=None, apply_templated_filters=False, **context
+        # datasource queries block, so they run on the threadpool
+        query_results = await run_in_threadpool(
+            datasources[endpoint].backend.query,
+            datasetRevision.query.filters,
+            limit=None,
+            apply_templated_filters=False,
+            **context,
+        )
+        return await storage_backend.update_dataset(
+            datasetId, datasetRevision, query_results.data, user
         )
-        return storage_backend.update_dataset(datasetId, datasetRevision, query_results.data, user)
     except TerranovaNotFoundException as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.post("/dataset/", summary="Creates a new dataset")
 @version(1)
-def create_dataset(
+async def create_dataset(
     datasetRevision: DatasetRevision,
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["write"]]),
 ):
-    return storage_backend.create_dataset(datasetRevision, user)
+    return await storage_backend.create_dataset(datasetRevision, user)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Security
+from terranova.settings import TOKEN_SCOPES
+from fastapi_versioning import version
+
+from terranova.backends.auth import User, auth_check
+from terranova.backends.storage import async_backend as storage_backend
+from terranova.models import BulkImport
+
+router = APIRouter(tags=["Terranova Bulk Import"])
+
+
+@router.post("/import/", summary="Writes many map, dataset and template revisions at once")
+@version(1)
+async def bulk_import(
+    bulk: BulkImport, user: User = Security(auth_check, scopes=[TOKEN_SCOPES["admin"]])
+) -> dict:
+    # revisions are stored exactly as given (ids, versions and authorship), so this
+    # can restore a backup into an empty backend
+    result = {}
+    if bulk.maps:
+        result["maps"] = await storage_backend.import_maps(bulk.maps)
+    if bulk.datasets:
+        result["datasets"] = await storage_backend.import_datasets(bulk.datasets)
+    if bulk.templates:
+        result["templates"] = await storage_backend.import_templates(bulk.templates)
+    return result
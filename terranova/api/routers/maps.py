@@ -4,7 +4,7 @@ from fastapi_versioning import version
 from typing import List, Any
 
 from terranova.backends.auth import User, auth_check
-from terranova.backends.storage import backend as storage_backend
+from terranova.backends.storage import async_backend as storage_backend
 from terranova.models import (
     Map,
     MapFilters,
@@ -20,8 +20,10 @@ router = APIRouter(tags=["Terranova Maps"])
 
 @router.get("/map/id/{mapId}/")
 @version(1)
-def map_by_id(mapId: str, user: User = Security(auth_check, scopes=[TOKEN_SCOPES["read"]])) -> Map:
-    result = storage_backend.get_maps(map_id=mapId)
+async def map_by_id(
+    mapId: str, user: User = Security(auth_check, scopes=[TOKEN_SCOPES["read"]])
+) -> Map:
+    result = await storage_backend.get_maps(map_id=mapId)
     if len(result) < 1:
         raise HTTPException(status_code=404, detail="Map with id %s not found" % mapId)
     return result[0]
@@ -38,7 +40,7 @@ default_fields = [
 
 @router.get("/maps/", summary="Gets all maps, optionally filtered")
 @version(1)
-def maps(
+async def maps(
     fields: List[MapFieldEnum] = Query(default_fields),
     version: VersionEnum
     | str = Query(
@@ -55,7 +57,7 @@ def maps(
     if not type(version) == str:
         version = version.name
     # deal with parsing versions
-    result = storage_backend.get_maps(
+    result = await storage_backend.get_maps(
         fields=[f.name for f in fields], filters=filters, version=version
     )
 
@@ -64,37 +66,37 @@ def maps(
 
 @router.put("/map/id/{mapId}/")
 @version(1)
-def update_map(
+async def update_map(
     mapId: str,
     mapRevision: MapRevision,
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["write"]]),
 ) -> dict:
     try:
-        return storage_backend.update_map(mapId, mapRevision, user)
+        return await storage_backend.update_map(mapId, mapRevision, user)
     except TerranovaNotFoundException as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.post("/map/")
 @version(1)
-def create_map(
+async def create_map(
     mapRevision: MapRevision, user: User = Security(auth_check, scopes=[TOKEN_SCOPES["write"]])
 ):
-    return storage_backend.create_map(mapRevision, user)
+    return await storage_backend.create_map(mapRevision, user)
 
 
 @router.post("/map/id/{mapId}/publish/")
 @version(1)
-def publish_map(
+async def publish_map(
     mapId: str,
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["publish"]]),
 ):
-    return storage_backend.publish_map(map_id=mapId, user=user)
+    return await storage_backend.publish_map(map_id=mapId, user=user)
 
 
 @router.get("/public/maps/")
 @version(1)
-def public_maps(
+async def public_maps(
     fields: List[MapFieldEnum] = Query(default_fields),
     version: VersionEnum
     | str = Query(
@@ -106,6 +108,6 @@ def public_maps(
     ),
     filters: PublicMapFilters = Depends(),
 ):
-    return storage_backend.get_public_maps(
+    return await storage_backend.get_public_maps(
         fields=[f.name for f in fields], filters=filters, version=version
     )
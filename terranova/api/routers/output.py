@@ -1,15 +1,23 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Response, Security
 from terranova.settings import TOKEN_SCOPES
 from fastapi_versioning import version
+from starlette.concurrency import run_in_threadpool
 from terranova.backends.auth import User, auth_check
-from terranova.backends.storage import backend as storage_backend
+from terranova.backends.storage import async_backend as storage_backend
 from terranova.backends.datasources import datasources, NamedDatasource, FilterTypes
 from terranova.logging import logger
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import time
+from opentelemetry import trace
 from terranova.abstract_models import get_all_type_filters
 import re
 import orjson as json
 from terranova.output.svg import render_svg, render_map_svg
+from terranova.output.cache import topology_cache, topology_key
+from terranova.request import get_request
 from terranova.api.routers.datasets import parse_dataset_endpoint
 
 from terranova.abstract_models import (
@@ -31,10 +39,17 @@ from terranova.models import (
     LayerConfiguration,
 )
 
-from terranova.settings import DEFAULT_NODE_TEMPLATES
+from terranova.settings import (
+    DEFAULT_NODE_TEMPLATES,
+    TOPOLOGY_CACHE_SIZE,
+    PRIVATE_CACHE_CONTROL,
+    PUBLIC_CACHE_CONTROL,
+    OUTPUT_LAYER_CONCURRENCY,
+)
 import datetime
 
 router = APIRouter(tags=["Terranova Output"])
+tracer = trace.get_tracer(__name__)
 
 TypeFilters = get_all_type_filters()
 
@@ -45,22 +60,60 @@ TypeFilters = get_all_type_filters()
 optionally selecting an output_type and version",
 )
 @version(1)
-def dataset_output(
+async def dataset_output(
     dataset_id: str,
     layout: TerranovaLayout,
     datatype: TerranovaDatatype,
+    request: Request,
+    response: Response,
     output_type: TerranovaOutputType | None = None,
     template: str | None = None,
     version: TerranovaVersion = Depends(),
     filters: TypeFilters = Depends(),
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["read"]]),
 ):
+    render = await _prepare_dataset_output(
+        dataset_id, layout, datatype, output_type, template, version
+    )
+    etag = _etag(render.key)
+    if _not_modified(request, etag):
+        return _not_modified_response(etag, PRIVATE_CACHE_CONTROL)
+    output = _dataset_response(await _render_dataset_output(render))
+    _cache_headers(output if isinstance(output, Response) else response, etag)
+    return output
+
+
+@dataclass
+class DatasetRender:
+    """A dataset output request, resolved far enough to identify its output"""
+
+    dataset: Dataset
+    endpoint: str
+    context: Dict[str, Any]
+    layout: TerranovaLayout | str
+    output_type: TerranovaOutputType
+    use_snapshot: bool
+    path_layout: Dict[str, Any]
+    node_template: str
+    source_version: Any
+    # identifies the output without rendering it; None if only rendering can tell
+    key: str | None
+
+
+async def _prepare_dataset_output(
+    dataset_id: str,
+    layout: TerranovaLayout | str,
+    datatype: TerranovaDatatype | str,
+    output_type: TerranovaOutputType | None = None,
+    template: str | None = None,
+    version: TerranovaVersion | str | None = None,
+) -> DatasetRender:
     if output_type is None:
         output_type = TerranovaOutputType.json
 
     use_snapshot = datatype == TerranovaDatatype.snapshot
 
-    dataset_json = storage_backend.get_datasets(dataset_id=dataset_id, version=version)
+    dataset_json = await storage_backend.get_datasets(dataset_id=dataset_id, version=version)
     if len(dataset_json) < 1:
         version_suffix = f" and version = {version}" if version is not None else ""
         raise HTTPException(
@@ -86,23 +139,129 @@ def dataset_output(
     path_layout = {"type": "curveCardinal", "tension": 0.6}
     if layout in [TerranovaLayout.logical, "logical"]:
         path_layout = {"type": "curveLinear", "tension": 0.6}
-    node_template = _get_template(
+    node_template = await _get_template(
         template_id=template, geographic=layout in [TerranovaLayout.geographic, "geographic"]
     )
 
-    topology = datasources[endpoint].backend.render_topology(
-        dataset,
-        path_layout=path_layout,
+    # the output of a snapshot only depends on the dataset revision; live output also
+    # depends on the datasource's cache, so it can only be identified if that is versioned
+    source_version = None if use_snapshot else datasources[endpoint].backend.cache_version()
+    key = None
+    if use_snapshot or source_version is not None:
+        key = topology_key(
+            dataset.datasetId,
+            dataset.version,
+            getattr(layout, "value", layout),
+            getattr(datatype, "value", datatype),
+            output_type.value,
+            node_template,
+            [] if use_snapshot else _templated_values(dataset),
+            source_version,
+        )
+
+    return DatasetRender(
+        dataset=dataset,
+        endpoint=endpoint,
+        context=context,
+        layout=layout,
+        output_type=output_type,
         use_snapshot=use_snapshot,
+        path_layout=path_layout,
         node_template=node_template,
-        **context,
+        source_version=source_version,
+        key=key,
     )
 
-    topology = datasources[endpoint].backend.apply_layout(layout, topology, node_template)
 
-    if output_type == TerranovaOutputType.svg:
-        return Response(render_svg(topology), media_type="image/svg+xml")
-    return topology
+def _templated_values(dataset: Dataset) -> List[Tuple[str, str]]:
+    """
+    The query parameters a live dataset output is rendered from: the values of its
+    templated filters, which are read from the current request (see
+    SQLiteCacheDatasource.filter_values). Other parameters don't change the output.
+    """
+    request = get_request()
+    if request is None:
+        return []
+    fields = sorted({filter.field for filter in dataset.query.filters if filter.templated})
+    return [(field, value) for field in fields for value in request.query_params.getlist(field)]
+
+
+async def _render_dataset_output(render: DatasetRender) -> Topology | str:
+    use_cache = TOPOLOGY_CACHE_SIZE > 0 and render.key is not None
+    if use_cache:
+        cached = await run_in_threadpool(
+            topology_cache.get, render.key, render.endpoint, render.source_version
+        )
+        if cached is not None:
+            return cached
+
+    # querying the datasource and rendering are blocking / CPU bound, so they run on
+    # the threadpool; everything else in this request only awaits storage.
+    datasource = datasources[render.endpoint].backend
+    topology = await run_in_threadpool(
+        datasource.render_topology,
+        render.dataset,
+        path_layout=render.path_layout,
+        use_snapshot=render.use_snapshot,
+        node_template=render.node_template,
+        **render.context,
+    )
+
+    topology = await run_in_threadpool(
+        datasource.apply_layout, render.layout, topology, render.node_template
+    )
+
+    output = topology
+    if render.output_type == TerranovaOutputType.svg:
+        output = await run_in_threadpool(render_svg, topology)
+    if use_cache:
+        await run_in_threadpool(
+            topology_cache.set, render.key, render.endpoint, render.source_version, output
+        )
+    return output
+
+
+def _dataset_response(output: Topology | str):
+    # rendered svg markup, or a Topology for FastAPI to serialize
+    if isinstance(output, str):
+        return Response(output, media_type="image/svg+xml")
+    return output
+
+
+def _etag(*keys) -> str | None:
+    """A strong ETag for an output identified by keys, or None if any key is None"""
+    if not keys or any(key is None for key in keys):
+        return None
+    if len(keys) == 1:
+        return '"%s"' % keys[0]
+    return '"%s"' % hashlib.sha256(json.dumps(keys)).hexdigest()
+
+
+def _not_modified(request: Request, etag: str | None) -> bool:
+    """Whether the request's If-None-Match already names etag"""
+    if etag is None:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+def _not_modified_response(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def _cache_headers(
+    response: Response, etag: str | None, cache_control: str = PRIVATE_CACHE_CONTROL
+):
+    # without an ETag there is nothing to revalidate against; keep the no-store default
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = cache_control
+    return response
 
 
 # Outputs a dataset directly from a query, only supports live view.
@@ -111,7 +270,7 @@ def dataset_output(
     summary="Receives a Dataset Revision via PATCH; outputs raw query results",
 )
 @version(1)
-def output_dataset_revision_raw(
+async def output_dataset_revision_raw(
     request: Request,
     dataset_revision: DatasetRevision,
     filters: TypeFilters = Depends(),
@@ -119,7 +278,9 @@ def output_dataset_revision_raw(
 ) -> List[Dict[Any, Any]]:
     dataset = _make_ephemeral_dataset(dataset_revision.query)
     endpoint, context = parse_dataset_endpoint(dataset.query.endpoint)
-    response = datasources[endpoint].backend.query(dataset.query.filters, limit=None, **context)
+    response = await run_in_threadpool(
+        datasources[endpoint].backend.query, dataset.query.filters, limit=None, **context
+    )
     return response.data
 
 
@@ -129,7 +290,7 @@ def output_dataset_revision_raw(
     summary="Receives a Dataset Revision via PATCH; outputs live topology data",
 )
 @version(1)
-def output_dataset_revision(
+async def output_dataset_revision(
     dataset_revision: DatasetRevision,
     layout: TerranovaLayout,
     filters: TypeFilters = Depends(),
@@ -142,17 +303,24 @@ def output_dataset_revision(
     if layout in [TerranovaLayout.logical, "logical"]:
         path_layout = {"type": "curveLinear", "tension": 0.6}
 
-    template = _get_template(
+    template = await _get_template(
         template_id=template, geographic=layout in [TerranovaLayout.geographic, "geographic"]
     )
 
     endpoint, context = parse_dataset_endpoint(dataset.query.endpoint)
 
-    topology = datasources[endpoint].backend.render_topology(
-        dataset, path_layout=path_layout, use_snapshot=False, node_template=template, **context
+    topology = await run_in_threadpool(
+        datasources[endpoint].backend.render_topology,
+        dataset,
+        path_layout=path_layout,
+        use_snapshot=False,
+        node_template=template,
+        **context,
     )
 
-    return datasources[endpoint].backend.apply_layout(layout, topology, template)
+    return await run_in_threadpool(
+        datasources[endpoint].backend.apply_layout, layout, topology, template
+    )
 
 
 # Outputs a dataset directly from a query, only supports live view.
@@ -161,7 +329,7 @@ def output_dataset_revision(
     summary="Creates a query via GET variables; outputs live topology data",
 )
 @version(1)
-def output_dataset_query(
+async def output_dataset_query(
     layout: TerranovaLayout,
     datasource: NamedDatasource,
     template: str | None = None,
@@ -175,19 +343,24 @@ def output_dataset_query(
     path_layout = {"type": "curveCardinal", "tension": 0.6}
     if layout in [TerranovaLayout.logical, "logical"]:
         path_layout = {"type": "curveLinear", "tension": 0.6}
-    template = _get_template(
+    template = await _get_template(
         template_id=template, geographic=layout in [TerranovaLayout.geographic, "geographic"]
     )
 
-    topology = datasources[dataset.endpoint].render_topology(
-        dataset, path_layout=path_layout, node_template=template
+    topology = await run_in_threadpool(
+        datasources[dataset.endpoint].render_topology,
+        dataset,
+        path_layout=path_layout,
+        node_template=template,
+    )
+    return await run_in_threadpool(
+        datasources[dataset.endpoint].backend.apply_layout, layout, topology
     )
-    return datasources[dataset.endpoint].backend.apply_layout(layout, topology)
 
 
 @router.get("/output/map/{mapId}/{output_type}/", summary="Get Map output")
 @version(1)
-def get_map_output(
+async def get_map_output(
     mapId: str,
     request: Request,
     version: TerranovaVersion = Depends(),
@@ -195,7 +368,7 @@ def get_map_output(
     filters: TypeFilters = Depends(),
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["write"]]),
 ) -> Map:
-    map_json = storage_backend.get_maps(map_id=mapId, version=version)
+    map_json = await storage_backend.get_maps(map_id=mapId, version=version)
     if len(map_json) < 1:
         raise HTTPException(
             status_code=404,
@@ -204,25 +377,22 @@ def get_map_output(
 
     # by default, results are ordered by lastEditedOn desc.
     map_obj = Map(**map_json[0])
-    _normalize_map(map_obj, user)
-    if output_type == TerranovaOutputType.svg:
-        return Response(
-            render_map_svg(map_obj),
-            media_type="image/svg+xml",
-            headers={"Content-Disposition": f'inline; filename "{map_obj.name}.svg"'},
-        )
-    return map_obj
+    layers = await _prepare_map_layers(map_obj)
+    etag = _map_etag("map", map_obj, output_type, layers)
+    if _not_modified(request, etag):
+        return _not_modified_response(etag, PRIVATE_CACHE_CONTROL)
+    return _cache_headers(await _map_response(map_obj, output_type, layers, user), etag)
 
 
 @router.get("/public/output/map/{mapId}/", summary="Get output for public map")
 @version(1)
-def output_public_map(
+async def output_public_map(
     mapId: str,
     request: Request,
     version: TerranovaVersion = Depends(),
     filters: TypeFilters = Depends(),
 ):
-    map_json = storage_backend.get_public_maps(map_id=mapId, version=version)
+    map_json = await storage_backend.get_public_maps(map_id=mapId, version=version)
     if len(map_json) < 1:
         raise HTTPException(
             status_code=404,
@@ -231,20 +401,24 @@ def output_public_map(
 
     # by default, results are ordered by lastEditedOn desc.
     map_obj = Map(**map_json[0])
-    _normalize_map(map_obj)
-    return map_obj.configuration
+    layers = await _prepare_map_layers(map_obj)
+    etag = _map_etag("public_map_configuration", map_obj, TerranovaOutputType.json, layers)
+    if _not_modified(request, etag):
+        return _not_modified_response(etag, PUBLIC_CACHE_CONTROL)
+    await _normalize_map(map_obj, layers=layers)
+    return _cache_headers(_json_response(map_obj.configuration), etag, PUBLIC_CACHE_CONTROL)
 
 
 @router.get("/public/output/map/{mapId}/{output_type}/", summary="Get output for public map")
 @version(1)
-def output_typed_public_map(
+async def output_typed_public_map(
     mapId: str,
     request: Request,
     version: TerranovaVersion = Depends(),
     output_type: TerranovaOutputType | None = None,
     filters: TypeFilters = Depends(),
 ):
-    map_json = storage_backend.get_public_maps(map_id=mapId, version=version)
+    map_json = await storage_backend.get_public_maps(map_id=mapId, version=version)
     if len(map_json) < 1:
         raise HTTPException(
             status_code=404,
@@ -253,32 +427,62 @@ def output_typed_public_map(
 
     # by default, results are ordered by lastEditedOn desc.
     map_obj = Map(**map_json[0])
-    _normalize_map(map_obj)
-    if output_type == TerranovaOutputType.svg:
-        return Response(
-            render_map_svg(map_obj),
-            media_type="image/svg+xml",
-            headers={"Content-Disposition": f'inline; filename "{map_obj.name}.svg"'},
-        )
-    return map_obj
+    layers = await _prepare_map_layers(map_obj)
+    etag = _map_etag("public_map", map_obj, output_type, layers)
+    if _not_modified(request, etag):
+        return _not_modified_response(etag, PUBLIC_CACHE_CONTROL)
+    return _cache_headers(
+        await _map_response(map_obj, output_type, layers), etag, PUBLIC_CACHE_CONTROL
+    )
 
 
 @router.patch("/output/map/", summary="Get output for in-progress Map")
 @version(1)
-def output_map_patch(
+async def output_map_patch(
     map_revision: MapRevision,
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["write"]]),
 ) -> MapRevision:
-    _normalize_map(map_revision, user)
-    return map_revision
+    await _normalize_map(map_revision, user)
+    return _json_response(map_revision)
 
 
-def _normalize_map(map_object: Map | MapRevision, user: User = None) -> None:
-    map_layers = map_object.configuration.layers
-    map_overrides = map_object.overrides
-
-    # normalize json urls into the actual contents
-    for layer in map_layers:
+async def _map_response(
+    map_object: Map,
+    output_type: TerranovaOutputType | None,
+    layers: List[Tuple[LayerConfiguration, str | None, DatasetRender | None]],
+    user: User = None,
+) -> Response:
+    if output_type == TerranovaOutputType.svg:
+        # the svg is rendered from the layer topologies as they are, without
+        # serializing them into mapjson first
+        topologies = await _normalize_map(map_object, user, layers, serialize=False)
+        return Response(
+            await run_in_threadpool(render_map_svg, map_object, topologies),
+            media_type="image/svg+xml",
+            headers={"Content-Disposition": f'inline; filename "{map_object.name}.svg"'},
+        )
+    await _normalize_map(map_object, user, layers)
+    return _json_response(map_object)
+
+
+def _json_response(model) -> Response:
+    # the model was built (and its layers' mapjson serialized) here, so it doesn't need
+    # to be validated again as FastAPI does with returned models. orjson escapes the large
+    # mapjson strings faster than model_dump_json does.
+    return Response(json.dumps(model.model_dump(mode="json")), media_type="application/json")
+
+
+async def _prepare_map_layers(
+    map_object: Map | MapRevision,
+) -> List[Tuple[LayerConfiguration, str | None, DatasetRender | None]]:
+    """
+    Resolves the dataset output behind every layer's mapjsonUrl, without rendering it.
+    Returns (layer, dataset_id, render) per layer; dataset_id and render are None for
+    layers whose url isn't a terranova dataset output url. Layers asking for the same
+    dataset output share a single DatasetRender.
+    """
+    parsed = []
+    for layer in map_object.configuration.layers:
         query_url = layer.mapjsonUrl
 
         # TODO: this is a really bad way of sniffing whether
@@ -290,35 +494,131 @@ def _normalize_map(map_object: Map | MapRevision, user: User = None) -> None:
                 ".+/output/dataset/(?P<dataset_id>[A-z0-9]+)/(?P<layout>.+)/(?P<datatype>.+)/\??(?P<querystring>.*)",  # noqa
                 query_url,
             )
-        if match:
-            match_data = match.groupdict()
-            dataset_id = match_data.get("dataset_id")
-            querystring = match_data.get("querystring")
-            del match_data["querystring"]
-            if querystring:
-                for pair in querystring.split("&"):
-                    k, v = pair.split("=")
-                    match_data[k] = v
-            match_data["user"] = user
-            topology_json = dataset_output(**match_data)
-            layer.mapjson = topology_json.model_dump()
-
-            override = map_overrides.get(dataset_id)
-            if override:
-                _apply_layer_overrides(layer, override)
-
-            layer.mapjson = json.dumps(layer.mapjson)
-        else:
-            logger.warn("Unknown mapjsonurl, skipping - value was %s" % query_url)
+        if not match:
+            parsed.append((layer, None))
+            continue
+        match_data = match.groupdict()
+        querystring = match_data.get("querystring")
+        del match_data["querystring"]
+        if querystring:
+            for pair in querystring.split("&"):
+                k, v = pair.split("=")
+                match_data[k] = v
+        parsed.append((layer, match_data))
+
+    # resolve each distinct dataset output once, concurrently
+    distinct = {}
+    for _, match_data in parsed:
+        if match_data is not None:
+            distinct.setdefault(tuple(sorted(match_data.items())), match_data)
+    renders = dict(
+        zip(
+            distinct.keys(),
+            await asyncio.gather(
+                *[_prepare_dataset_output(**match_data) for match_data in distinct.values()]
+            ),
+        )
+    )
 
+    layers = []
+    for layer, match_data in parsed:
+        if match_data is None:
+            layers.append((layer, None, None))
+            continue
+        render = renders[tuple(sorted(match_data.items()))]
+        layers.append((layer, match_data["dataset_id"], render))
+    return layers
+
+
+def _map_etag(
+    kind: str,
+    map_object: Map,
+    output_type: TerranovaOutputType | None,
+    layers: List[Tuple[LayerConfiguration, str | None, DatasetRender | None]],
+) -> str | None:
+    # a map revision never changes, so its output is identified by the revision and
+    # the outputs of the datasets its layers show
+    return _etag(
+        kind,
+        map_object.mapId,
+        map_object.version,
+        (output_type or TerranovaOutputType.json).value,
+        *[render.key for _, _, render in layers if render is not None],
+    )
+
+
+async def _render_layer(render: DatasetRender, semaphore: asyncio.Semaphore) -> Topology:
+    async with semaphore:
+        with tracer.start_as_current_span(
+            "output.render_layer",
+            attributes={
+                "terranova.dataset_id": render.dataset.datasetId,
+                "terranova.dataset_version": render.dataset.version,
+                "terranova.layout": getattr(render.layout, "value", render.layout),
+            },
+        ):
+            start = time.perf_counter()
+            topology = await _render_dataset_output(render)
+            logger.debug(
+                "Rendered layer for dataset %s in %.1fms"
+                % (render.dataset.datasetId, (time.perf_counter() - start) * 1000)
+            )
+            return topology
+
+
+async def _normalize_map(
+    map_object: Map | MapRevision,
+    user: User = None,
+    layers: List[Tuple[LayerConfiguration, str | None, DatasetRender | None]] = None,
+    serialize: bool = True,
+) -> List[Dict[str, Any] | None]:
+    """
+    Renders the topology of every layer that shows a dataset output and applies the
+    map's overrides to it. Returns the topologies (None for other layers), in layer
+    order; unless serialize is False, they are also stored as each layer's mapjson.
+    """
+    map_overrides = map_object.overrides
+    if layers is None:
+        layers = await _prepare_map_layers(map_object)
+
+    # render every distinct dataset output once; layers sharing one share its topology.
+    # Rendering runs on the threadpool, so the number of renders in flight is bounded to
+    # leave workers for other requests.
+    distinct = list({id(render): render for _, _, render in layers if render}.values())
+    semaphore = asyncio.Semaphore(OUTPUT_LAYER_CONCURRENCY)
+    rendered = dict(
+        zip(
+            [id(render) for render in distinct],
+            await asyncio.gather(*[_render_layer(render, semaphore) for render in distinct]),
+        )
+    )
 
-def _get_template(template_id: str, geographic=True) -> str:
+    # normalize json urls into the actual contents
+    topologies = []
+    for layer, dataset_id, render in layers:
+        if render is None:
+            logger.warn("Unknown mapjsonurl, skipping - value was %s" % layer.mapjsonUrl)
+            topologies.append(None)
+            continue
+        topology = rendered[id(render)].model_dump()
+
+        override = map_overrides.get(dataset_id)
+        if override:
+            _apply_layer_overrides(topology, override)
+
+        topologies.append(topology)
+        if serialize:
+            layer.mapjson = json.dumps(topology).decode()
+    return topologies
+
+
+async def _get_template(template_id: str, geographic=True) -> str:
     if not template_id:
         if geographic:
             return DEFAULT_NODE_TEMPLATES["GEOGRAPHIC"]
         else:
             return DEFAULT_NODE_TEMPLATES["LOGICAL"]
-    response = storage_backend.get_templates(template_id=template_id)
+    response = await storage_backend.get_templates(template_id=template_id)
     if len(response) < 1:
         raise HTTPException(
             status_code=404, detail="Requested template with %s not found" % template_id
@@ -326,26 +626,28 @@ def _get_template(template_id: str, geographic=True) -> str:
     return Template(**response[0]).template
 
 
-def _apply_layer_overrides(layer: LayerConfiguration, override: MapOverrides) -> None:
-    logger.debug("Evaluating overrides on layer %s" % layer.name)
-
-    topology = layer.mapjson
+def _apply_layer_overrides(topology: Dict[str, Any], override: MapOverrides) -> None:
+    logger.debug("Evaluating overrides on layer %s" % topology.get("name"))
 
     _do_override(override.nodes, topology.get("nodes", []))
     _do_override(override.edges, topology.get("edges", []))
 
-    layer.mapjson = topology
-
 
 def _do_override(overrides, json_data):
+    # where each name is first found in json_data. Every identifier is only looked up
+    # once, so an entry only has to stay right for names that are yet to be looked up:
+    # an element is only replaced or deleted by the override for its own name.
+    positions = {}
+    for i, d in enumerate(json_data):
+        positions.setdefault(d["name"], i)
+    deleted = False
+
     for identifier, override in overrides.items():
         if not override.render:
             continue
         # does the override for this identifier exist in this dataset?
         # if so, where?
-        existing_index = next(
-            (i for (i, d) in enumerate(json_data) if d["name"] == identifier), None
-        )
+        existing_index = positions.get(identifier)
 
         logger.debug(
             f"Doing override for {identifier=}, {override.operation=} and {existing_index=}"
@@ -368,15 +670,27 @@ def _do_override(overrides, json_data):
             OverrideType.override,
         ):
             logger.debug("Choosing to add because not found")
-            json_data.append(override.state)
+            # copied, as the svg renderer modifies nodes and edges in place
+            json_data.append(dict(override.state))
+            positions.setdefault(override.state.get("name"), len(json_data) - 1)
 
         if existing_index is not None and override.operation == OverrideType.override:
             logger.debug("Choosing to override existing found")
-            json_data[existing_index] = override.state
+            json_data[existing_index] = dict(override.state)
+            del positions[identifier]
+            name = override.state.get("name")
+            positions[name] = min(positions.get(name, existing_index), existing_index)
 
         if existing_index is not None and override.operation == OverrideType.delete:
             logger.debug("Choosing to delete existing found")
-            del json_data[existing_index]
+            # deleted elements are removed in one go at the end, so that positions
+            # don't shift
+            json_data[existing_index] = None
+            del positions[identifier]
+            deleted = True
+
+    if deleted:
+        json_data[:] = [d for d in json_data if d is not None]
 
 
 # Just a helper function to avoid repetition in cases where we're generating
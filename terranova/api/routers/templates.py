@@ -4,7 +4,7 @@ from fastapi_versioning import version
 from typing import List, Any
 
 from terranova.backends.auth import User, auth_check
-from terranova.backends.storage import backend as storage_backend
+from terranova.backends.storage import async_backend as storage_backend
 from terranova.models import (
     Template,
     TemplateFieldEnum,
@@ -18,10 +18,10 @@ router = APIRouter(tags=["Terranova Node Templates"])
 
 @router.get("/template/id/{templateId}/")
 @version(1)
-def template_by_id(
+async def template_by_id(
     templateId: str, user: User = Security(auth_check, scopes=[TOKEN_SCOPES["read"]])
 ) -> Template:
-    result = storage_backend.get_templates(template_id=templateId)
+    result = await storage_backend.get_templates(template_id=templateId)
     if len(result) < 1:
         raise HTTPException(status_code=404, detail="Template not found")
     return result[0]
@@ -38,7 +38,7 @@ default_fields = [
 
 @router.get("/templates/")
 @version(1)
-def templates(
+async def templates(
     fields: List[TemplateFieldEnum] = Query(default_fields),
     version: VersionEnum
     | str = Query(
@@ -55,7 +55,7 @@ def templates(
     if not type(version) == str:
         version = version.name
     # deal with parsing versions
-    result = storage_backend.get_templates(
+    result = await storage_backend.get_templates(
         fields=[f.name for f in fields], filters=filters, version=version
     )
     if len(result) < 1:
@@ -65,12 +65,12 @@ def templates(
 
 @router.put("/template/id/{templateId}/")
 @version(1)
-def update_template(
+async def update_template(
     templateId: str,
     new_template: NewTemplate,
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["write"]]),
 ) -> dict:
-    result = storage_backend.update_template(templateId, new_template, user)
+    result = await storage_backend.update_template(templateId, new_template, user)
     if not result:
         raise HTTPException(status_code=404, detail="Template not updated")
     return result
@@ -78,8 +78,8 @@ def update_template(
 
 @router.post("/template/")
 @version(1)
-def create_template(
+async def create_template(
     new_template: NewTemplate, user: User = Security(auth_check, scopes=[TOKEN_SCOPES["write"]])
 ):
-    result = storage_backend.create_template(new_template, user)
+    result = await storage_backend.create_template(new_template, user)
     return result
@@ -0,0 +1,305 @@
+"""
+Read-through cache for the storage backend.
+
+Map, dataset and template revisions change rarely but are read on every output request,
+so lookups by id, of the latest or of a specific version, are answered from a
+process-wide cache keyed by (entity, id, version).
+
+Entries are evicted least-recently-used once the cache is full, and expire after a TTL:
+another process (e.g. another uvicorn worker) may save a newer revision, which this one
+has no way of noticing, so the TTL bounds how long the previous one is served. Writes
+made through this process invalidate the affected ids immediately.
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Any
+
+from terranova.settings import STORAGE_CACHE_SIZE, STORAGE_CACHE_TTL
+from terranova.backends.auth import User
+from terranova.logging import logger
+from terranova.models import (
+    Dataset,
+    Map,
+    Template,
+    PublicMapFilters,
+    MapFilters,
+    DatasetFilters,
+    TemplateFilters,
+    MapRevision,
+    DatasetRevision,
+    NewTemplate,
+    TerranovaVersion,
+)
+
+
+class StorageCache:
+    """
+    A bounded LRU cache whose entries expire after `ttl` seconds, with hit/miss counters.
+
+    Values are stored pickled and unpickled on every hit, so each caller gets its own
+    copy and can't modify what the next caller sees.
+    """
+
+    def __init__(self, max_entries: int = STORAGE_CACHE_SIZE, ttl: float = STORAGE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key => (expires, pickled value)
+        self._lock = threading.Lock()
+        # bumped on every invalidation; a lookup that started before an invalidation
+        # must not store what it read, as that may be the old revision
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(entry[1])
+
+    def set(self, key, value, generation: int = None):
+        """
+        Stores value under key, unless the cache was invalidated since `generation`
+        (as returned by the `generation` attribute before the value was read).
+        """
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, entity: str, id: str = None):
+        """Drops every cached version of (entity, id), or of every id if id is None."""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for key in [k for k in self._entries if k[0] == entity and id in (None, k[1])]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _version_key(version) -> str:
+    # None and "latest" are the same lookup (TerranovaVersion's str() is the name of
+    # "latest" or "all", or the number)
+    return str(version) if version is not None else "latest"
+
+
+def _is_default(entity: str, filters) -> bool:
+    # only plain lookups by id are cached; anything narrowed by filters goes to storage
+    return all(
+        value in (None, [], ()) or (entity == "public_map" and key == "public" and value)
+        for key, value in filters.items()
+    )
+
+
+class CachedStorageBackend:
+    """
+    Asynchronous storage backend that answers lookups of a map, dataset or template by
+    id (and version) from a StorageCache, and invalidates the cache when revisions are
+    written. Everything else is passed through to the wrapped async backend.
+    """
+
+    def __init__(self, backend, cache: StorageCache = None):
+        self.backend = backend
+        self.cache = cache if cache is not None else StorageCache()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    async def _cached(self, entity, method, id, fields, filters, version):
+        if id is None or fields is not None or not _is_default(entity, filters):
+            return await method(id, fields, filters, version)
+        key = (entity, id, _version_key(version))
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        generation = self.cache.generation
+        result = await method(id, fields, filters, version)
+        # an empty result isn't cached, so a revision created elsewhere shows up at once
+        if result:
+            self.cache.set(key, result, generation)
+        else:
+            logger.debug("Not caching empty result for %s" % (key,))
+        return result
+
+    def _invalidate(self, entity: str, id: str = None):
+        self.cache.invalidate(entity, id)
+        if entity == "map":
+            self.cache.invalidate("public_map", id)
+
+    # General database functions: these can touch any document, so they invalidate
+    # every cached revision of the table they write to
+    async def create(self, table: str, id: str, doc: dict):
+        try:
+            return await self.backend.create(table, id, doc)
+        finally:
+            self._invalidate(table)
+
+    async def update(self, table: str, id: str, doc: dict):
+        try:
+            return await self.backend.update(table, id, doc)
+        finally:
+            self._invalidate(table)
+
+    async def bulk_create(self, table: str, docs):
+        try:
+            return await self.backend.bulk_create(table, docs)
+        finally:
+            self._invalidate(table)
+
+    async def bulk_update(self, table: str, docs):
+        try:
+            return await self.backend.bulk_update(table, docs)
+        finally:
+            self._invalidate(table)
+
+    async def delete_by_query(self, table: str, query: dict, max_docs=1):
+        try:
+            return await self.backend.delete_by_query(table, query, max_docs)
+        finally:
+            self._invalidate(table)
+
+    # Maps
+    async def get_maps(
+        self,
+        map_id: str = None,
+        fields: List[str] = None,
+        filters: MapFilters = MapFilters(),
+        version: TerranovaVersion = None,
+    ):
+        return await self._cached("map", self.backend.get_maps, map_id, fields, filters, version)
+
+    async def get_public_maps(
+        self,
+        map_id: str = None,
+        fields: List[str] = None,
+        filters: MapFilters = PublicMapFilters(),
+        version: TerranovaVersion = None,
+    ):
+        return await self._cached(
+            "public_map", self.backend.get_public_maps, map_id, fields, filters, version
+        )
+
+    async def create_map(self, map_revision: MapRevision, user: User):
+        result = await self.backend.create_map(map_revision, user)
+        self._invalidate("map", result["object"]["mapId"])
+        return result
+
+    async def update_map(self, map_id: str, map_revision: MapRevision, user: User):
+        try:
+            return await self.backend.update_map(map_id, map_revision, user)
+        finally:
+            self._invalidate("map", map_id)
+
+    async def publish_map(self, map_id: str, user: User):
+        try:
+            return await self.backend.publish_map(map_id, user)
+        finally:
+            self._invalidate("map", map_id)
+
+    # Datasets
+    async def get_datasets(
+        self,
+        dataset_id: str = None,
+        fields: List[str] = None,
+        filters: DatasetFilters = DatasetFilters(),
+        version: TerranovaVersion = None,
+    ) -> List[Dataset]:
+        return await self._cached(
+            "dataset", self.backend.get_datasets, dataset_id, fields, filters, version
+        )
+
+    async def update_dataset(
+        self,
+        dataset_id: str,
+        new_dataset: DatasetRevision,
+        query_results: List[Any],
+        user: User,
+    ):
+        try:
+            return await self.backend.update_dataset(dataset_id, new_dataset, query_results, user)
+        finally:
+            self._invalidate("dataset", dataset_id)
+
+    async def create_dataset(self, new_dataset: DatasetRevision, user: User):
+        result = await self.backend.create_dataset(new_dataset, user)
+        self._invalidate("dataset", result["object"]["datasetId"])
+        return result
+
+    # Templates
+    async def get_templates(
+        self,
+        template_id: str = None,
+        fields: List[str] = None,
+        filters: TemplateFilters = TemplateFilters(),
+        version: str = None,
+    ) -> List[Template]:
+        return await self._cached(
+            "template", self.backend.get_templates, template_id, fields, filters, version
+        )
+
+    async def create_template(self, new_template: NewTemplate, user: User):
+        result = await self.backend.create_template(new_template, user)
+        self._invalidate("template", result["object"]["templateId"])
+        return result
+
+    async def update_template(self, template_id, new_template: NewTemplate, user: User):
+        try:
+            return await self.backend.update_template(template_id, new_template, user)
+        finally:
+            self._invalidate("template", template_id)
+
+    # Bulk import
+    async def import_maps(self, maps: List[Map]):
+        try:
+            return await self.backend.import_maps(maps)
+        finally:
+            self._invalidate("map")
+
+    async def import_datasets(self, datasets: List[Dataset]):
+        try:
+            return await self.backend.import_datasets(datasets)
+        finally:
+            self._invalidate("dataset")
+
+    async def import_templates(self, templates: List[Template]):
+        try:
+            return await self.backend.import_templates(templates)
+        finally:
+            self._invalidate("template")
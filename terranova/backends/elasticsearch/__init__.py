@@ -1,8 +1,39 @@
 import elasticsearch
-import secrets
-import string
-from terranova.settings import ELASTIC_URL, ELASTIC_USER, ELASTIC_PASS, ELASTIC_INDICES
+from elasticsearch import helpers
+import threading
+from terranova.settings import (
+    ELASTIC_URL,
+    ELASTIC_USER,
+    ELASTIC_PASS,
+    ELASTIC_INDICES,
+    ELASTIC_CONNECTIONS_PER_NODE,
+    ELASTIC_REQUEST_TIMEOUT,
+    ELASTIC_MAX_RETRIES,
+    ELASTIC_RETRY_ON_TIMEOUT,
+    ELASTIC_KEEP_ALIVE,
+    ELASTIC_REFRESH,
+)
 from .constants import CREATE_STATEMENTS, INITIAL_TEMPLATES
+from .documents import (
+    create_actions,
+    first_dataset,
+    first_map,
+    first_template,
+    generate_id,
+    import_documents,
+    index_actions,
+    next_dataset,
+    next_map,
+    next_template,
+    published_map,
+    raise_bulk_error,
+    revision_refresh,
+    revision_search,
+    search_hits,
+    update_actions,
+    userdata_document,
+    userdata_search,
+)
 from terranova.backends.auth import User
 from terranova.models import (
     Dataset,
@@ -23,7 +54,7 @@ from terranova.models import (
     TerranovaVersion,
 )
 from datetime import datetime
-from typing import List, Any
+from typing import List, Any, Dict
 
 
 class ElasticSearchBackend:
@@ -38,38 +69,81 @@ class ElasticSearchBackend:
         user=ELASTIC_USER,
         password=ELASTIC_PASS,
         verify_certs=False,
+        refresh=ELASTIC_REFRESH,
     ):
         self.url = url
         self.user = user
         self.password = password
         self.verify_certs = verify_certs
+        self.refresh = refresh
+        self._es = None
+        self._es_lock = threading.Lock()
 
     @property
     def es(self):
+        # The client owns a connection pool, so it is created once (on first use, so
+        # that forked workers each get their own) and shared by every request.
+        # Elasticsearch clients are thread-safe.
+        if self._es is None:
+            with self._es_lock:
+                if self._es is None:
+                    self._es = self._create_client()
+        return self._es
+
+    def _create_client(self):
+        options = {}
+        if not ELASTIC_KEEP_ALIVE:
+            # ask the server to close each connection after the response
+            options["headers"] = {"connection": "close"}
         return elasticsearch.Elasticsearch(
             self.url,
             basic_auth=(self.user, self.password),
             verify_certs=self.verify_certs,
             ssl_show_warn=False,
-            request_timeout=5,
+            request_timeout=ELASTIC_REQUEST_TIMEOUT,
+            connections_per_node=ELASTIC_CONNECTIONS_PER_NODE,
+            max_retries=ELASTIC_MAX_RETRIES,
+            retry_on_timeout=ELASTIC_RETRY_ON_TIMEOUT,
+            **options,
         )
 
     # General ES functions
     def create(self, index: str, id: str, doc: dict):
         # verify doc here? or is that higher level
-        # refresh=True is *important* below -- guarantees that the document
-        # is readable after being written -- this is not available on `index()`
-        res = self.es.create(index=index, id=id, document=doc, refresh=True)
+        # the next revision of a map, dataset or template is numbered from a search for
+        # the latest one, so single writes are always searchable once this returns (see
+        # revision_refresh). self.refresh only applies to the bulk writes.
+        res = self.es.create(
+            index=index, id=id, document=doc, refresh=revision_refresh(self.refresh)
+        )
         if res["result"] not in ["created", "updated"]:
             raise Exception("Unable to index document in Elasticsearch: %s" % res)
         return res
 
     def update(self, index: str, id: str, doc: dict):
         try:
-            return self.es.update(index=index, id=id, body={"doc": doc}, refresh=True)
+            return self.es.update(
+                index=index, id=id, body={"doc": doc}, refresh=revision_refresh(self.refresh)
+            )
         except elasticsearch.NotFoundError:
             raise TerranovaNotFoundException("Document with id : %s not found" % id)
 
+    def bulk_create(self, index: str, docs: Dict[str, dict]):
+        # one _bulk request per chunk of documents (500 by default) instead of one
+        # request, and one refresh, per document
+        try:
+            created, _ = helpers.bulk(self.es, create_actions(index, docs), refresh=self.refresh)
+        except helpers.BulkIndexError as e:
+            raise Exception("Unable to index documents in Elasticsearch: %s" % e.errors)
+        return {"result": "created", "count": created}
+
+    def bulk_update(self, index: str, docs: Dict[str, dict]):
+        try:
+            updated, _ = helpers.bulk(self.es, update_actions(index, docs), refresh=self.refresh)
+        except helpers.BulkIndexError as e:
+            raise_bulk_error(e)
+        return {"result": "updated", "count": updated}
+
     def query(
         self,
         index: str,
@@ -82,35 +156,22 @@ class ElasticSearchBackend:
         query_result = self.es.search(
             index=index, query=query, collapse=collapse, sort=sort, size=limit, source=fields
         )
-        result = []
-        for res in query_result["hits"]["hits"]:
-            result.append(res["_source"])
-
-        return result
+        return search_hits(query_result)
 
     def delete_by_query(self, index, query, max_docs=1):
         query_result = self.es.delete_by_query(index=index, query=query, max_docs=1)
         return query_result
 
     def generate_id(self):
-        # Create 7 character alphanumeric string
-        alphabet = string.ascii_letters + string.digits
-        id = "".join(secrets.choice(alphabet) for i in range(7))
-        return id
+        return generate_id()
 
     # User Data
 
     def get_userdata(self, user: User):
-        filter = {"term": {"username": user.username}}
-        query = {"bool": {"filter": filter}}
-        return self.query(ELASTIC_INDICES["userdata"]["read"], query)
+        return self.query(ELASTIC_INDICES["userdata"]["read"], userdata_search(user))
 
     def create_userdata(self, userdata: UserDataRevision, user: User):
-        to_create = {
-            "username": user.username,
-            "favorites": userdata.favorites,
-            "lastEdited": userdata.lastEdited,
-        }
+        to_create = userdata_document(userdata, user)
         response = self.create(
             ELASTIC_INDICES["userdata"]["write"],
             id=user.username,
@@ -126,11 +187,7 @@ class ElasticSearchBackend:
         if len(existing_user) == 0:
             raise TerranovaNotFoundException("Cannot find user data for %s" % user.username)
 
-        to_update = {
-            "username": user.username,
-            "favorites": userdata.favorites,
-            "lastEdited": userdata.lastEdited,
-        }
+        to_update = userdata_document(userdata, user)
         response = self.update(
             ELASTIC_INDICES["userdata"]["write"],
             id=user.username,
@@ -148,30 +205,7 @@ class ElasticSearchBackend:
         version: TerranovaVersion = None,
     ):
         # Based on the map_id, this returns the latest version of each document
-        filter_spec = []
-        if map_id is not None:
-            filter = {"term": {"mapId": map_id}}
-            filter_spec.append(filter)
-
-        for term, value in filters.items():
-            if type(value) == bool:
-                filter_spec.append({"term": {term: value}})
-                continue
-            if value is not None and len(value) >= 1:
-                filter_spec.append({"terms": {term: value}})
-
-        # default for 'latest'
-        collapse = {"field": "mapId"}
-        if version:
-            version_val = str(version)
-            if version_val == "all":
-                collapse = None
-            elif version_val.isnumeric():
-                filter_spec.append({"term": {"version": version_val}})
-
-        query = {"bool": {"filter": filter_spec}}
-        sort = [{"version": {"order": "desc"}}]
-
+        query, collapse, sort = revision_search("mapId", map_id, filters, version)
         return self.query(ELASTIC_INDICES["map"]["read"], query, collapse, sort, fields)
 
     # Public Maps
@@ -186,16 +220,7 @@ class ElasticSearchBackend:
 
     def create_map(self, map_revision: MapRevision, user: User):
         map_id = self.generate_id()
-        to_create = {
-            "mapId": map_id,
-            "name": map_revision.name,
-            "version": 1,
-            "configuration": map_revision.configuration,
-            "overrides": map_revision.overrides,
-            "lastUpdatedBy": user.username,
-            "lastUpdatedOn": datetime.now().isoformat(),
-            "public": False,
-        }
+        to_create = first_map(map_id, map_revision, user)
         response = self.create(
             ELASTIC_INDICES["map"]["write"], id=map_id, doc=Map(**to_create).model_dump()
         )
@@ -208,18 +233,7 @@ class ElasticSearchBackend:
         if len(latest_map) == 0:
             raise TerranovaNotFoundException("No map with id %s found" % map_id)
 
-        latest_map = latest_map[0]
-
-        new_map = {
-            "mapId": map_id,
-            "name": map_revision.name,
-            "version": latest_map["version"] + 1,
-            "configuration": map_revision.configuration,
-            "lastUpdatedBy": user.username,
-            "lastUpdatedOn": datetime.now().isoformat(),
-            "overrides": map_revision.overrides,
-            "public": latest_map.get("public", False),
-        }
+        new_map = next_map(latest_map[0], map_revision, user)
         response = self.create(
             ELASTIC_INDICES["map"]["write"], id=self.generate_id(), doc=Map(**new_map).model_dump()
         )
@@ -233,12 +247,7 @@ class ElasticSearchBackend:
         if len(latest_map) == 0:
             raise TerranovaNotFoundException("No map with id %s found" % map_id)
 
-        latest_map = latest_map[0]
-
-        new_map = latest_map.copy()
-        new_map["public"] = True
-        new_map["version"] = new_map["version"] + 1
-
+        new_map = published_map(latest_map[0])
         response = self.create(
             ELASTIC_INDICES["map"]["write"], id=self.generate_id(), doc=Map(**new_map).model_dump()
         )
@@ -254,27 +263,7 @@ class ElasticSearchBackend:
         version: TerranovaVersion = None,
     ) -> List[Dataset]:
         # Based on the dataset_id, this returns the latest version of each document
-        filter_spec = []
-        if dataset_id is not None:
-            filter = {"term": {"datasetId": dataset_id}}
-            filter_spec.append(filter)
-
-        for term, value in filters.items():
-            if value is not None and len(value) >= 1:
-                filter_spec.append({"terms": {term: value}})
-
-        # default for 'latest'
-        collapse = {"field": "datasetId"}
-        if version:
-            version_val = str(version)
-            if version_val == "all":
-                collapse = None
-            elif version_val.isnumeric():
-                filter_spec.append({"term": {"version": version_val}})
-
-        query = {"bool": {"filter": filter_spec}}
-        sort = [{"version": {"order": "desc"}}]
-
+        query, collapse, sort = revision_search("datasetId", dataset_id, filters, version)
         return self.query(ELASTIC_INDICES["dataset"]["read"], query, collapse, sort, fields)
 
     def update_dataset(
@@ -290,17 +279,7 @@ class ElasticSearchBackend:
         if len(latest_dataset) == 0:
             raise TerranovaNotFoundException("No dataset with id %s found" % dataset_id)
 
-        latest_dataset = latest_dataset[0]
-
-        new_dataset = {
-            "datasetId": dataset_id,
-            "name": new_dataset.name,
-            "version": latest_dataset["version"] + 1,
-            "query": new_dataset.query,
-            "results": query_results,
-            "lastUpdatedBy": user.username,
-            "lastUpdatedOn": datetime.now().isoformat(),
-        }
+        new_dataset = next_dataset(latest_dataset[0], new_dataset, query_results, user)
         response = self.create(
             ELASTIC_INDICES["dataset"]["write"],
             id=self.generate_id(),
@@ -311,15 +290,7 @@ class ElasticSearchBackend:
 
     def create_dataset(self, new_dataset: DatasetRevision, user: User):
         dataset_id = self.generate_id()
-        dataset = {
-            "datasetId": dataset_id,
-            "name": new_dataset.name,
-            "version": 1,
-            "query": new_dataset.query,
-            "lastUpdatedBy": user.username,
-            "lastUpdatedOn": datetime.now().isoformat(),
-            "results": None,
-        }
+        dataset = first_dataset(dataset_id, new_dataset, user)
         response = self.create(
             ELASTIC_INDICES["dataset"]["write"], id=dataset_id, doc=Dataset(**dataset).model_dump()
         )
@@ -335,55 +306,24 @@ class ElasticSearchBackend:
         filters: TemplateFilters = TemplateFilters(),
         version: str = None,
     ) -> List[Template]:
-
         # Based on the template_id, this returns the latest version of each document
-        filter_spec = []
-        if template_id is not None:
-            filter = {"term": {"templateId": template_id}}
-            filter_spec.append(filter)
-
-        for term, value in filters.items():
-            if value is not None and len(value) >= 1:
-                filter_spec.append({"terms": {term: value}})
-
-        # the default, version == "latest"
-        collapse = {"field": "templateId"}
-        if version == "all":
-            collapse = None
-        if version is not None and version.isnumeric():
-            filter_spec.append({"term": {"version": version}})
-
-        query = {"bool": {"filter": filter_spec}}
-        sort = [{"version": {"order": "desc"}}]
-
+        query, collapse, sort = revision_search("templateId", template_id, filters, version)
         return self.query(ELASTIC_INDICES["template"]["read"], query, collapse, sort, fields)
 
     def create_template(self, new_template: NewTemplate, user: User):
         template_id = self.generate_id()
-        template = {
-            "templateId": template_id,
-            "name": new_template.name,
-            "version": 1,
-            "template": new_template.template,
-            "lastUpdatedBy": user.username,
-            "lastUpdatedOn": datetime.now().isoformat(),
-        }
+        template = first_template(template_id, new_template, user)
         response = self.create(
-            ELASTIC_INDICES["template"]["write"], id=template_id, doc=Template(**template).model_dump()
+            ELASTIC_INDICES["template"]["write"],
+            id=template_id,
+            doc=Template(**template).model_dump(),
         )
         output = {"result": response.get("result"), "object": template}
         return output
 
     def update_template(self, template_id, new_template: NewTemplate, user: User):
         current_template = self.get_templates(template_id=template_id)[0]
-        new_template = {
-            "templateId": current_template["templateId"],
-            "name": new_template.name,
-            "version": current_template["version"] + 1,
-            "template": new_template.template,
-            "lastUpdatedBy": user.username,
-            "lastUpdatedOn": datetime.now().isoformat(),
-        }
+        new_template = next_template(current_template, new_template, user)
         response = self.create(
             ELASTIC_INDICES["template"]["write"],
             id=self.generate_id(),
@@ -410,21 +350,43 @@ class ElasticSearchBackend:
                 self.es.indices.put_index_template(**create_parameters)
                 self.es.indices.create(index=index)
 
-    def initialize_templates(self):
-        if not self.get_templates():
-            for name, template in INITIAL_TEMPLATES.items():
+    # Bulk import
+    # revisions are written as given: ids, versions and authorship are preserved
 
-                class Dummy(object):
-                    pass
+    def _import(self, index: str, docs: Dict[str, dict]):
+        try:
+            created, _ = helpers.bulk(self.es, index_actions(index, docs), refresh=self.refresh)
+        except helpers.BulkIndexError as e:
+            raise Exception("Unable to index documents in Elasticsearch: %s" % e.errors)
+        return {"result": "created", "count": created}
 
-                new_template = Dummy()
-                new_template.name = name
-                new_template.template = template
+    def import_maps(self, maps: List[Map]):
+        return self._import(ELASTIC_INDICES["map"]["write"], import_documents("mapId", maps))
 
-                user = Dummy()
-                user.username = "admin"
+    def import_datasets(self, datasets: List[Dataset]):
+        return self._import(
+            ELASTIC_INDICES["dataset"]["write"], import_documents("datasetId", datasets)
+        )
 
-                self.create_template(new_template, user)
+    def import_templates(self, templates: List[Template]):
+        return self._import(
+            ELASTIC_INDICES["template"]["write"], import_documents("templateId", templates)
+        )
+
+    def initialize_templates(self):
+        if not self.get_templates():
+            templates = [
+                Template(
+                    templateId=self.generate_id(),
+                    name=name,
+                    version=1,
+                    template=template,
+                    lastUpdatedBy="admin",
+                    lastUpdatedOn=datetime.now().isoformat(),
+                )
+                for name, template in INITIAL_TEMPLATES.items()
+            ]
+            self.import_templates(templates)
 
 
 # Default singleton instance (used when storage.backend = "elasticsearch")
@@ -0,0 +1,362 @@
+import elasticsearch
+from elasticsearch import helpers
+from terranova.settings import (
+    ELASTIC_URL,
+    ELASTIC_USER,
+    ELASTIC_PASS,
+    ELASTIC_INDICES,
+    ELASTIC_CONNECTIONS_PER_NODE,
+    ELASTIC_REQUEST_TIMEOUT,
+    ELASTIC_MAX_RETRIES,
+    ELASTIC_RETRY_ON_TIMEOUT,
+    ELASTIC_KEEP_ALIVE,
+    ELASTIC_REFRESH,
+)
+from terranova.backends.auth import User
+from terranova.models import (
+    Dataset,
+    Map,
+    Template,
+    PublicMapFilters,
+    MapFilters,
+    DatasetFilters,
+    TemplateFilters,
+    MapRevision,
+    DatasetRevision,
+    NewTemplate,
+    TerranovaNotFoundException,
+    UserData,
+    UserDataRevision,
+    TerranovaVersion,
+)
+from typing import List, Any, Dict
+from .documents import (
+    create_actions,
+    first_dataset,
+    first_map,
+    first_template,
+    generate_id,
+    import_documents,
+    index_actions,
+    next_dataset,
+    next_map,
+    next_template,
+    published_map,
+    raise_bulk_error,
+    revision_refresh,
+    revision_search,
+    search_hits,
+    update_actions,
+    userdata_document,
+    userdata_search,
+)
+
+
+class AsyncElasticSearchBackend:
+    """
+    The asynchronous counterpart of ElasticSearchBackend, built on AsyncElasticsearch.
+    It takes the same settings and builds the same requests and documents (see
+    .documents); only the transport (aiohttp) and the coroutine methods differ. Index
+    creation and template seeding happen at startup through the synchronous backend,
+    so they are not repeated here.
+    """
+
+    def __init__(
+        self,
+        url=ELASTIC_URL,
+        user=ELASTIC_USER,
+        password=ELASTIC_PASS,
+        verify_certs=False,
+        refresh=ELASTIC_REFRESH,
+    ):
+        self.url = url
+        self.user = user
+        self.password = password
+        self.verify_certs = verify_certs
+        self.refresh = refresh
+        self._es = None
+
+    @property
+    def es(self):
+        # The client is created on first use, from the event loop that serves requests,
+        # as its aiohttp session is bound to that loop. No lock is needed: there's no
+        # await between checking for the client and assigning it.
+        if self._es is None:
+            self._es = self._create_client()
+        return self._es
+
+    def _create_client(self):
+        options = {}
+        if not ELASTIC_KEEP_ALIVE:
+            options["headers"] = {"connection": "close"}
+        return elasticsearch.AsyncElasticsearch(
+            self.url,
+            basic_auth=(self.user, self.password),
+            verify_certs=self.verify_certs,
+            ssl_show_warn=False,
+            request_timeout=ELASTIC_REQUEST_TIMEOUT,
+            connections_per_node=ELASTIC_CONNECTIONS_PER_NODE,
+            max_retries=ELASTIC_MAX_RETRIES,
+            retry_on_timeout=ELASTIC_RETRY_ON_TIMEOUT,
+            **options,
+        )
+
+    async def close(self):
+        if self._es is not None:
+            await self._es.close()
+            self._es = None
+
+    # General ES functions
+    async def create(self, index: str, id: str, doc: dict):
+        # see ElasticSearchBackend.create for the refresh mode of single writes
+        res = await self.es.create(
+            index=index, id=id, document=doc, refresh=revision_refresh(self.refresh)
+        )
+        if res["result"] not in ["created", "updated"]:
+            raise Exception("Unable to index document in Elasticsearch: %s" % res)
+        return res
+
+    async def update(self, index: str, id: str, doc: dict):
+        try:
+            return await self.es.update(
+                index=index, id=id, body={"doc": doc}, refresh=revision_refresh(self.refresh)
+            )
+        except elasticsearch.NotFoundError:
+            raise TerranovaNotFoundException("Document with id : %s not found" % id)
+
+    async def bulk_create(self, index: str, docs: Dict[str, dict]):
+        try:
+            created, _ = await helpers.async_bulk(
+                self.es, create_actions(index, docs), refresh=self.refresh
+            )
+        except helpers.BulkIndexError as e:
+            raise Exception("Unable to index documents in Elasticsearch: %s" % e.errors)
+        return {"result": "created", "count": created}
+
+    async def bulk_update(self, index: str, docs: Dict[str, dict]):
+        try:
+            updated, _ = await helpers.async_bulk(
+                self.es, update_actions(index, docs), refresh=self.refresh
+            )
+        except helpers.BulkIndexError as e:
+            raise_bulk_error(e)
+        return {"result": "updated", "count": updated}
+
+    async def query(
+        self,
+        index: str,
+        query: dict,
+        collapse: dict = None,
+        sort: List[dict] = None,
+        fields: List[str] = None,
+        limit: int = 10000,
+    ):
+        query_result = await self.es.search(
+            index=index, query=query, collapse=collapse, sort=sort, size=limit, source=fields
+        )
+        return search_hits(query_result)
+
+    async def delete_by_query(self, index, query, max_docs=1):
+        query_result = await self.es.delete_by_query(index=index, query=query, max_docs=1)
+        return query_result
+
+    def generate_id(self):
+        return generate_id()
+
+    # User Data
+
+    async def get_userdata(self, user: User):
+        return await self.query(ELASTIC_INDICES["userdata"]["read"], userdata_search(user))
+
+    async def create_userdata(self, userdata: UserDataRevision, user: User):
+        to_create = userdata_document(userdata, user)
+        response = await self.create(
+            ELASTIC_INDICES["userdata"]["write"],
+            id=user.username,
+            doc=UserData(**to_create).model_dump(),
+        )
+        output = {"result": response.get("result"), "object": to_create}
+        return output
+
+    async def update_userdata(self, userdata: UserDataRevision, user: User):
+        # can't update userdata for a user that doesn't exist
+        existing_user = await self.get_userdata(user)
+
+        if len(existing_user) == 0:
+            raise TerranovaNotFoundException("Cannot find user data for %s" % user.username)
+
+        to_update = userdata_document(userdata, user)
+        response = await self.update(
+            ELASTIC_INDICES["userdata"]["write"],
+            id=user.username,
+            doc=UserData(**to_update).model_dump(),
+        )
+        output = {"result": response.get("result"), "object": to_update}
+        return output
+
+    # Maps
+    async def get_maps(
+        self,
+        map_id: str = None,
+        fields: List[str] = None,
+        filters: MapFilters = MapFilters(),
+        version: TerranovaVersion = None,
+    ):
+        # Based on the map_id, this returns the latest version of each document
+        query, collapse, sort = revision_search("mapId", map_id, filters, version)
+        return await self.query(ELASTIC_INDICES["map"]["read"], query, collapse, sort, fields)
+
+    # Public Maps
+    async def get_public_maps(
+        self,
+        map_id: str = None,
+        fields: List[str] = None,
+        filters: MapFilters = PublicMapFilters(),
+        version: TerranovaVersion = None,
+    ):
+        return await self.get_maps(map_id, fields, filters, version)
+
+    async def create_map(self, map_revision: MapRevision, user: User):
+        map_id = self.generate_id()
+        to_create = first_map(map_id, map_revision, user)
+        response = await self.create(
+            ELASTIC_INDICES["map"]["write"], id=map_id, doc=Map(**to_create).model_dump()
+        )
+        return {"result": response.get("result"), "object": to_create}
+
+    async def update_map(self, map_id: str, map_revision: MapRevision, user: User):
+        latest_map = await self.get_maps(map_id=map_id)
+
+        # can't update a map that doesn't exist
+        if len(latest_map) == 0:
+            raise TerranovaNotFoundException("No map with id %s found" % map_id)
+
+        new_map = next_map(latest_map[0], map_revision, user)
+        response = await self.create(
+            ELASTIC_INDICES["map"]["write"], id=self.generate_id(), doc=Map(**new_map).model_dump()
+        )
+        output = {"result": response.get("result"), "object": new_map}
+        return output
+
+    async def publish_map(self, map_id: str, user: User):
+        latest_map = await self.get_maps(map_id=map_id)
+
+        # can't update a map that doesn't exist
+        if len(latest_map) == 0:
+            raise TerranovaNotFoundException("No map with id %s found" % map_id)
+
+        new_map = published_map(latest_map[0])
+        response = await self.create(
+            ELASTIC_INDICES["map"]["write"], id=self.generate_id(), doc=Map(**new_map).model_dump()
+        )
+        return {"result": response.get("result"), "object": new_map}
+
+    # Datasets
+
+    async def get_datasets(
+        self,
+        dataset_id: str = None,
+        fields: List[str] = None,
+        filters: DatasetFilters = DatasetFilters(),
+        version: TerranovaVersion = None,
+    ) -> List[Dataset]:
+        # Based on the dataset_id, this returns the latest version of each document
+        query, collapse, sort = revision_search("datasetId", dataset_id, filters, version)
+        return await self.query(ELASTIC_INDICES["dataset"]["read"], query, collapse, sort, fields)
+
+    async def update_dataset(
+        self,
+        dataset_id: str,
+        new_dataset: DatasetRevision,
+        query_results: List[Any],
+        user: User,
+    ):
+        latest_dataset = await self.get_datasets(dataset_id=dataset_id)
+
+        # can't update a dataset that doesn't exist
+        if len(latest_dataset) == 0:
+            raise TerranovaNotFoundException("No dataset with id %s found" % dataset_id)
+
+        new_dataset = next_dataset(latest_dataset[0], new_dataset, query_results, user)
+        response = await self.create(
+            ELASTIC_INDICES["dataset"]["write"],
+            id=self.generate_id(),
+            doc=Dataset(**new_dataset).model_dump(),
+        )
+        output = {"result": response.get("result"), "object": new_dataset}
+        return output
+
+    async def create_dataset(self, new_dataset: DatasetRevision, user: User):
+        dataset_id = self.generate_id()
+        dataset = first_dataset(dataset_id, new_dataset, user)
+        response = await self.create(
+            ELASTIC_INDICES["dataset"]["write"], id=dataset_id, doc=Dataset(**dataset).model_dump()
+        )
+        output = {"result": response.get("result"), "object": dataset}
+        return output
+
+    # Templates
+
+    async def get_templates(
+        self,
+        template_id: str = None,
+        fields: List[str] = None,
+        filters: TemplateFilters = TemplateFilters(),
+        version: str = None,
+    ) -> List[Template]:
+        # Based on the template_id, this returns the latest version of each document
+        query, collapse, sort = revision_search("templateId", template_id, filters, version)
+        return await self.query(ELASTIC_INDICES["template"]["read"], query, collapse, sort, fields)
+
+    async def create_template(self, new_template: NewTemplate, user: User):
+        template_id = self.generate_id()
+        template = first_template(template_id, new_template, user)
+        response = await self.create(
+            ELASTIC_INDICES["template"]["write"],
+            id=template_id,
+            doc=Template(**template).model_dump(),
+        )
+        output = {"result": response.get("result"), "object": template}
+        return output
+
+    async def update_template(self, template_id, new_template: NewTemplate, user: User):
+        current_template = (await self.get_templates(template_id=template_id))[0]
+        new_template = next_template(current_template, new_template, user)
+        response = await self.create(
+            ELASTIC_INDICES["template"]["write"],
+            id=self.generate_id(),
+            doc=Template(**new_template).model_dump(),
+        )
+        output = {"result": response.get("result"), "object": new_template}
+        return output
+
+    async def is_connected(self):
+        return await self.es.ping()
+
+    async def connection_info(self):
+        return await self.es.info()
+
+    # Bulk import
+    # revisions are written as given: ids, versions and authorship are preserved
+
+    async def _import(self, index: str, docs: Dict[str, dict]):
+        try:
+            created, _ = await helpers.async_bulk(
+                self.es, index_actions(index, docs), refresh=self.refresh
+            )
+        except helpers.BulkIndexError as e:
+            raise Exception("Unable to index documents in Elasticsearch: %s" % e.errors)
+        return {"result": "created", "count": created}
+
+    async def import_maps(self, maps: List[Map]):
+        return await self._import(ELASTIC_INDICES["map"]["write"], import_documents("mapId", maps))
+
+    async def import_datasets(self, datasets: List[Dataset]):
+        return await self._import(
+            ELASTIC_INDICES["dataset"]["write"], import_documents("datasetId", datasets)
+        )
+
+    async def import_templates(self, templates: List[Template]):
+        return await self._import(
+            ELASTIC_INDICES["template"]["write"], import_documents("templateId", templates)
+        )
@@ -0,0 +1,207 @@
+"""
+The requests and documents shared by ElasticSearchBackend and AsyncElasticSearchBackend:
+search bodies, new revisions, bulk actions and the conversion of results. The two
+backends only differ in how they send these to Elasticsearch.
+"""
+
+import secrets
+import string
+from datetime import datetime
+from typing import Any, Dict, List
+
+from elasticsearch import helpers
+
+from terranova.backends.auth import User
+from terranova.models import (
+    DatasetRevision,
+    MapRevision,
+    NewTemplate,
+    TerranovaNotFoundException,
+    UserDataRevision,
+)
+
+
+def generate_id():
+    # Create 7 character alphanumeric string
+    alphabet = string.ascii_letters + string.digits
+    return "".join(secrets.choice(alphabet) for i in range(7))
+
+
+def revision_refresh(refresh: str) -> str:
+    """
+    The refresh mode for single writes. update_map and friends search for the latest
+    revision to number the next one, so a write that isn't searchable yet would be
+    missed and its version number reused: "false" is raised to "wait_for".
+    """
+    return "true" if refresh == "true" else "wait_for"
+
+
+def search_hits(query_result: dict) -> List[dict]:
+    return [res["_source"] for res in query_result["hits"]["hits"]]
+
+
+def revision_search(key: str, entity_id: str = None, filters=None, version=None):
+    """
+    The (query, collapse, sort) of a search for revisions of maps, datasets or templates,
+    whose id is the `key` field. By default only the latest revision of each is returned.
+    """
+    filter_spec = []
+    if entity_id is not None:
+        filter_spec.append({"term": {key: entity_id}})
+
+    for term, value in filters.items() if filters is not None else ():
+        if isinstance(value, bool):
+            filter_spec.append({"term": {term: value}})
+            continue
+        if value is not None and len(value) >= 1:
+            filter_spec.append({"terms": {term: value}})
+
+    # default for 'latest'
+    collapse = {"field": key}
+    if version:
+        version_val = str(version)
+        if version_val == "all":
+            collapse = None
+        elif version_val.isnumeric():
+            filter_spec.append({"term": {"version": version_val}})
+
+    query = {"bool": {"filter": filter_spec}}
+    sort = [{"version": {"order": "desc"}}]
+    return query, collapse, sort
+
+
+def userdata_search(user: User) -> dict:
+    return {"bool": {"filter": {"term": {"username": user.username}}}}
+
+
+def userdata_document(userdata: UserDataRevision, user: User) -> dict:
+    return {
+        "username": user.username,
+        "favorites": userdata.favorites,
+        "lastEdited": userdata.lastEdited,
+    }
+
+
+def first_map(map_id: str, map_revision: MapRevision, user: User) -> dict:
+    return {
+        "mapId": map_id,
+        "name": map_revision.name,
+        "version": 1,
+        "configuration": map_revision.configuration,
+        "overrides": map_revision.overrides,
+        "lastUpdatedBy": user.username,
+        "lastUpdatedOn": datetime.now().isoformat(),
+        "public": False,
+    }
+
+
+def next_map(latest_map: dict, map_revision: MapRevision, user: User) -> dict:
+    return {
+        "mapId": latest_map["mapId"],
+        "name": map_revision.name,
+        "version": latest_map["version"] + 1,
+        "configuration": map_revision.configuration,
+        "lastUpdatedBy": user.username,
+        "lastUpdatedOn": datetime.now().isoformat(),
+        "overrides": map_revision.overrides,
+        "public": latest_map.get("public", False),
+    }
+
+
+def published_map(latest_map: dict) -> dict:
+    new_map = latest_map.copy()
+    new_map["public"] = True
+    new_map["version"] = new_map["version"] + 1
+    return new_map
+
+
+def first_dataset(dataset_id: str, new_dataset: DatasetRevision, user: User) -> dict:
+    return {
+        "datasetId": dataset_id,
+        "name": new_dataset.name,
+        "version": 1,
+        "query": new_dataset.query,
+        "lastUpdatedBy": user.username,
+        "lastUpdatedOn": datetime.now().isoformat(),
+        "results": None,
+    }
+
+
+def next_dataset(
+    latest_dataset: dict, new_dataset: DatasetRevision, query_results: List[Any], user: User
+) -> dict:
+    return {
+        "datasetId": latest_dataset["datasetId"],
+        "name": new_dataset.name,
+        "version": latest_dataset["version"] + 1,
+        "query": new_dataset.query,
+        "results": query_results,
+        "lastUpdatedBy": user.username,
+        "lastUpdatedOn": datetime.now().isoformat(),
+    }
+
+
+def first_template(template_id: str, new_template: NewTemplate, user: User) -> dict:
+    return {
+        "templateId": template_id,
+        "name": new_template.name,
+        "version": 1,
+        "template": new_template.template,
+        "lastUpdatedBy": user.username,
+        "lastUpdatedOn": datetime.now().isoformat(),
+    }
+
+
+def next_template(current_template: dict, new_template: NewTemplate, user: User) -> dict:
+    return {
+        "templateId": current_template["templateId"],
+        "name": new_template.name,
+        "version": current_template["version"] + 1,
+        "template": new_template.template,
+        "lastUpdatedBy": user.username,
+        "lastUpdatedOn": datetime.now().isoformat(),
+    }
+
+
+def import_documents(key: str, revisions) -> Dict[str, dict]:
+    """
+    The documents of imported revisions, written as given: ids, versions and authorship
+    are preserved. Each is stored under an id derived from its `key` field and version,
+    so importing a revision again replaces it instead of adding a copy.
+    """
+    docs = (revision.model_dump() for revision in revisions)
+    return {"%s-%s" % (doc[key], doc["version"]): doc for doc in docs}
+
+
+def create_actions(index: str, docs: Dict[str, dict]):
+    return (
+        {"_op_type": "create", "_index": index, "_id": id, "_source": doc}
+        for id, doc in docs.items()
+    )
+
+
+def index_actions(index: str, docs: Dict[str, dict]):
+    # creates each document, or replaces the one with the same id
+    return (
+        {"_op_type": "index", "_index": index, "_id": id, "_source": doc}
+        for id, doc in docs.items()
+    )
+
+
+def update_actions(index: str, docs: Dict[str, dict]):
+    return (
+        {"_op_type": "update", "_index": index, "_id": id, "doc": doc}
+        for id, doc in docs.items()
+    )
+
+
+def raise_bulk_error(error: helpers.BulkIndexError):
+    """
+    Translates a failed bulk update into the exception a single update would raise:
+    TerranovaNotFoundException if every failure is a missing document.
+    """
+    statuses = [list(item.values())[0].get("status") for item in error.errors]
+    if statuses and all(status == 404 for status in statuses):
+        ids = [list(item.values())[0].get("_id") for item in error.errors]
+        raise TerranovaNotFoundException("Documents with ids : %s not found" % ", ".join(ids))
+    raise Exception("Unable to update documents in Elasticsearch: %s" % error.errors)
@@ -3,8 +3,17 @@ import secrets
 import string
 import json
 from pathlib import Path
-from terranova.settings import config
-from .constants import INITIAL_TEMPLATES
+from terranova.settings import (
+    config,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE,
+    SQLITE_STATEMENT_CACHE_SIZE,
+)
+from .constants import INITIAL_TEMPLATES, TABLE_SCHEMAS
+from .query import compile_query, is_versioned, json_path, latest_table, quote_identifier
 from terranova.backends.auth import User
 from terranova.models import (
     Dataset,
@@ -33,10 +42,25 @@ class SQLiteBackend:
     This backend stores all data in a local SQLite database.
     """
 
-    def __init__(self, db_path: str = None):
+    def __init__(
+        self,
+        db_path: str = None,
+        journal_mode: str = SQLITE_JOURNAL_MODE,
+        synchronous: str = SQLITE_SYNCHRONOUS,
+        busy_timeout: int = SQLITE_BUSY_TIMEOUT,
+        mmap_size: int = SQLITE_MMAP_SIZE,
+        cache_size: int = SQLITE_CACHE_SIZE,
+        statement_cache_size: int = SQLITE_STATEMENT_CACHE_SIZE,
+    ):
         if db_path is None:
             db_path = config.get("sqlite", {}).get("path", ":memory:")
         self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.statement_cache_size = statement_cache_size
         self._local = threading.local()
         self.create_indices()
 
@@ -44,10 +68,27 @@ class SQLiteBackend:
     def conn(self):
         """Thread-local database connection"""
         if not hasattr(self._local, 'conn'):
-            self._local.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self._local.conn.row_factory = sqlite3.Row
+            self._local.conn = self._connect()
         return self._local.conn
 
+    def _connect(self):
+        """Opens a connection configured with this backend's connection profile"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            # sets SQLite's busy handler, ie. PRAGMA busy_timeout
+            timeout=self.busy_timeout / 1000,
+            # every query shape is compiled once per connection and then reused
+            cached_statements=self.statement_cache_size,
+        )
+        conn.row_factory = sqlite3.Row
+        # the journal mode is stored in the database file; the others are per connection
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        return conn
+
     # General database functions
     def create(self, table: str, id: str, doc: dict):
         """Create a document in the specified table"""
@@ -64,6 +105,7 @@ class SQLiteBackend:
             f"INSERT INTO {table} (id, document) VALUES (?, ?)",
             (id, doc_json)
         )
+        self._refresh_latest(cursor, table, doc)
         self.conn.commit()
 
         return {"result": "created", "id": id}
@@ -73,8 +115,9 @@ class SQLiteBackend:
         cursor = self.conn.cursor()
 
         # Check if document exists
-        cursor.execute(f"SELECT id FROM {table} WHERE id = ?", (id,))
-        if cursor.fetchone() is None:
+        cursor.execute(f"SELECT document FROM {table} WHERE id = ?", (id,))
+        existing = cursor.fetchone()
+        if existing is None:
             raise TerranovaNotFoundException(f"Document with id : {id} not found")
 
         # Update the document, handling datetime objects
@@ -83,10 +126,72 @@ class SQLiteBackend:
             f"UPDATE {table} SET document = ? WHERE id = ?",
             (doc_json, id)
         )
+        self._refresh_latest(cursor, table, json.loads(existing[0]))
+        self._refresh_latest(cursor, table, doc)
         self.conn.commit()
 
         return {"result": "updated"}
 
+    def bulk_create(self, table: str, docs: Dict[str, dict]):
+        """
+        Create many documents, keyed by id, in a single transaction. All of the inserts
+        go through one executemany, and the latest-revision table is refreshed once
+        per entity rather than once per document.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, document TEXT NOT NULL)"
+            )
+            cursor.executemany(
+                f"INSERT INTO {table} (id, document) VALUES (?, ?)",
+                ((id, json.dumps(doc, default=str)) for id, doc in docs.items()),
+            )
+            self._refresh_latest_many(cursor, table, docs.values())
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+        return {"result": "created", "count": len(docs)}
+
+    def bulk_update(self, table: str, docs: Dict[str, dict]):
+        """
+        Replace many documents, keyed by id, in a single transaction. Nothing is written
+        if any of the ids doesn't exist.
+        """
+        cursor = self.conn.cursor()
+        existing = {}
+        ids = list(docs)
+        # stay well below SQLite's limit on the number of bound parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(
+                f"SELECT id, document FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            existing.update((row[0], json.loads(row[1])) for row in cursor.fetchall())
+        missing = [id for id in ids if id not in existing]
+        if missing:
+            raise TerranovaNotFoundException(
+                "Documents with ids : %s not found" % ", ".join(missing)
+            )
+
+        try:
+            cursor.executemany(
+                f"UPDATE {table} SET document = ? WHERE id = ?",
+                ((json.dumps(doc, default=str), id) for id, doc in docs.items()),
+            )
+            self._refresh_latest_many(
+                cursor, table, list(existing.values()) + list(docs.values())
+            )
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+        return {"result": "updated", "count": len(docs)}
+
     def query(
         self,
         table: str,
@@ -96,73 +201,20 @@ class SQLiteBackend:
         fields: List[str] = None,
         limit: int = 10000,
     ):
-        """Query documents from the specified table"""
+        """
+        Query documents from the specified table. Filtering, collapsing, sorting,
+        field projection and the limit are all compiled into a single SQL statement.
+        """
         cursor = self.conn.cursor()
 
         cursor.execute(
             f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, document TEXT NOT NULL)"
         )
 
-        # Fetch all documents from the table
-        cursor.execute(f"SELECT document FROM {table}")
-        rows = cursor.fetchall()
-
-        # Parse JSON and filter
-        results = []
-        for row in rows:
-            doc = json.loads(row[0])
-            if self._matches_query(doc, query):
-                results.append(doc)
-
-        # Apply sorting
-        if sort:
-            for sort_field in reversed(sort):
-                for field_name, sort_order in sort_field.items():
-                    reverse = sort_order.get("order", "asc") == "desc"
-                    results.sort(key=lambda x: x.get(field_name, 0), reverse=reverse)
-
-        # Apply collapse (get latest version of each unique field value)
-        if collapse:
-            collapse_field = collapse["field"]
-            collapsed_results = {}
-            for doc in results:
-                field_value = doc.get(collapse_field)
-                if field_value not in collapsed_results:
-                    collapsed_results[field_value] = doc
-                elif doc.get("version", 0) > collapsed_results[field_value].get("version", 0):
-                    collapsed_results[field_value] = doc
-            results = list(collapsed_results.values())
-
-        # Apply field filtering
-        if fields:
-            filtered_results = []
-            for doc in results:
-                filtered_doc = {k: v for k, v in doc.items() if k in fields}
-                filtered_results.append(filtered_doc)
-            results = filtered_results
-
-        # Apply limit
-        results = results[:limit]
-
-        return results
-
-    def _matches_query(self, doc: dict, query: dict) -> bool:
-        """Check if a document matches the given query"""
-        if "bool" not in query:
-            return True
-
-        filters = query["bool"].get("filter", [])
-        for filter_item in filters:
-            if "term" in filter_item:
-                for field, value in filter_item["term"].items():
-                    if doc.get(field) != value:
-                        return False
-            elif "terms" in filter_item:
-                for field, values in filter_item["terms"].items():
-                    if doc.get(field) not in values:
-                        return False
+        sql, params = compile_query(table, query, collapse, sort, fields, limit)
+        cursor.execute(sql, params)
 
-        return True
+        return [json.loads(row[0]) for row in cursor.fetchall()]
 
     def delete_by_query(self, table: str, query: dict, max_docs=1):
         """Delete documents matching the query"""
@@ -183,11 +235,38 @@ class SQLiteBackend:
 
             if doc_id:
                 cursor.execute(f"DELETE FROM {table} WHERE id = ?", (doc_id,))
+                self._refresh_latest(cursor, table, doc)
                 deleted_count += 1
 
         self.conn.commit()
         return {"deleted": deleted_count}
 
+    def _refresh_latest(self, cursor, table: str, doc: dict):
+        """
+        Point the latest-revision table at the highest version of the entity that `doc`
+        belongs to. This is an index seek on (key, version), and runs in the same
+        transaction as the write that called it.
+        """
+        self._refresh_latest_many(cursor, table, [doc])
+
+    def _refresh_latest_many(self, cursor, table: str, docs):
+        """Refresh the latest-revision table once for every entity that `docs` touch"""
+        if not is_versioned(table):
+            return
+        key = TABLE_SCHEMAS[table]["key"]
+        entity_ids = [(entity_id,) for entity_id in {doc.get(key) for doc in docs} - {None}]
+        cursor.executemany(f"DELETE FROM {latest_table(table)} WHERE entity_id = ?", entity_ids)
+        cursor.executemany(
+            f"""
+            INSERT INTO {latest_table(table)} (entity_id, id)
+            SELECT {quote_identifier(key)}, id FROM {table}
+            WHERE {quote_identifier(key)} = ?
+            ORDER BY COALESCE(version, 0) DESC, rowid ASC
+            LIMIT 1
+            """,
+            entity_ids,
+        )
+
     def generate_id(self):
         """Generate a 7-character alphanumeric ID"""
         alphabet = string.ascii_letters + string.digits
@@ -497,13 +576,20 @@ class SQLiteBackend:
         }
 
     def create_indices(self):
-        """Create database tables (equivalent to Elasticsearch indices)"""
+        """
+        Create database tables (equivalent to Elasticsearch indices).
+
+        This also migrates tables created by earlier versions, which only had
+        (id, document) columns: generated columns for the fields in TABLE_SCHEMAS are
+        added in place, indexed, and the latest-revision tables are created and
+        backfilled. Every step is idempotent, so this is safe to run on every startup.
+        """
         cursor = self.conn.cursor()
+        # IMMEDIATE takes the write lock up front. A deferred transaction that reads
+        # the schema first can't wait for another writer, it would fail straight away
+        cursor.execute("BEGIN IMMEDIATE")
 
-        # Create tables for each entity type
-        tables = ["map", "dataset", "template", "userdata"]
-
-        for table in tables:
+        for table, schema in TABLE_SCHEMAS.items():
             cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS {table} (
                     id TEXT PRIMARY KEY,
@@ -511,23 +597,125 @@ class SQLiteBackend:
                 )
             """)
 
+            # table_xinfo (unlike table_info) also lists generated columns
+            cursor.execute(f"PRAGMA table_xinfo({table})")
+            existing_columns = {row["name"] for row in cursor.fetchall()}
+            for column, column_type in schema["columns"].items():
+                if column in existing_columns:
+                    continue
+                # only VIRTUAL generated columns can be added to an existing table
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {quote_identifier(column)} {column_type} "
+                    f"GENERATED ALWAYS AS (json_extract(document, '{json_path(column)}')) VIRTUAL"
+                )
+
+            for index_columns in schema["indices"]:
+                index_name = "%s_%s_idx" % (table, "_".join(index_columns))
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} "
+                    f"({', '.join(quote_identifier(c) for c in index_columns)})"
+                )
+
+            if not is_versioned(table):
+                continue
+
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (latest_table(table),),
+            )
+            if cursor.fetchone() is not None:
+                continue
+
+            cursor.execute(f"""
+                CREATE TABLE {latest_table(table)} (
+                    entity_id TEXT PRIMARY KEY,
+                    id TEXT NOT NULL
+                )
+            """)
+            key = quote_identifier(schema["key"])
+            cursor.execute(f"""
+                INSERT INTO {latest_table(table)} (entity_id, id)
+                SELECT entity_id, id FROM (
+                    SELECT {key} AS entity_id, id, ROW_NUMBER() OVER (
+                        PARTITION BY {key} ORDER BY COALESCE(version, 0) DESC, rowid ASC
+                    ) AS revision_rank
+                    FROM {table}
+                    WHERE {key} IS NOT NULL
+                )
+                WHERE revision_rank = 1
+            """)
+
         self.conn.commit()
 
-    def initialize_templates(self):
-        """Initialize default templates if none exist"""
-        if not self.get_templates():
-            for name, template in INITIAL_TEMPLATES.items():
-                class Dummy(object):
-                    pass
+    # Bulk import
+    def import_revisions(self, table: str, docs: List[dict]):
+        """
+        Write revisions as given, in a single transaction. A revision whose entity id
+        and version are already stored replaces the stored document rather than being
+        added alongside it, so importing the same export twice doesn't duplicate it.
+        """
+        key = TABLE_SCHEMAS[table]["key"]
+        # the last of several revisions with the same id and version wins
+        revisions = {(doc.get(key), doc.get("version")): doc for doc in docs}
+        cursor = self.conn.cursor()
+        existing = {}
+        entity_ids = list({entity_id for entity_id, _ in revisions})
+        # stay well below SQLite's limit on the number of bound parameters
+        for start in range(0, len(entity_ids), 500):
+            chunk = entity_ids[start:start + 500]
+            cursor.execute(
+                f"SELECT {quote_identifier(key)}, version, id FROM {table} "
+                f"WHERE {quote_identifier(key)} IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for entity_id, version, id in cursor.fetchall():
+                existing.setdefault((entity_id, version), id)
+
+        rows = [
+            (existing.get(revision) or self.generate_id(), json.dumps(doc, default=str))
+            for revision, doc in revisions.items()
+        ]
+        try:
+            cursor.executemany(
+                f"INSERT INTO {table} (id, document) VALUES (?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET document = excluded.document",
+                rows,
+            )
+            self._refresh_latest_many(cursor, table, revisions.values())
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
 
-                new_template = Dummy()
-                new_template.name = name
-                new_template.template = template
+        return {"result": "created", "count": len(rows)}
 
-                user = Dummy()
-                user.username = "admin"
+    def import_maps(self, maps: List[Map]):
+        """Write map revisions as given (ids, versions and authorship are preserved)"""
+        return self.import_revisions("map", [m.model_dump() for m in maps])
 
-                self.create_template(new_template, user)
+    def import_datasets(self, datasets: List[Dataset]):
+        """Write dataset revisions as given (ids, versions and authorship are preserved)"""
+        return self.import_revisions("dataset", [d.model_dump() for d in datasets])
+
+    def import_templates(self, templates: List[Template]):
+        """Write template revisions as given (ids, versions and authorship are preserved)"""
+        return self.import_revisions("template", [t.model_dump() for t in templates])
+
+    def initialize_templates(self):
+        """Initialize default templates if none exist"""
+        if not self.get_templates():
+            templates = [
+                Template(
+                    templateId=self.generate_id(),
+                    name=name,
+                    version=1,
+                    template=template,
+                    lastUpdatedBy="admin",
+                    lastUpdatedOn=datetime.now().isoformat(),
+                )
+                for name, template in INITIAL_TEMPLATES.items()
+            ]
+            self.import_templates(templates)
 
 
 # Note: Singleton instance is created in terranova.backends.storage when needed
@@ -0,0 +1,189 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, Dict
+
+from terranova.settings import SQLITE_ASYNC_WORKERS
+from terranova.backends.auth import User
+from terranova.models import (
+    Dataset,
+    Map,
+    Template,
+    PublicMapFilters,
+    MapFilters,
+    DatasetFilters,
+    TemplateFilters,
+    MapRevision,
+    DatasetRevision,
+    NewTemplate,
+    UserDataRevision,
+    TerranovaVersion,
+)
+from . import SQLiteBackend
+
+
+class AsyncSQLiteBackend:
+    """
+    Asynchronous interface to a SQLiteBackend.
+
+    sqlite3 calls block, so they run on worker threads owned by this backend, each with
+    its own connection (the same model as aiosqlite), instead of on the web server's
+    threadpool. Reads are spread over `workers` threads; writes are serialized on a
+    single thread so that concurrent writers never contend for the database lock.
+    Every entity operation is a single hop to a worker, however many statements it runs.
+    """
+
+    def __init__(self, backend: SQLiteBackend, workers: int = SQLITE_ASYNC_WORKERS):
+        self.backend = backend
+        self.workers = workers
+        self._readers = None
+        self._writer = None
+
+    @property
+    def db_path(self):
+        return self.backend.db_path
+
+    async def _run(self, executor, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(method, *args, **kwargs))
+
+    async def _read(self, method, *args, **kwargs):
+        # executors are (re)created on demand, so the backend is usable again after close()
+        if self._readers is None:
+            self._readers = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="sqlite-read"
+            )
+        return await self._run(self._readers, method, *args, **kwargs)
+
+    async def _write(self, method, *args, **kwargs):
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+        return await self._run(self._writer, method, *args, **kwargs)
+
+    async def close(self):
+        for executor in (self._readers, self._writer):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self._readers = None
+        self._writer = None
+
+    # General database functions
+    async def create(self, table: str, id: str, doc: dict):
+        return await self._write(self.backend.create, table, id, doc)
+
+    async def update(self, table: str, id: str, doc: dict):
+        return await self._write(self.backend.update, table, id, doc)
+
+    async def bulk_create(self, table: str, docs: Dict[str, dict]):
+        return await self._write(self.backend.bulk_create, table, docs)
+
+    async def bulk_update(self, table: str, docs: Dict[str, dict]):
+        return await self._write(self.backend.bulk_update, table, docs)
+
+    async def query(
+        self,
+        table: str,
+        query: dict,
+        collapse: dict = None,
+        sort: List[dict] = None,
+        fields: List[str] = None,
+        limit: int = 10000,
+    ):
+        return await self._read(self.backend.query, table, query, collapse, sort, fields, limit)
+
+    async def delete_by_query(self, table: str, query: dict, max_docs=1):
+        return await self._write(self.backend.delete_by_query, table, query, max_docs)
+
+    # User Data
+    async def get_userdata(self, user: User):
+        return await self._read(self.backend.get_userdata, user)
+
+    async def create_userdata(self, userdata: UserDataRevision, user: User):
+        return await self._write(self.backend.create_userdata, userdata, user)
+
+    async def update_userdata(self, userdata: UserDataRevision, user: User):
+        return await self._write(self.backend.update_userdata, userdata, user)
+
+    # Maps
+    async def get_maps(
+        self,
+        map_id: str = None,
+        fields: List[str] = None,
+        filters: MapFilters = MapFilters(),
+        version: TerranovaVersion = None,
+    ):
+        return await self._read(self.backend.get_maps, map_id, fields, filters, version)
+
+    async def get_public_maps(
+        self,
+        map_id: str = None,
+        fields: List[str] = None,
+        filters: MapFilters = PublicMapFilters(),
+        version: TerranovaVersion = None,
+    ):
+        return await self._read(self.backend.get_public_maps, map_id, fields, filters, version)
+
+    async def create_map(self, map_revision: MapRevision, user: User):
+        return await self._write(self.backend.create_map, map_revision, user)
+
+    async def update_map(self, map_id: str, map_revision: MapRevision, user: User):
+        return await self._write(self.backend.update_map, map_id, map_revision, user)
+
+    async def publish_map(self, map_id: str, user: User):
+        return await self._write(self.backend.publish_map, map_id, user)
+
+    # Datasets
+    async def get_datasets(
+        self,
+        dataset_id: str = None,
+        fields: List[str] = None,
+        filters: DatasetFilters = DatasetFilters(),
+        version: TerranovaVersion = None,
+    ) -> List[Dataset]:
+        return await self._read(self.backend.get_datasets, dataset_id, fields, filters, version)
+
+    async def update_dataset(
+        self,
+        dataset_id: str,
+        new_dataset: DatasetRevision,
+        query_results: List[Any],
+        user: User,
+    ):
+        return await self._write(
+            self.backend.update_dataset, dataset_id, new_dataset, query_results, user
+        )
+
+    async def create_dataset(self, new_dataset: DatasetRevision, user: User):
+        return await self._write(self.backend.create_dataset, new_dataset, user)
+
+    # Templates
+    async def get_templates(
+        self,
+        template_id: str = None,
+        fields: List[str] = None,
+        filters: TemplateFilters = TemplateFilters(),
+        version: str = None,
+    ) -> List[Template]:
+        return await self._read(self.backend.get_templates, template_id, fields, filters, version)
+
+    async def create_template(self, new_template: NewTemplate, user: User):
+        return await self._write(self.backend.create_template, new_template, user)
+
+    async def update_template(self, template_id, new_template: NewTemplate, user: User):
+        return await self._write(self.backend.update_template, template_id, new_template, user)
+
+    # Bulk import
+    async def import_maps(self, maps: List[Map]):
+        return await self._write(self.backend.import_maps, maps)
+
+    async def import_datasets(self, datasets: List[Dataset]):
+        return await self._write(self.backend.import_datasets, datasets)
+
+    async def import_templates(self, templates: List[Template]):
+        return await self._write(self.backend.import_templates, templates)
+
+    async def is_connected(self):
+        return await self._read(self.backend.is_connected)
+
+    async def connection_info(self):
+        return await self._read(self.backend.connection_info)
@@ -6,3 +6,35 @@ INITIAL_TEMPLATES = {
     "Geo: Labelled - Square": """<rect x='-4' y='-4' width='8' height='8' /><text x='8' y="3" fill="#111111" stroke="none" style='font-size:12px; filter: drop-shadow(0px 0px 1px rgba(255,255,255,1.0));'>{{endpoint_name}}</text>""",  # noqa: E501
     "Geo: Labelled - Star": """<svg viewBox="-8 -8 16 16" height="20" width="20" x="-10" y="-10"><polygon points="0,-7.64 1.77,-2.19 7.5,-2.19 2.87,1.18 4.64,6.63 0,3.27 -4.64,6.63 -2.87,1.18 -7.5,-2.19 -1.77,-2.19 "/></svg><text x='10' y="3" fill="#111111" stroke="none" style='font-size:12px; filter: drop-shadow(0px 0px 1px rgba(255,255,255,1.0));'>{{ endpoint_name }}</text>""",  # noqa: E501
 }
+
+# Document fields that are mirrored into generated, indexed columns for each entity table.
+# "key" is the field that identifies an entity across all of its revisions. Versioned
+# tables (those with a "version" column) also keep a "<table>_latest" table pointing at
+# the most recent revision of each entity.
+TABLE_SCHEMAS = {
+    "map": {
+        "key": "mapId",
+        "columns": {
+            "mapId": "TEXT",
+            "version": "INTEGER",
+            "public": "BOOLEAN",
+            "lastUpdatedBy": "TEXT",
+        },
+        "indices": [("mapId", "version"), ("public", "mapId", "version")],
+    },
+    "dataset": {
+        "key": "datasetId",
+        "columns": {"datasetId": "TEXT", "version": "INTEGER", "lastUpdatedBy": "TEXT"},
+        "indices": [("datasetId", "version")],
+    },
+    "template": {
+        "key": "templateId",
+        "columns": {"templateId": "TEXT", "version": "INTEGER", "lastUpdatedBy": "TEXT"},
+        "indices": [("templateId", "version")],
+    },
+    "userdata": {
+        "key": "username",
+        "columns": {"username": "TEXT"},
+        "indices": [("username",)],
+    },
+}
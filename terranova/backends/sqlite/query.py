@@ -0,0 +1,215 @@
+"""
+Query compiler for the SQLite storage backend.
+
+The storage layer speaks the same small dialect of Elasticsearch query DSL for both
+backends (a `bool` query with `term` / `terms` filters, an optional `collapse` on an
+id field, a `sort` list, a `fields` projection and a `limit`). This module turns that
+dialect into a single SQLite statement, so that filtering, "latest version" collapsing,
+sorting and projection happen inside SQLite instead of on every row in Python.
+
+Tables listed in `TABLE_SCHEMAS` have generated columns for their most frequently
+queried fields; filters and sorts on those fields use the (indexed) column instead of
+extracting the value from the JSON document.
+"""
+
+from typing import Callable, List, Tuple, Any
+
+from .constants import TABLE_SCHEMAS
+
+
+def json_path(field: str) -> str:
+    """
+    Returns the JSON path for a top-level document key. The key is quoted so that
+    field names containing dots are not treated as nested paths.
+    """
+    return '$."%s"' % field.replace('"', '""')
+
+
+def quote_identifier(name: str) -> str:
+    return '"%s"' % name.replace('"', '""')
+
+
+def latest_table(table: str) -> str:
+    """Returns the name of the table tracking the latest revision of each entity"""
+    return "%s_latest" % table
+
+
+def is_versioned(table: str) -> bool:
+    return "version" in TABLE_SCHEMAS.get(table, {}).get("columns", {})
+
+
+def make_resolver(table: str, overrides: dict = None) -> Callable[[str, List[Any]], str]:
+    """
+    Returns a function that maps a document field onto an SQL expression, appending
+    any bound parameters it needs. Fields with a generated column resolve to that
+    column; every other field is extracted from the JSON document.
+    """
+    columns = TABLE_SCHEMAS.get(table, {}).get("columns", {})
+    overrides = overrides or {}
+
+    def resolve(field: str, params: List[Any]) -> str:
+        if field in overrides:
+            return overrides[field]
+        if field in columns:
+            return "doc.%s" % quote_identifier(field)
+        params.append(json_path(field))
+        return "json_extract(doc.document, ?)"
+
+    return resolve
+
+
+def get_filters(query: dict) -> List[dict]:
+    if not query or "bool" not in query:
+        return []
+    filters = query["bool"].get("filter", [])
+    # Elasticsearch also accepts a single filter clause instead of a list
+    if isinstance(filters, dict):
+        filters = [filters]
+    return filters
+
+
+def compile_filters(query: dict, resolve: Callable, params: List[Any]) -> List[str]:
+    """
+    Compiles a `{"bool": {"filter": [...]}}` query into a list of SQL conditions
+    that are to be AND-ed together. `term` filters become an `IS` comparison (so that
+    a `None` value matches a missing key), `terms` filters become an `IN` list.
+    """
+    conditions = []
+    for filter_item in get_filters(query):
+        if "term" in filter_item:
+            for field, value in filter_item["term"].items():
+                conditions.append("%s IS ?" % resolve(field, params))
+                params.append(value)
+        elif "terms" in filter_item:
+            for field, values in filter_item["terms"].items():
+                values = list(values)
+                expression = resolve(field, params)
+                non_null = [v for v in values if v is not None]
+                condition = "%s IN (%s)" % (expression, ", ".join("?" * len(non_null)))
+                params.extend(non_null)
+                if len(non_null) != len(values):
+                    condition = "(%s OR %s IS NULL)" % (condition, resolve(field, params))
+                conditions.append(condition)
+    return conditions
+
+
+def compile_sort(sort: List[dict], resolve: Callable, params: List[Any]) -> List[str]:
+    """
+    Compiles an Elasticsearch style sort list into ORDER BY terms. Missing values sort
+    as 0, matching the behaviour of the original in-Python sort.
+    """
+    terms = []
+    for sort_field in sort or []:
+        for field_name, sort_order in sort_field.items():
+            direction = "DESC" if sort_order.get("order", "asc") == "desc" else "ASC"
+            terms.append("COALESCE(%s, 0) %s" % (resolve(field_name, params), direction))
+    return terms
+
+
+def compile_projection(fields: List[str], params: List[Any]) -> str:
+    """
+    Builds a JSON object containing only the requested top-level keys of the document.
+    Keys that don't exist in the document are omitted rather than set to null.
+    """
+    if not fields:
+        return "doc.document"
+    placeholders = ", ".join("?" * len(fields))
+    params.extend(fields)
+    # json_each reports booleans as 1/0; turn them back into JSON literals so that
+    # they survive json_group_object
+    return (
+        "(SELECT json_group_object(key, CASE type WHEN 'true' THEN json('true') "
+        "WHEN 'false' THEN json('false') ELSE value END) "
+        "FROM json_each(doc.document) WHERE key IN (%s))" % placeholders
+    )
+
+
+def _can_use_latest_table(table: str, query: dict, collapse: dict) -> bool:
+    """
+    The latest-revision table can answer a collapsed query only when the filters
+    commute with the collapse, ie. when they only restrict the entity key itself.
+    """
+    if not collapse or not is_versioned(table):
+        return False
+    key = TABLE_SCHEMAS[table]["key"]
+    if collapse["field"] != key:
+        return False
+    for filter_item in get_filters(query):
+        for clause in ("term", "terms"):
+            fields = filter_item.get(clause, {})
+            if any(field != key for field in fields):
+                return False
+            if clause == "term" and any(value is None for value in fields.values()):
+                return False
+            if clause == "terms" and any(None in values for values in fields.values()):
+                return False
+        if not set(filter_item) <= {"term", "terms"}:
+            return False
+    return True
+
+
+def compile_query(
+    table: str,
+    query: dict,
+    collapse: dict = None,
+    sort: List[dict] = None,
+    fields: List[str] = None,
+    limit: int = None,
+) -> Tuple[str, List[Any]]:
+    """
+    Compiles a storage query into a single SQL statement and its parameters.
+
+    When `collapse` is given, only the highest `version` of each distinct value of the
+    collapse field is returned. If the filters only concern the entity key this is a
+    join against the latest-revision table, otherwise it is computed with a
+    ROW_NUMBER() window over the matching revisions.
+
+    :returns: a tuple of (sql, params). Each result row has a single JSON text column.
+    """
+    use_latest = _can_use_latest_table(table, query, collapse)
+    overrides = {}
+    if use_latest:
+        overrides[TABLE_SCHEMAS[table]["key"]] = "latest.entity_id"
+    resolve = make_resolver(table, overrides)
+
+    where_params = []
+    conditions = compile_filters(query, resolve, where_params)
+    where = " WHERE %s" % " AND ".join(conditions) if conditions else ""
+
+    # rowid is the final tie-breaker to keep insertion order stable, as the
+    # in-Python stable sort used to.
+    sort_params = []
+    order_by = compile_sort(sort, make_resolver(table), sort_params) + ["doc.rowid ASC"]
+
+    if use_latest:
+        inner_params = where_params
+        source = "%s AS latest JOIN %s AS doc ON doc.id = latest.id%s" % (
+            latest_table(table),
+            table,
+            where,
+        )
+    elif collapse:
+        partition_params = []
+        partition = make_resolver(table)(collapse["field"], partition_params)
+        version_params = []
+        version = "COALESCE(%s, 0) DESC" % make_resolver(table)("version", version_params)
+        inner = (
+            "SELECT doc.*, doc.rowid AS rowid, ROW_NUMBER() OVER "
+            "(PARTITION BY %s ORDER BY %s) AS revision_rank FROM %s AS doc%s"
+        ) % (partition, ", ".join([version] + order_by), table, where)
+        inner_params = partition_params + version_params + sort_params + where_params
+        source = "(%s) AS doc WHERE revision_rank = 1" % inner
+    else:
+        inner_params = where_params
+        source = "%s AS doc%s" % (table, where)
+
+    projection_params = []
+    projection = compile_projection(fields, projection_params)
+
+    sql = "SELECT %s FROM %s ORDER BY %s" % (projection, source, ", ".join(order_by))
+    params = projection_params + inner_params + sort_params
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    return sql, params
@@ -5,7 +5,7 @@ This module provides a unified interface to access the configured storage backen
 (either Elasticsearch or SQLite) based on the application configuration.
 """
 
-from terranova.settings import STORAGE_BACKEND, SQLITE_DB_PATH
+from terranova.settings import STORAGE_BACKEND, SQLITE_DB_PATH, STORAGE_CACHE_SIZE
 
 
 def get_storage_backend():
@@ -35,5 +35,42 @@ def get_storage_backend():
         )
 
 
+def get_async_storage_backend():
+    """
+    Factory function that returns the asynchronous interface to the configured
+    storage backend. The API routers await this one.
+
+    Unless storage.cache_size is 0, the backend is wrapped in a read-through cache for
+    lookups of maps, datasets and templates by id.
+
+    Returns:
+        CachedStorageBackend, AsyncElasticSearchBackend or AsyncSQLiteBackend: The
+        configured async backend
+
+    Raises:
+        ValueError: If an invalid storage backend is configured
+    """
+    if hasattr(get_async_storage_backend, '_instance'):
+        return get_async_storage_backend._instance
+    if STORAGE_BACKEND == "elasticsearch":
+        from terranova.backends.elasticsearch.async_backend import AsyncElasticSearchBackend
+        instance = AsyncElasticSearchBackend()
+    elif STORAGE_BACKEND == "sqlite":
+        from terranova.backends.sqlite.async_backend import AsyncSQLiteBackend
+        # shares its connections' database (and schema setup) with the sync singleton
+        instance = AsyncSQLiteBackend(get_storage_backend())
+    else:
+        raise ValueError(
+            f"Invalid storage backend '{STORAGE_BACKEND}'. "
+            f"Must be either 'elasticsearch' or 'sqlite'"
+        )
+    if STORAGE_CACHE_SIZE > 0:
+        from terranova.backends.cache import CachedStorageBackend
+        instance = CachedStorageBackend(instance)
+    get_async_storage_backend._instance = instance
+    return instance
+
+
 # Export a singleton instance for backwards compatibility
 backend = get_storage_backend()
+async_backend = get_async_storage_backend()
@@ -1,28 +1,256 @@
-from terranova.backends.datasources import datasources
+"""
+Refreshes the cache of every datasource plugin that provides a `fetch` entrypoint.
+
+By default this runs as a long-lived scheduler: each datasource is refreshed on its own
+thread every `datacacher.interval` seconds (with some jitter, so that datasources and
+replicas drift apart), backing off after failures. A refresh is never started while the
+previous refresh of the same datasource is still running, in this process or another
+one. The outcome of every datasource's latest refresh is written to a status file.
+
+With `--once`, every datasource is refreshed a single time, which suits cron.
+"""
+
+import argparse
+import fcntl
+import os
+import random
+import signal
+import tempfile
 import threading
+import time
+from datetime import datetime, timezone
+
+import orjson as json
+from opentelemetry import trace
+
+from terranova.backends.datasources import datasources
 from terranova.logging import logger
+from terranova.settings import (
+    DATACACHER_INTERVAL,
+    DATACACHER_JITTER,
+    DATACACHER_MAX_BACKOFF,
+    DATACACHER_DATASOURCES,
+    DATACACHER_STATUS_FILE,
+)
 import terranova.opentelemetry
 
+tracer = trace.get_tracer(__name__)
 
-def main():
-    terranova.opentelemetry.init_telemetry()
 
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def read_status(path: str = None) -> dict:
+    """Returns the refresh status of every datasource by name, or {} if there is none"""
+    try:
+        with open(path or DATACACHER_STATUS_FILE, "rb") as f:
+            return json.loads(f.read())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+class RefreshStatus:
+    """
+    The refresh status of every datasource, kept in a JSON file that is replaced
+    atomically on every change so that readers never see a partly written one.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or DATACACHER_STATUS_FILE
+        self._lock = threading.Lock()
+        # keep the last outcomes across restarts
+        self._status = read_status(self.path)
+
+    def get(self, name: str) -> dict:
+        with self._lock:
+            return dict(self._status.get(name, {}))
+
+    def update(self, name: str, **fields):
+        with self._lock:
+            self._status.setdefault(name, {}).update(fields)
+            self._write()
+
+    def _write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(self._status, option=json.OPT_INDENT_2))
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning("Unable to write datacacher status file %s: %s" % (self.path, e))
+
+
+class RefreshJob:
+    """
+    Refreshes one datasource's cache by calling its `fetch` entrypoint, and records the
+    outcome in a RefreshStatus. If fetch returns a dict (e.g. row counts), it is
+    recorded as the refresh's result.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fetch,
+        status: RefreshStatus,
+        interval: float = DATACACHER_INTERVAL,
+        jitter: float = DATACACHER_JITTER,
+        max_backoff: float = DATACACHER_MAX_BACKOFF,
+    ):
+        self.name = name
+        self.fetch = fetch
+        self.status = status
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.failures = status.get(name).get("consecutive_failures", 0)
+
+    @property
+    def lock_path(self) -> str:
+        return "%s.%s.lock" % (self.status.path, self.name)
+
+    def next_delay(self) -> float:
+        """Seconds to wait before the next refresh: the interval, backed off and jittered"""
+        delay = self.interval
+        if self.failures:
+            delay = max(delay, min(self.interval * 2**self.failures, self.max_backoff))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run(self):
+        """
+        Refreshes the datasource once. Returns True if the refresh succeeded, False if
+        it failed and None if another process was already refreshing it.
+        """
+        with open(self.lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Cache refresh for '%s' is already running, skipping" % self.name)
+                return None
+            try:
+                return self._refresh()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        logger.info("Refreshing cache for '%s'" % self.name)
+        self.status.update(self.name, state="running", last_started=_now())
+        start = time.perf_counter()
+        with tracer.start_as_current_span(
+            "datacacher.refresh", attributes={"datasource": self.name}
+        ) as span:
+            try:
+                result = self.fetch()
+            except Exception as e:
+                duration = time.perf_counter() - start
+                self.failures += 1
+                span.record_exception(e)
+                logger.exception(
+                    "Cache refresh for '%s' failed after %.1fs (%d in a row)"
+                    % (self.name, duration, self.failures)
+                )
+                self.status.update(
+                    self.name,
+                    state="failed",
+                    last_failure=_now(),
+                    last_error="%s: %s" % (type(e).__name__, e),
+                    last_duration=round(duration, 3),
+                    consecutive_failures=self.failures,
+                )
+                return False
+        duration = time.perf_counter() - start
+        self.failures = 0
+        logger.info("Cache refresh for '%s' has concluded in %.1fs" % (self.name, duration))
+        self.status.update(
+            self.name,
+            state="ok",
+            last_success=_now(),
+            last_duration=round(duration, 3),
+            consecutive_failures=0,
+            result=result if isinstance(result, dict) else None,
+        )
+        return True
+
+    def loop(self, stop: threading.Event):
+        """Refreshes the datasource until stop is set, starting right away"""
+        while not stop.is_set():
+            self.run()
+            delay = self.next_delay()
+            self.status.update(
+                self.name,
+                next_run=datetime.fromtimestamp(time.time() + delay, timezone.utc).isoformat(),
+            )
+            stop.wait(delay)
+
+
+def refresh_jobs(status: RefreshStatus):
+    """A RefreshJob for every datasource with a fetch entrypoint"""
+    jobs = []
     for name, datasource in datasources.items():
         if hasattr(datasource, "fetch"):
-            logger.info(
-                "Spawning thread to perform fetch operation for cache for '%s' plugin", name
-            )
+            options = {
+                "interval": DATACACHER_INTERVAL,
+                "jitter": DATACACHER_JITTER,
+                "max_backoff": DATACACHER_MAX_BACKOFF,
+            }
+            for option, value in (DATACACHER_DATASOURCES.get(name) or {}).items():
+                if option not in options:
+                    logger.warning(
+                        "Ignoring unknown datacacher option '%s' for '%s', expected one of: %s"
+                        % (option, name, ", ".join(options))
+                    )
+                    continue
+                options[option] = value
+            jobs.append(RefreshJob(name, datasource.fetch, status, **options))
+    return jobs
+
+
+def run_once(jobs):
+    """Refreshes every datasource once, at the same time, and waits for them to finish"""
+    threads = [threading.Thread(target=job.run, name="refresh-%s" % job.name) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_forever(jobs, stop: threading.Event):
+    """Refreshes every datasource on its own schedule until stop is set"""
+    threads = [
+        threading.Thread(target=job.loop, args=(stop,), name="refresh-%s" % job.name)
+        for job in jobs
+    ]
+    for thread in threads:
+        thread.start()
+        logger.info("Refresh thread %s has started" % thread.name)
+    for thread in threads:
+        thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refreshes the cache of every datasource.")
+    parser.add_argument(
+        "--once", action="store_true", help="refresh every datasource once, then exit"
+    )
+    args = parser.parse_args(argv)
+
+    terranova.opentelemetry.init_telemetry()
+    jobs = refresh_jobs(RefreshStatus())
+
+    if args.once:
+        run_once(jobs)
+        return
 
-            def wrap(fetch, datasource_name):
-                def do_fetch():
-                    fetch()
-                    logger.info("Cache fetch has concluded for %s" % datasource_name)
+    stop = threading.Event()
 
-                return do_fetch
+    def shutdown(signum, frame):
+        logger.info("Stopping datacacher once the running refreshes conclude")
+        stop.set()
 
-            t = threading.Thread(target=wrap(datasource.fetch, name))
-            t.start()
-            logger.info("Fetch thread with details %s has started for '%s' plugin", t, name)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    run_forever(jobs, stop)
 
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@ from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.pool import NullPool
 from sqlalchemy import Column, Integer, String
 from sqlalchemy.dialects import sqlite
-from sqlalchemy import func, text, column, exists, and_, or_
+from sqlalchemy import func, or_, select
 
 from opentelemetry import trace
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
@@ -17,17 +17,20 @@ from terranova.settings import (
     GOOGLE_SHEETS_WRITE_INDEX,
     GOOGLE_SHEETS_TABLE_NAME,
     GOOGLE_SHEETS_META_TABLE_NAME,
+    GOOGLE_SHEETS_ENDPOINT_TABLE_NAME,
+    GOOGLE_SHEETS_VALUE_TABLE_NAME,
+    GOOGLE_SHEETS_VERSION_TABLE_NAME,
 )
-from terranova.abstract_models import SQLiteCacheDatasource, Topology, QueryFilter, InputModifier
+from terranova.abstract_models import SQLiteCacheDatasource, Topology, QueryFilter, filter_plan
 from terranova.logging import logger
 from terranova import models
 from terranova.backends.storage import backend as storage_backend
 
 from .settings import METADATA
 
-from jinja2 import Template as JinjaTemplate
+from terranova.output.templates import compile_template, template_references, render_key
 
-from typing import Dict, List, Any
+from typing import Dict, List, Any, NamedTuple
 
 from Crypto.Cipher import AES
 from Crypto.Hash import HMAC, SHA256
@@ -35,7 +38,10 @@ from Crypto.Random import get_random_bytes
 
 from sqlalchemy.orm import Query as SQLQuery
 
+import re
 import json
+import threading
+import functools
 import base64
 
 from io import BytesIO
@@ -52,6 +58,25 @@ if not SQLAlchemyInstrumentor().is_instrumented_by_opentelemetry:
 
 tracer = trace.get_tracer(__name__)
 
+# node size hints a node's svg can declare, e.g. <g data-width="30" data-height="15">
+DATA_WIDTH = re.compile(r'data-width="(\d+)"')
+DATA_HEIGHT = re.compile(r'data-height="(\d+)"')
+
+
+def parse_attr_to_int(regex, markup):
+    match = regex.search(markup)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+# endpoints of the same site carry the same svg, so each distinct one is parsed once
+@functools.lru_cache(maxsize=1024)
+def parse_node_size(svg):
+    """Returns the (width, height) declared by data-width / data-height in svg"""
+    return parse_attr_to_int(DATA_WIDTH, svg), parse_attr_to_int(DATA_HEIGHT, svg)
+
+
 # SQLAlchemy Models
 Base = declarative_base()
 
@@ -61,9 +86,34 @@ class EdgeTable(Base):
 
     id = Column(Integer, primary_key=True)
     sheet_id = Column(String)
+    name = Column(String)
     edge = Column(sqlite.JSON)
 
 
+# the tables below break the edges down for filtering; the fetcher writes them along with
+# the edge table, storing values as they are in the edge documents (see fetcher.py)
+class EndpointTable(Base):
+    __tablename__ = GOOGLE_SHEETS_ENDPOINT_TABLE_NAME
+
+    edge_id = Column(Integer, primary_key=True)
+    sheet_id = Column(String)
+    position = Column(Integer, primary_key=True)
+    name = Column(String)
+    latitude = Column(String)
+    longitude = Column(String)
+
+
+class ValueTable(Base):
+    __tablename__ = GOOGLE_SHEETS_VALUE_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)
+    edge_id = Column(Integer)
+    sheet_id = Column(String)
+    endpoint = Column(Integer)  # the endpoint's position, NULL for the edge's own columns
+    field = Column(String)  # e.g. "speed", or "endpoints_site" for an endpoint column
+    value = Column(String)
+
+
 class SheetMetadata(Base):
     __tablename__ = GOOGLE_SHEETS_META_TABLE_NAME
 
@@ -71,11 +121,40 @@ class SheetMetadata(Base):
     sheet_name = Column(String)
     columns = Column(sqlite.JSON)
     types = Column(sqlite.JSON)
+    # the index the query engine uses for each column, as "table (indexed columns)"
+    indexes = Column(sqlite.JSON)
 
     def to_dict(self):
         return {column.name: getattr(self, column.name) for column in type(self).__table__.columns}
 
 
+class CacheVersion(Base):
+    """The fetcher's count of the changes it made to the cache, in a single row"""
+
+    __tablename__ = GOOGLE_SHEETS_VERSION_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+
+class CachedSheet(NamedTuple):
+    """A sheet's metadata, as kept in memory by GoogleSheetsBackend.sheet_metadata"""
+
+    sheet_id: str
+    sheet_name: str
+    columns: List[str]
+    types: List[str]
+    indexes: Dict[str, str] | None
+    column_types: Dict[str, str]  # column => "scalar" or "array"
+
+    @classmethod
+    def from_row(cls, row):
+        columns, types = row.columns or [], row.types or []
+        return cls(
+            row.sheet_id, row.sheet_name, columns, types, row.indexes, dict(zip(columns, types))
+        )
+
+
 class GoogleSheetsBackend(SQLiteCacheDatasource):
     """
     This class is intended to be used as the interaction point between Terranova
@@ -85,6 +164,16 @@ class GoogleSheetsBackend(SQLiteCacheDatasource):
     def __init__(self):
         self.session = sessionmaker(bind=engine)()
         Base.metadata.create_all(engine)
+        # sheet id => CachedSheet, as of the cache version in _metadata_version
+        self._metadata = {}
+        self._metadata_version = None
+        self._metadata_lock = threading.Lock()
+
+    def cache_version(self):
+        # the fetcher bumps the counter in the transaction that refreshes the cache
+        with self.session.get_bind().connect() as conn:
+            version = conn.execute(select(CacheVersion.version)).scalar()
+        return version or 0
 
     @property
     def record_model(self):
@@ -130,13 +219,23 @@ class GoogleSheetsBackend(SQLiteCacheDatasource):
                 output.append(metadata)
         return output
 
+    def sheet_metadata(self, sheet_id) -> CachedSheet | None:
+        """
+        Returns the metadata of a sheet, or None if it isn't cached. The metadata of every
+        sheet is read at once and kept until the fetcher refreshes the cache.
+        """
+        version = self.cache_version()
+        with self._metadata_lock:
+            if version != self._metadata_version:
+                # rows rather than entities, which the session would keep as first loaded
+                rows = self.session.execute(select(SheetMetadata.__table__))
+                self._metadata = {row.sheet_id: CachedSheet.from_row(row) for row in rows}
+                self._metadata_version = version
+            return self._metadata.get(sheet_id)
+
     def list_columns(self, sheet_id):
-        query = self.session.query(SheetMetadata)
-        query = query.filter_by(sheet_id=sheet_id)
-        try:
-            return query.all()[0].columns
-        except IndexError:
-            return []
+        metadata = self.sheet_metadata(sheet_id)
+        return metadata.columns if metadata else []
 
     def create_credential(self, name, json_credential):
         # decode JSON to ensure it's valid
@@ -250,6 +349,44 @@ class GoogleSheetsBackend(SQLiteCacheDatasource):
             data=list(map(self.sanitize_credential, GOOGLE_SHEETS_CREDENTIALS)),
         )
 
+    def _sheet_column(self, field, sheet_id):
+        """
+        Returns the column holding the values of a sheet's field, and a select of the ids
+        of the sheet's edges to narrow down on it
+        """
+        if field == "name":
+            return EdgeTable.name, select(EdgeTable.id).where(EdgeTable.sheet_id == sheet_id)
+        endpoint_field = field.split("endpoints_", 1)[-1]
+        if field.startswith("endpoints_") and endpoint_field in ("name", "latitude", "longitude"):
+            return getattr(EndpointTable, endpoint_field), select(EndpointTable.edge_id).where(
+                EndpointTable.sheet_id == sheet_id
+            )
+        return ValueTable.value, select(ValueTable.edge_id).where(
+            ValueTable.sheet_id == sheet_id, ValueTable.field == field
+        )
+
+    def get_unique_values(
+        self, field: str, filters: Dict[str, List[str]] = {}, extra_criteria=[]
+    ) -> List[str]:
+        sheet_id = next((c["sheet_id"] for c in extra_criteria if "sheet_id" in c), None)
+        metadata = self.sheet_metadata(sheet_id) if sheet_id else None
+        if not metadata:
+            return super().get_unique_values(field, filters, extra_criteria)
+        # read off the index that serves the field, see SheetMetadata.indexes
+        value_column, matches = self._sheet_column(field, sheet_id)
+        if any(filter.value for filter in filters):
+            edges = self.apply_filters(
+                self.session.query(EdgeTable.id).filter_by(sheet_id=sheet_id),
+                filters,
+                apply_templated_filters=True,
+                sheet_id=sheet_id,
+            )
+            matches = matches.where(matches.selected_columns[0].in_(edges.statement))
+        rows = self.session.execute(
+            matches.with_only_columns(value_column).distinct().order_by(value_column)
+        )
+        return [value for (value,) in rows if value]
+
     def apply_filters(
         self,
         query: SQLQuery,
@@ -260,116 +397,106 @@ class GoogleSheetsBackend(SQLiteCacheDatasource):
         # type filters model all of the modelled varations of fields + operators
         from .models import TypeFilters
 
-        metadata = None
-        if sheet_id:
-            metadata_query = self.session.query(SheetMetadata)
-            metadata_query = metadata_query.filter_by(sheet_id=sheet_id)
-            metadata = metadata_query.all()[0]
-        standard_filters = []
+        metadata = self.sheet_metadata(sheet_id) if sheet_id else None
         if not metadata:
             return super().apply_filters(query, filters, apply_templated_filters)
+        # filters are matched against the endpoint and value tables, whose indexes
+        # lead with the sheet id, and each selects the ids of the edges that match
         for filter in filters:
             field = filter.field
-            operator = filter.operator
-            value = filter.value
-            # print(f"{filter=} {operator=} {value=}")
-
-            NOT = operator == InputModifier.not_equal
-            NLIKE = operator == InputModifier.not_like
-            LIKE = operator == InputModifier.like
-
-            if LIKE or NLIKE:
+            # if this is neither a modelled field nor a sheet-specific one, skip it
+            if not hasattr(TypeFilters, field) and field not in metadata.column_types:
+                continue
+            value = self.filter_values(filter, apply_templated_filters)
+            if not value:
+                continue
+
+            # the comparisons are those of the edge documents, see SQLiteCacheDatasource
+            plan = filter_plan(self.record_model, field, filter.operator)
+            if plan.like:
                 # Add SQL search tokens around each value
                 value = ["%" + v + "%" for v in value]
 
-            LOGIC = or_
-            if NOT or NLIKE:
-                LOGIC = and_
-
-            COMPARATOR = "="
-            if NOT:
-                COMPARATOR = "!="
-            if LIKE:
-                COMPARATOR = "like"
-            if NLIKE:
-                COMPARATOR = "not like"
-
-            # if this isn't a modelled field
-            if not hasattr(TypeFilters, field):
-                # check whether the field name is in the sheet-specific fields.
-                if field in metadata.columns:
-                    # if it is a sheet-specific field,
-                    offset = metadata.columns.index(field)
-                    # check whether that field is a scalar or array
-                    type = metadata.types[offset]
-                    # add appropriate logic for scalars vs arrays to the query
-                    if field.startswith("endpoints_"):
-                        prefix = "endpoints_"
-                        json_selector = "$.endpoints"
-                        # if field.startswith("endpoints_"):
-                        filter_fieldname = field.split(prefix)[1]
-                        # When we're dealing with the array of endpoints, we're always doing
-                        # a positive match on the inner criteria
-                        LOCAL_COMPARATOR = "="
-                        if LIKE:
-                            LOCAL_COMPARATOR = "like"
-
-                        # Similar to the above, when we're dealing with an array we're default to
-                        # AND since we want everything in the array to match, unless we're in a
-                        # negation context in which we want any of the matches to disqualify
-                        LOCAL_LOGIC = and_
-                        if NOT or NLIKE:
-                            LOCAL_LOGIC = or_
-
-                        filter = LOCAL_LOGIC(
-                            exists()
-                            .select_from(
-                                func.json_each(func.json_extract(self.json_column, json_selector))
-                            )
-                            .where(
-                                func.json_extract(text("value"), f"$.{filter_fieldname}").op(
-                                    LOCAL_COMPARATOR
-                                )(v)
-                            )
-                            for v in value
-                        )
-                    elif type == "array":
-                        query = query.filter(
-                            exists()
-                            .select_from(
-                                func.json_each(func.json_extract(self.json_column, f"$.{field}"))
+            value_column, matches = self._sheet_column(field, sheet_id)
+            if field.startswith("endpoints_"):
+                # as with the JSON documents, we're always doing a positive match on
+                # the endpoints, then negate the entire match: skipping the circuits
+                # with any endpoint of type = "Organization" is
+                # "NOT any endpoint.type == Organization"
+                if plan.negated:
+                    query = query.filter(
+                        EdgeTable.id.notin_(
+                            matches.where(
+                                or_(value_column.op(plan.element_comparator)(v) for v in value)
                             )
-                            .where(LOGIC(column("value").op(COMPARATOR)(v) for v in value))
                         )
-                    elif type == "scalar":
+                    )
+                else:
+                    # every value has to match one of the endpoints
+                    for v in value:
                         query = query.filter(
-                            LOGIC(
-                                func.json_extract(self.json_column, f"$.{field}").op(COMPARATOR)(v)
-                                for v in value
+                            EdgeTable.id.in_(
+                                matches.where(value_column.op(plan.element_comparator)(v))
                             )
                         )
-            # otherwise, if this is a modelled field do the query logic 'normally'
+            elif field == "name":
+                query = query.filter(
+                    plan.logic(EdgeTable.name.op(plan.comparator)(v) for v in value)
+                )
             else:
-                standard_filters.append(filter)
-            query = super().apply_filters(query, standard_filters, apply_templated_filters)
+                # a scalar has a single row, an array a row per element: the edge matches
+                # if any of them does
+                matching = plan.logic(value_column.op(plan.comparator)(v) for v in value)
+                query = query.filter(EdgeTable.id.in_(matches.where(matching)))
+        logger.debug("Query after applying filters is %s", query)
         return query
 
     def query(
-        self, filters: Dict[str, List[str]], limit=10, apply_templated_filters=True, sheet_id=None
+        self,
+        filters: Dict[str, List[str]],
+        limit=10,
+        apply_templated_filters=True,
+        sheet_id=None,
+        after=None,
+        count=True,
     ) -> models.QueryResult:
+        """
+        Returns the edges of a sheet that match the filters, ordered by their id in the
+        cache. Pages continue from the `next_after` of the previous one, passed as
+        `after`. The count of every matching edge is read along with the rows, unless
+        count is False, in which case it is None.
+        """
         if sheet_id is None:
             raise Exception("Misconfigured Query. Queries to google sheets require a sheet id.")
-        query = self.session.query(EdgeTable.edge)
+        query = self.session.query(EdgeTable.id)
         query = query.filter_by(sheet_id=sheet_id)
         query = self.apply_filters(query, filters, apply_templated_filters, sheet_id)
-        query = query.order_by(EdgeTable.edge["id"])
-        count = query.count()
+        if count and limit == 0:
+            return models.QueryResult(count=query.count(), data=[])
+
+        filtered = query
+        query = query.add_columns(EdgeTable.edge)
+        if count:
+            # counted by the same statement that reads the page. SQLite evaluates the
+            # uncorrelated subquery once, over the ids of the matches only, which costs
+            # far less than a COUNT(*) OVER () window carrying every match.
+            total = select(func.count()).select_from(filtered.subquery()).scalar_subquery()
+            query = query.add_columns(total.label("total"))
+        if after is not None:
+            query = query.filter(EdgeTable.id > after)
+        query = query.order_by(EdgeTable.id)
         if limit is not None:
             query = query.limit(limit)
         rows = query.all()
-        # Each row is returned as a tuple containing 1 dictionary, remove that
-        # unneeded layer here when we return
-        return models.QueryResult(count=count, data=list(map(lambda x: x[0], rows)))
+
+        total = None
+        if count:
+            # a page past the last match doesn't carry the count
+            total = rows[0].total if rows else (filtered.count() if after is not None else 0)
+        next_after = rows[-1].id if limit and len(rows) == limit else None
+        return models.QueryResult(
+            count=total, data=[row.edge for row in rows], next_after=next_after
+        )
 
     # Explicitly trace the make_topology function as this can be time consuming
     @tracer.start_as_current_span("render_topology")
@@ -401,21 +528,6 @@ class GoogleSheetsBackend(SQLiteCacheDatasource):
         return Topology(**topo)
 
     def _render_geographic(self, edge_data, node_template, node_group_criteria):
-        def parse_attr_to_int(template, attr):
-            import re
-
-            regex = re.compile(r'%s="(\d+)"' % attr)
-            match = regex.findall(template)
-            if match:
-                return int(match[0])
-            return None
-
-        def parse_height(template):
-            return parse_attr_to_int(template, "data-height")
-
-        def parse_width(template):
-            return parse_attr_to_int(template, "data-width")
-
         nodes = {}  # use a dict here to "reduce" on collision
         topo = {"nodes": [], "edges": []}
 
@@ -451,8 +563,9 @@ class GoogleSheetsBackend(SQLiteCacheDatasource):
                     "coordinate": [float(endpoint["latitude"]), float(endpoint["longitude"])],
                     "meta": node_meta,  # noqa: E501
                 }
-                node_meta["computed_width"] = parse_width(node_meta.get("svg", ""))
-                node_meta["computed_height"] = parse_height(node_meta.get("svg", ""))
+                width, height = parse_node_size(node_meta.get("svg", ""))
+                node_meta["computed_width"] = width
+                node_meta["computed_height"] = height
                 # enter the node info for the bottom-tier node into the
                 # dedupe dict
                 nodes[node_info["name"]] = node_info
@@ -496,17 +609,27 @@ class GoogleSheetsBackend(SQLiteCacheDatasource):
 
                     last_child = node_name
         try:
-            templ = JinjaTemplate(node_template)
+            templ = compile_template(node_template)
         except Exception as e:
             logger.error("received exception on compile. Template was: %s" % node_template)
             raise e
+        # nodes often share the values of the few fields a template uses, so each distinct
+        # combination of them is only rendered once
+        references = template_references(node_template)
+        rendered = {}
         for node in nodes.values():
             node["endpoint_name"] = node.get("meta").get("endpoint_name")
-            try:
-                node["meta"]["svg"] = templ.render(**node)
-            except Exception as e:
-                logger.error("received exception on render. Template was: %s" % node_template)
-                raise e
+            key = render_key(node, references)
+            svg = rendered.get(key) if key is not None else None
+            if svg is None:
+                try:
+                    svg = templ.render(**node)
+                except Exception as e:
+                    logger.error("received exception on render. Template was: %s" % node_template)
+                    raise e
+                if key is not None:
+                    rendered[key] = svg
+            node["meta"]["svg"] = svg
             topo["nodes"].append(node)
 
         topo["nodes"] = list(nodes.values())
@@ -13,16 +13,32 @@ from google_auth_oauthlib.flow import InstalledAppFlow  # noqa: E402
 from googleapiclient.errors import HttpError  # noqa: E402
 from googleapiclient.discovery import build  # noqa: E402
 
+import threading  # noqa: E402
+import time  # noqa: E402
+from concurrent.futures import (  # noqa: E402
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+from itertools import islice  # noqa: E402
 from copy import deepcopy  # noqa: E402
 from collections import defaultdict  # noqa: E402
 
+import httplib2  # noqa: E402
+from google_auth_httplib2 import AuthorizedHttp  # noqa: E402
+
 from terranova.logging import logger  # noqa: E402
 from terranova.settings import (  # noqa: E402
     GOOGLE_SHEETS_CACHE_FILE,
     GOOGLE_SHEETS_TABLE_NAME,
     GOOGLE_SHEETS_META_TABLE_NAME,
+    GOOGLE_SHEETS_ENDPOINT_TABLE_NAME,
+    GOOGLE_SHEETS_VALUE_TABLE_NAME,
+    GOOGLE_SHEETS_VERSION_TABLE_NAME,
     GOOGLE_SHEETS_CREDENTIAL_SOURCE,
     GOOGLE_SHEETS_CREDENTIALS,
+    GOOGLE_SHEETS_FETCH_CONCURRENCY,
 )
 
 from .backend import GoogleSheetsBackend  # noqa: E402
@@ -49,6 +65,19 @@ EXPECTED_COLUMNS = {
 
 DATATYPES = {"nodes": "Nodes!A:Z", "edges": "Edges!A:Z"}
 
+# files per Drive listing request (the API's maximum)
+LIST_PAGE_SIZE = 1000
+# rows per insert when writing a sheet into the cache
+WRITE_BATCH_SIZE = 1000
+# responses from Google worth trying again, how many times, and the wait before the
+# first retry in seconds (doubled before each of the next)
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+FETCH_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+# client_options for the Drive and Sheets services, e.g. {"api_endpoint": ...}
+CLIENT_OPTIONS = {"drive": None, "sheets": None}
+
 BAD_FORMAT_MESSAGE = """
 These sheets:
 %s
@@ -79,61 +108,377 @@ for an example.
 """
 
 
+# the edge table holds the edge documents the API returns. The query engine filters
+# them on the endpoint table (the endpoints of each edge, by position) and the value
+# table: a row per value of every other column of an edge or of its endpoints (one per
+# element for array columns), named as in the sheet's metadata, e.g. "endpoints_site".
+# Refreshes load the sheets that changed into copies of all three under other names, then
+# replace those sheets' rows with them.
+EDGE_TABLE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS %s
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+     sheet_id TEXT,
+     name,
+     edge TEXT)
+    """
+ENDPOINT_TABLE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS %s
+    (edge_id INTEGER,
+     sheet_id TEXT,
+     position INTEGER,
+     name,
+     latitude,
+     longitude)
+    """
+VALUE_TABLE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS %s
+    (id INTEGER PRIMARY KEY,
+     edge_id INTEGER,
+     sheet_id TEXT,
+     endpoint INTEGER,
+     field TEXT,
+     value)
+    """
+# (table, schema, columns, indexes) of every table a refresh writes. Values are stored
+# as they are in the edge documents (the columns have no type affinity), so they compare
+# with filter values the same way the documents do.
+CACHE_TABLES = [
+    (
+        GOOGLE_SHEETS_TABLE_NAME,
+        EDGE_TABLE_SCHEMA,
+        ("id", "sheet_id", "name", "edge"),
+        [("sheet_id",), ("sheet_id", "name")],
+    ),
+    (
+        GOOGLE_SHEETS_ENDPOINT_TABLE_NAME,
+        ENDPOINT_TABLE_SCHEMA,
+        ("edge_id", "sheet_id", "position", "name", "latitude", "longitude"),
+        [("sheet_id", "name", "edge_id"), ("sheet_id", "latitude", "longitude")],
+    ),
+    (
+        GOOGLE_SHEETS_VALUE_TABLE_NAME,
+        VALUE_TABLE_SCHEMA,
+        ("edge_id", "sheet_id", "endpoint", "field", "value"),
+        [("sheet_id", "field", "value", "edge_id")],
+    ),
+]
+# bumped when the tables above (or their indexes) change; older caches are emptied and
+# fetched again
+CACHE_SCHEMA_VERSION = 2
+
+# endpoint columns kept in the endpoint table rather than the value table
+ENDPOINT_COLUMNS = ("name", "latitude", "longitude")
+
+
+def scalars(value):
+    """The values of a column the query engine matches: a scalar, or those in a list"""
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, (str, int, float))]
+    if isinstance(value, (str, int, float)):
+        return [value]
+    return []
+
+
+def column_indexes(columns):
+    """
+    Returns the index the query engine uses for each of a sheet's columns, as
+    "table (indexed columns)", for the sheet's metadata
+    """
+    edges, endpoints, values = CACHE_TABLES
+    output = {}
+    for column in columns:
+        endpoint_column = column.split("endpoints_", 1)[-1]
+        if column == "name":
+            table, column_name = edges, column
+        elif column.startswith("endpoints_") and endpoint_column in ENDPOINT_COLUMNS:
+            table, column_name = endpoints, endpoint_column
+        else:
+            table, column_name = values, "value"
+        name, _, _, indexes = table
+        index = next(index for index in indexes if column_name in index)
+        output[column] = "%s (%s)" % (name, ", ".join(index))
+    return output
+
+
+def normalize_edge(edge_id, sheet_id, edge):
+    """Returns the rows of the endpoint and value tables for an edge document"""
+    endpoints, values = [], []
+    for field, value in edge.items():
+        if field in ("name", "endpoints"):  # kept in the edge and endpoint tables
+            continue
+        values.extend((edge_id, sheet_id, None, field, item) for item in scalars(value))
+    for position, endpoint in enumerate(edge.get("endpoints") or []):
+        endpoints.append(
+            (edge_id, sheet_id, position)
+            + tuple(next(iter(scalars(endpoint.get(c))), None) for c in ENDPOINT_COLUMNS)
+        )
+        for field, value in endpoint.items():
+            if field not in ENDPOINT_COLUMNS:
+                field = "endpoints_%s" % field
+                values.extend((edge_id, sheet_id, position, field, v) for v in scalars(value))
+    return endpoints, values
+
+
 class CacheWriter:
     def __init__(self):
         logger.info("Creating sqlite connection to %s" % GOOGLE_SHEETS_CACHE_FILE)
         self.conn = sqlite3.connect(GOOGLE_SHEETS_CACHE_FILE)
+        # the API keeps reading the cache while it is refreshed
+        self.conn.execute("PRAGMA journal_mode=wal")
 
         creates = [
-            """
-            CREATE TABLE IF NOT EXISTS %s
-            (id INTEGER PRIMARY KEY AUTOINCREMENT,
-             sheet_id TEXT,
-             edge TEXT)
-            """
-            % GOOGLE_SHEETS_TABLE_NAME,
             """
             CREATE TABLE IF NOT EXISTS %s
             (sheet_id TEXT PRIMARY KEY,
              sheet_name TEXT,
              columns TEXT,
-             types TEXT)
+             types TEXT,
+             version TEXT,
+             modified_time TEXT,
+             indexes TEXT)
             """
             % GOOGLE_SHEETS_META_TABLE_NAME,
+            # a single row, see _bump_version
+            """
+            CREATE TABLE IF NOT EXISTS %s
+            (id INTEGER PRIMARY KEY CHECK (id = 0),
+             version INTEGER NOT NULL)
+            """
+            % GOOGLE_SHEETS_VERSION_TABLE_NAME,
         ]
         for create in creates:
             logger.debug("Creating table %s" % create)
             self.conn.execute(create)
 
+        # caches written before sheet versions (or indexes) were recorded
+        existing = [
+            row[1]
+            for row in self.conn.execute("PRAGMA table_info(%s)" % GOOGLE_SHEETS_META_TABLE_NAME)
+        ]
+        for column in ("version", "modified_time", "indexes"):
+            if column not in existing:
+                self.conn.execute(
+                    "ALTER TABLE %s ADD COLUMN %s TEXT" % (GOOGLE_SHEETS_META_TABLE_NAME, column)
+                )
+        if "indexes" not in existing:
+            rows = self.conn.execute(
+                "SELECT sheet_id, columns FROM %s" % GOOGLE_SHEETS_META_TABLE_NAME
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE %s SET indexes = ? WHERE sheet_id = ?" % GOOGLE_SHEETS_META_TABLE_NAME,
+                [
+                    (orjson.dumps(column_indexes(orjson.loads(columns or "[]"))), sheet_id)
+                    for sheet_id, columns in rows
+                ],
+            )
+
+        (schema_version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if schema_version < CACHE_SCHEMA_VERSION:
+            # the tables of an older cache (or those the API creates before the first
+            # refresh) don't have what the query engine needs: fetch every sheet again
+            logger.info("Cache schema is outdated, every sheet will be fetched again")
+            for table, *_ in CACHE_TABLES:
+                self.conn.execute("DROP TABLE IF EXISTS %s" % table)
+            self.conn.execute("DELETE FROM %s" % GOOGLE_SHEETS_META_TABLE_NAME)
+            self.conn.execute("PRAGMA user_version = %d" % CACHE_SCHEMA_VERSION)
+            self._bump_version()
+        for table, schema, _, indexes in CACHE_TABLES:
+            self.conn.execute(schema % table)
+            for index in indexes:
+                self.conn.execute(
+                    "CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)"
+                    % (table, "_".join(index), table, ", ".join(index))
+                )
+
         self.conn.commit()
 
-    def insert_metadata(self, sheet_id, sheet_name, columns, types):
-        cur = self.conn.cursor()
+    def _bump_version(self):
+        # GoogleSheetsBackend.cache_version() reads this counter to notice that the cache
+        # changed, so it is bumped in the transaction of every write to the cache tables
+        self.conn.execute(
+            "INSERT INTO %s (id, version) VALUES (0, 1) "
+            "ON CONFLICT (id) DO UPDATE SET version = version + 1"
+            % GOOGLE_SHEETS_VERSION_TABLE_NAME
+        )
+
+    def sheet_versions(self):
+        """Returns the Drive version of every cached sheet, by sheet id"""
+        return dict(
+            self.conn.execute(
+                "SELECT sheet_id, version FROM %s" % GOOGLE_SHEETS_META_TABLE_NAME
+            ).fetchall()
+        )
+
+    def insert_metadata(
+        self, sheet_id, sheet_name, columns, types, version=None, modified_time=None
+    ):
+        self._insert_metadata(sheet_id, sheet_name, columns, types, version, modified_time)
+        self._bump_version()
+        self.conn.commit()
+
+    def _insert_metadata(self, sheet_id, sheet_name, columns, types, version, modified_time):
         insert = (
-            """INSERT INTO %s (sheet_id, sheet_name, columns, types) VALUES (?, ?, ?, ?)"""
+            """INSERT OR REPLACE INTO %s
+            (sheet_id, sheet_name, columns, types, version, modified_time, indexes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)"""
             % (GOOGLE_SHEETS_META_TABLE_NAME)
         )
         logger.info("Setting metadata for Sheet [%s] to %s", sheet_id, json.dumps(columns))
-        cur.execute(insert, (sheet_id, sheet_name, orjson.dumps(columns), orjson.dumps(types)))
-        self.conn.commit()
-        cur.close()
+        self.conn.execute(
+            insert,
+            (
+                sheet_id,
+                sheet_name,
+                orjson.dumps(columns),
+                orjson.dumps(types),
+                version,
+                modified_time,
+                orjson.dumps(column_indexes(columns or [])),
+            ),
+        )
 
     def clear(self, table):
         logger.info("Deleting anything existing in table '%s'..." % table)
         self.conn.execute("""DELETE from %s""" % table)
+        self._bump_version()
         self.conn.commit()
 
     def insert(self, sheet_id, data, table):
+        self._insert(sheet_id, data, table)
+        self._bump_version()
+        self.conn.commit()
 
-        query = """INSERT INTO %s (sheet_id, edge) VALUES (?, ?)""" % (table,)
+    def _related(self, table):
+        # the endpoint and value tables that go with an edge table, live or staging
+        suffix = table.removeprefix(GOOGLE_SHEETS_TABLE_NAME)
+        return GOOGLE_SHEETS_ENDPOINT_TABLE_NAME + suffix, GOOGLE_SHEETS_VALUE_TABLE_NAME + suffix
+
+    def _next_id(self, table):
+        # edge ids keep increasing across refreshes (and the staging tables), so the
+        # rows of unchanged sheets keep theirs
+        (last,) = self.conn.execute(
+            "SELECT max(coalesce((SELECT max(seq) FROM sqlite_sequence WHERE name IN (?, ?)), 0), "
+            "coalesce((SELECT max(id) FROM %s), 0))" % table,
+            (table, GOOGLE_SHEETS_TABLE_NAME),
+        ).fetchone()
+        return last + 1
+
+    def _insert(self, sheet_id, data, table):
+        endpoint_table, value_table = self._related(table)
+        queries = [
+            "INSERT INTO %s (id, sheet_id, name, edge) VALUES (?, ?, ?, ?)" % table,
+            "INSERT INTO %s (edge_id, sheet_id, position, name, latitude, longitude) "
+            "VALUES (?, ?, ?, ?, ?, ?)" % endpoint_table,
+            "INSERT INTO %s (edge_id, sheet_id, endpoint, field, value) "
+            "VALUES (?, ?, ?, ?, ?)" % value_table,
+        ]
 
-        inserts = []
-        for row in data:
-            # rearrange into SQL friendly tuples for insert
-            inserts.append((sheet_id, orjson.dumps(row)))
-        logger.info("Inserting %d records into '%s'" % (len(inserts), table))
-        self.conn.executemany(query, inserts)  # do bulk insert
+        rows = iter(data)
+        edge_id = self._next_id(table)
+        count = 0
+        while True:
+            # rearrange into SQL friendly tuples for insert, a batch at a time
+            edges, endpoints, values = [], [], []
+            for row in islice(rows, WRITE_BATCH_SIZE):
+                name = next(iter(scalars(row.get("name"))), None)
+                edges.append((edge_id, sheet_id, name, orjson.dumps(row)))
+                edge_endpoints, edge_values = normalize_edge(edge_id, sheet_id, row)
+                endpoints.extend(edge_endpoints)
+                values.extend(edge_values)
+                edge_id += 1
+            if not edges:
+                break
+            for query, inserts in zip(queries, (edges, endpoints, values)):
+                self.conn.executemany(query, inserts)  # do bulk insert
+            count += len(edges)
+        logger.info("Inserted %d records into '%s'" % (count, table))
+
+    def begin_refresh(self):
+        """
+        Starts loading the sheets that changed into staging tables. Stage them with
+        stage_sheet as they are fetched, then write them into the cache tables with
+        finish_refresh (or drop them with abort_refresh).
+        """
+        self._drop_staging()  # left by a failed refresh
+        for table, schema, _, _ in CACHE_TABLES:
+            self.conn.execute(schema % ("%s_staging" % table))
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS replaced (sheet_id TEXT)")
+        self.conn.commit()
+        self._staged = {}
+
+    def stage_sheet(self, sheet_id, metadata, rows):
+        """
+        Writes the rows of a changed sheet into the staging tables, in batches. Each sheet
+        is committed on its own, so the cache isn't locked while the next is fetched.
+        """
+        self._insert(sheet_id, rows, "%s_staging" % GOOGLE_SHEETS_TABLE_NAME)
         self.conn.commit()
+        self._staged[sheet_id] = metadata
+
+    def abort_refresh(self):
+        self.conn.rollback()
+        self._drop_staging()
+        self._staged = {}
+
+    def _drop_staging(self):
+        for table, *_ in CACHE_TABLES:
+            self.conn.execute("DROP TABLE IF EXISTS %s_staging" % table)
+        self.conn.commit()
+
+    def finish_refresh(self, removed=()):
+        """
+        Replaces the rows of the staged sheets with the staging tables, deleting the
+        sheets in removed.
+
+        The rows of the staged and removed sheets are deleted, the staged rows moved in
+        and the metadata changed in a single short transaction: readers see either the
+        previous or the new contents of the cache, never a partly written one. The rows
+        of unchanged sheets aren't touched.
+        """
+        removed = [sheet_id for sheet_id in removed if sheet_id not in self._staged]
+        if not self._staged and not removed:
+            logger.info("No sheets changed, keeping '%s' as it is" % GOOGLE_SHEETS_TABLE_NAME)
+            self.abort_refresh()
+            return
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM temp.replaced")
+            self.conn.executemany(
+                "INSERT INTO temp.replaced (sheet_id) VALUES (?)",
+                [(sheet_id,) for sheet_id in [*self._staged, *removed]],
+            )
+            for table, _, columns, _ in CACHE_TABLES:
+                self.conn.execute(
+                    "DELETE FROM %s WHERE sheet_id IN (SELECT sheet_id FROM temp.replaced)"
+                    % table
+                )
+                self.conn.execute(
+                    "INSERT INTO %s (%s) SELECT %s FROM %s_staging ORDER BY rowid"
+                    % (table, ", ".join(columns), ", ".join(columns), table)
+                )
+            for sheet_id in removed:
+                logger.info("Removing Sheet [%s], which is no longer shared", sheet_id)
+            self.conn.execute(
+                "DELETE FROM %s WHERE sheet_id IN (SELECT sheet_id FROM temp.replaced)"
+                % GOOGLE_SHEETS_META_TABLE_NAME
+            )
+            for sheet_id, sheet in self._staged.items():
+                self._insert_metadata(
+                    sheet_id,
+                    sheet["name"],
+                    sheet["columns"],
+                    sheet["types"],
+                    sheet["version"],
+                    sheet["modified_time"],
+                )
+            self._bump_version()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self._drop_staging()
+            self._staged = {}
 
 
 def enumerate_credentials():
@@ -144,209 +489,365 @@ def enumerate_credentials():
         return backend.list_credentials(sanitize=False).data
 
 
-def fetch():
-    # we'll collect metadata on each column in a sheet
-    sheet_metadata = defaultdict(lambda: {"name": "", "columns": [], "types": []})
-    # data output will be a dictionary of sheet ids, with a list of documents for each sheet.
-    output = {}
-    malformed_sheets = set()
-
-    for user_token in enumerate_credentials():
-
-        creds = None
-        try:
-            creds = service_account.Credentials.from_service_account_info(
-                user_token, scopes=SCOPES
-            )
-        except Exception as e:
-            print(e)
-
-        # in the case that we don't have a valid live credential from google
-        if not creds or not creds.valid:
-            # we may have an expired credential that can be refreshed. If so, refresh it.
-            if creds and creds.refresh:
-                creds.refresh(Request())
-            # otherwise, we don't have credentials. If this is the case, run
-            # the browser workflow to get new credentials.
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-                creds = flow.run_local_server(port=0)
-
-        try:
-            service = build("drive", "v3", credentials=creds, cache_discovery=False)
-
-            paginated_sheets = (
-                service.files()
-                .list(
+def make_credentials(user_token):
+    creds = None
+    try:
+        creds = service_account.Credentials.from_service_account_info(user_token, scopes=SCOPES)
+    except Exception as e:
+        print(e)
+
+    # in the case that we don't have a valid live credential from google
+    if not creds or not creds.valid:
+        # we may have an expired credential that can be refreshed. If so, refresh it.
+        if creds and creds.refresh:
+            creds.refresh(Request())
+        # otherwise, we don't have credentials. If this is the case, run
+        # the browser workflow to get new credentials.
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
+            creds = flow.run_local_server(port=0)
+    return creds
+
+
+class SheetsClient:
+    """
+    The Drive and Sheets services for one credential. Building a service parses its
+    discovery document, so each is built once and shared by every fetch thread; each
+    thread makes its requests over its own connection, as httplib2 isn't thread safe.
+    """
+
+    def __init__(self, creds):
+        self.creds = creds
+        drive = build(
+            "drive",
+            "v3",
+            credentials=creds,
+            cache_discovery=False,
+            client_options=CLIENT_OPTIONS["drive"],
+        )
+        sheets = build(
+            "sheets",
+            "v4",
+            credentials=creds,
+            cache_discovery=False,
+            client_options=CLIENT_OPTIONS["sheets"],
+        )
+        # resources are built (docstrings and all) on every access, so they're kept too
+        self.files = drive.files()
+        self.values = sheets.spreadsheets().values()
+        self._local = threading.local()
+
+    def execute(self, request):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self.creds, http=httplib2.Http())
+        for attempt in range(FETCH_RETRIES + 1):
+            try:
+                return request.execute(http=http)
+            except HttpError as err:
+                if err.resp.status not in TRANSIENT_STATUSES or attempt == FETCH_RETRIES:
+                    raise
+                delay = RETRY_BACKOFF * 2**attempt
+                logger.info("Google answered %s, retrying in %.1fs", err.resp.status, delay)
+                time.sleep(delay)
+
+    def list_sheets(self):
+        """Yields every spreadsheet shared with the credential, a page at a time"""
+        page_token = None
+        while True:
+            page = self.execute(
+                self.files.list(
                     q="mimeType='application/vnd.google-apps.spreadsheet'",
-                    fields="nextPageToken, files(id, name)",
+                    fields="nextPageToken, files(id, name, version, modifiedTime)",
+                    pageSize=LIST_PAGE_SIZE,
+                    pageToken=page_token,
                 )
-                .execute()
             )
-
-            sheet_list = paginated_sheets.get("files", [])
-
-            if not sheet_list:
-                print("no sheets found for this user account")
+            yield from page.get("files", [])
+            page_token = page.get("nextPageToken")
+            if not page_token:
                 return
 
-            for target_sheet in sheet_list:
-                logger.info(
-                    "Working on Sheet '%s' with ID [%s]", target_sheet["id"], target_sheet["name"]
-                )  # corresponds to `files(id, name)` above
-
-                sheet_metadata[target_sheet["id"]]["name"] = target_sheet["name"]
-                service = build("sheets", "v4", credentials=creds, cache_discovery=False)
-
-                data = {"nodes": {}, "edges": []}
-
-                sheet_id = target_sheet["id"]
-                sheet_name = target_sheet["name"]
-                node_metadata = {"columns": [], "types": []}
-
-                for datatype, cell_range in DATATYPES.items():
-                    expected_columns = EXPECTED_COLUMNS[cell_range]
-                    try:
-                        rows = (
-                            service.spreadsheets()
-                            .values()
-                            .get(spreadsheetId=target_sheet.get("id", ""), range=cell_range)
-                            .execute()
+    def get_ranges(self, sheet_id):
+        """Returns the rows of every range in DATATYPES, by range, in one request"""
+        response = self.execute(
+            self.values.batchGet(spreadsheetId=sheet_id, ranges=list(DATATYPES.values()))
+        )
+        # value ranges come back in the order they were asked for
+        return {
+            cell_range: value_range.get("values")
+            for cell_range, value_range in zip(DATATYPES.values(), response["valueRanges"])
+        }
+
+
+def parse_sheet(ranges):
+    """
+    Turns the rows of a sheet's Nodes and Edges ranges into its edge documents.
+
+    Returns (columns, types, edges): the edge columns, including the node columns
+    prefixed with "endpoints_", whether each is a scalar or an array, and the edges.
+    """
+    data = {"nodes": {}, "edges": []}
+    columns, types = [], []
+    node_metadata = {"columns": [], "types": []}
+
+    for datatype, cell_range in DATATYPES.items():
+        expected_columns = EXPECTED_COLUMNS[cell_range]
+        # rows is e.g.
+        # [
+        #    ['src', 'dst', 'datetime', 'in_bits', 'out_bits', 'src_total', 'src_lat', 'src_lng', 'dst_lat', 'dst_lng'],  # noqa E501
+        #    ['A', 'B', '2024-12-02 15:48:06', '262825379206', '74598253223', '74598253223', '42', '-104', '42', '-91'],  # noqa E501
+        #    ['B', 'C', '2024-12-02 15:48:06', '375057078131', '372930983029', '449655331354', '42', '-91', '34', '-98']  # noqa E501
+        # ]
+        rows = ranges[cell_range]
+        # data_to_cache is now a list of arrays. Populate a hash of indexes for columns
+        header = rows[0]
+        column_positions = defaultdict(list, deepcopy(expected_columns))
+        known_columns = []
+        for expected_column in expected_columns:
+            case_insensitive_header = [column.lower() for column in header]
+            column_index = case_insensitive_header.index(expected_column.lower())
+            # add the column index to the column_positions datastructure
+            column_positions[expected_column].append(column_index)
+            # and add the column index to the known_columns
+            known_columns.append(column_index)
+        for idx, column_name in enumerate(header):
+            if idx not in known_columns:
+                column_positions[column_name.lower()].append(idx)
+        # if our datatype is "nodes", we need to make a
+        # list of the columns available for each node
+        if datatype == "nodes":
+            for column, positions in column_positions.items():
+                node_metadata["columns"].append(column)
+                node_metadata["types"].append("scalar" if len(positions) in [0, 1] else "array")
+        # if the datatype is "edges" we need to add each
+        # of the columns for the edge sheet, as well
+        # as each of the columns from the node sheet.
+        # The columns from the node sheet will be prefixed with "endpoint"
+        if datatype == "edges":
+            for column, positions in column_positions.items():
+                columns.append(column)
+                types.append("scalar" if len(positions) in [0, 1] else "array")
+            for idx, col in enumerate(node_metadata["columns"]):
+                columns.append("endpoints_%s" % col.lower())
+                types.append(node_metadata["types"][idx])
+        # we now have a datastructure like:
+        # column_positions = {
+        #   "Name": [0],
+        #   "Description": [1],
+        #   "Source": [2],
+        #   "Destination": [3],
+        #   "Meta1": [4, 5, 6],
+        #   "Meta2": [7, 8, 9, 10]
+        # }
+        # for the rest of the rows, excluding the
+        # header, compose a document to be cached.
+        for row in rows[1:]:
+            doc = {}
+            # the key order of DATATYPES guarantees
+            # that we'll compile the list of nodes first
+            if datatype == "edges":
+                doc["endpoints"] = [
+                    data["nodes"][row[column_positions["source"][0]]],
+                    data["nodes"][row[column_positions["destination"][0]]],
+                ]
+                if "source" in doc:
+                    del doc["source"]
+                if "destination" in doc:
+                    del doc["destination"]
+
+            for column, positions in column_positions.items():
+                # if we somehow have a column with no values (?),
+                # skip it and continue with the next column
+                if len(positions) == 0:
+                    continue
+                # if we have a column with exactly one value,
+                # we'll just set it on the target document
+                elif len(positions) == 1:
+                    doc[column] = row[positions[0]]
+                # if we have a metadata column with multiple values,
+                # we'll create an array of values for the target document
+                elif len(positions) > 1:
+                    col_value = []
+                    for position in positions:
+                        try:
+                            col_value.append(row[position])
+                        except IndexError:
+                            # no value for this position
+                            pass
+                    doc[column] = col_value
+
+            if datatype == "nodes":
+                data[datatype][doc["name"]] = doc
+            elif datatype == "edges":
+                data[datatype].append(doc)
+
+    return columns, types, data["edges"]
+
+
+def fetch_sheet(client, target_sheet):
+    """
+    Fetches and parses one sheet. Returns (metadata, edges); a sheet that doesn't
+    follow the Terranova format has no columns and no edges. Other errors from Google
+    (e.g. a 503) are raised: the sheet isn't known to be malformed.
+    """
+    logger.info(
+        "Working on Sheet '%s' with ID [%s]", target_sheet["id"], target_sheet["name"]
+    )  # corresponds to `files(id, name)` above
+    metadata = {
+        "name": target_sheet["name"],
+        "columns": [],
+        "types": [],
+        "version": target_sheet.get("version"),
+        "modified_time": target_sheet.get("modifiedTime"),
+        "malformed": False,
+    }
+    try:
+        ranges = client.get_ranges(target_sheet["id"])
+    except HttpError as err:
+        if err.resp.status != 400:
+            raise
+        # a missing Nodes or Edges sheet fails the whole request with "Unable to parse range"
+        metadata["malformed"] = True
+        return metadata, []
+    try:
+        metadata["columns"], metadata["types"], edges = parse_sheet(ranges)
+    except (TypeError, ValueError, KeyError, IndexError):
+        # empty ranges, missing columns or edges between unknown nodes
+        metadata["malformed"] = True
+        return metadata, []
+    return metadata, edges
+
+
+class SheetsFetch:
+    """
+    Iterating over a SheetsFetch fetches the sheets shared with each credential,
+    skipping those whose Drive version is the one in known_versions (sheet id =>
+    version, see CacheWriter.sheet_versions), and yields (sheet_id, metadata, edges)
+    for each as soon as it has been fetched.
+
+    Sheets are fetched concurrently, but at most GOOGLE_SHEETS_FETCH_CONCURRENCY are
+    being fetched or waiting to be consumed at any time, so memory use doesn't grow
+    with the number of sheets.
+
+    Sheets that couldn't be fetched are left out, and their ids kept in `failed`: the
+    cache keeps their rows and version, so they are fetched again on the next refresh.
+
+    Once iterated, `seen` holds the ids of every sheet shared with the credentials, or
+    None if the sheets of some credential couldn't be listed.
+    """
+
+    def __init__(self, known_versions=None):
+        self.known_versions = known_versions or {}
+        self.seen = set()
+        self.malformed = set()
+        self.failed = set()
+        self.listed_all = True
+
+    def _changed_sheets(self):
+        for token in enumerate_credentials():
+            client = SheetsClient(make_credentials(token))
+            found = False
+            try:
+                for target_sheet in client.list_sheets():
+                    found = True
+                    # a sheet shared with several credentials is fetched once
+                    if target_sheet["id"] in self.seen:
+                        continue
+                    self.seen.add(target_sheet["id"])
+                    # Drive increments a file's version on every change to it
+                    version = target_sheet.get("version")
+                    known_version = self.known_versions.get(target_sheet["id"])
+                    if version is not None and known_version == version:
+                        logger.info(
+                            "Sheet '%s' with ID [%s] is unchanged since version %s, skipping",
+                            target_sheet["name"],
+                            target_sheet["id"],
+                            version,
                         )
-                    except HttpError:
-                        malformed_sheets.add(sheet_name)
                         continue
-                    # 'rows' is now e.g.
-                    # {'range': "'--'!A1:J2161", 'majorDimension': 'ROWS', 'values': [
-                    #    ['src', 'dst', 'datetime', 'in_bits', 'out_bits', 'src_total', 'src_lat', 'src_lng', 'dst_lat', 'dst_lng'],  # noqa E501
-                    #    ['A', 'B', '2024-12-02 15:48:06', '262825379206', '74598253223', '74598253223', '42', '-104', '42', '-91'],  # noqa E501
-                    #    ['B', 'C', '2024-12-02 15:48:06', '375057078131', '372930983029', '449655331354', '42', '-91', '34', '-98']  # noqa E501
-                    # ] }
-                    rows = rows.get("values")
-                    # data_to_cache is now a list of arrays. Populate a hash of indexes for columns
-                    header = rows[0]
-                    column_positions = defaultdict(list, deepcopy(expected_columns))
-                    known_columns = []
-                    for expected_column in expected_columns:
-                        case_insensitive_header = [column.lower() for column in header]
-                        column_index = case_insensitive_header.index(expected_column.lower())
-                        # add the column index to the column_positions datastructure
-                        column_positions[expected_column].append(column_index)
-                        # and add the column index to the known_columns
-                        known_columns.append(column_index)
-                    for idx, column_name in enumerate(header):
-                        if idx not in known_columns:
-                            column_positions[column_name.lower()].append(idx)
-                    # if our datatype is "nodes", we need to make a
-                    # list of the columns available for each node
-                    if datatype == "nodes":
-                        for column, positions in column_positions.items():
-                            node_metadata["columns"].append(column)
-                            node_metadata["types"].append(
-                                "scalar" if len(positions) in [0, 1] else "array"
-                            )
-                    # if the datatype is "edges" we need to add each
-                    # of the columns for the edge sheet, as well
-                    # as each of the columns from the node sheet.
-                    # The columns from the node sheet will be prefixed with "endpoint"
-                    if datatype == "edges":
-                        for column, positions in column_positions.items():
-                            sheet_metadata[sheet_id]["columns"].append(column)
-                            sheet_metadata[sheet_id]["types"].append(
-                                "scalar" if len(positions) in [0, 1] else "array"
-                            )
-                        for idx, col in enumerate(node_metadata["columns"]):
-                            sheet_metadata[sheet_id]["columns"].append(
-                                "endpoints_%s" % col.lower()
-                            )
-                            sheet_metadata[sheet_id]["types"].append(node_metadata["types"][idx])
-                    # we now have a datastructure like:
-                    # column_positions = {
-                    #   "Name": [0],
-                    #   "Description": [1],
-                    #   "Source": [2],
-                    #   "Destination": [3],
-                    #   "Meta1": [4, 5, 6],
-                    #   "Meta2": [7, 8, 9, 10]
-                    # }
-                    # for the rest of the rows, excluding the
-                    # header, compose a document to be cached.
-                    for row in rows[1:]:
-                        doc = {}
-                        # the key order of DATATYPES guarantees
-                        # that we'll compile the list of nodes first
-                        if datatype == "edges":
-                            doc["endpoints"] = [
-                                data["nodes"][row[column_positions["source"][0]]],
-                                data["nodes"][row[column_positions["destination"][0]]],
-                            ]
-                            if "source" in doc:
-                                del doc["source"]
-                            if "destination" in doc:
-                                del doc["destination"]
-
-                        for column, positions in column_positions.items():
-                            # if we somehow have a column with no values (?),
-                            # skip it and continue with the next column
-                            if len(positions) == 0:
-                                continue
-                            # if we have a column with exactly one value,
-                            # we'll just set it on the target document
-                            elif len(positions) == 1:
-                                doc[column] = row[positions[0]]
-                            # if we have a metadata column with multiple values,
-                            # we'll create an array of values for the target document
-                            elif len(positions) > 1:
-                                col_value = []
-                                for position in positions:
-                                    try:
-                                        col_value.append(row[position])
-                                    except IndexError:
-                                        # no value for this position
-                                        pass
-                                doc[column] = col_value
-
-                        if datatype == "nodes":
-                            data[datatype][doc["name"]] = doc
-                        elif datatype == "edges":
-                            data[datatype].append(doc)
-
-                output[sheet_id] = data["edges"]
-
-        # receiving an HTTP Error here means that something
-        # went drastically wrong fetching the data/credential from google
-        except HttpError as err:
-            # print it and give up on this credential
-            # (continue with next credential)
-            print(err)
-            continue
-
-        if malformed_sheets:
-            formatted_malformed_sheets = "\n    • %s" % "\n    • ".join(list(malformed_sheets))
+                    yield client, target_sheet
+            # receiving an HTTP Error here means that something
+            # went drastically wrong fetching the data/credential from google
+            except HttpError as err:
+                # print it and give up on this credential
+                # (continue with next credential)
+                print(err)
+                # we don't know which sheets this credential can see, so none can be
+                # assumed to be gone
+                self.listed_all = False
+                continue
+            if not found:
+                logger.info("no sheets found for this user account")
+
+    def _completed(self, pending, return_when=FIRST_COMPLETED):
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            sheet_id = pending.pop(future)
+            try:
+                metadata, edges = future.result()
+            except Exception as err:
+                # e.g. an error Google kept answering with, or a network failure
+                logger.warning(
+                    "Unable to fetch Sheet [%s], keeping its cached rows: %s", sheet_id, err
+                )
+                self.failed.add(sheet_id)
+                continue
+            if metadata.pop("malformed"):
+                self.malformed.add(metadata["name"])
+            yield sheet_id, metadata, edges
+
+    def __iter__(self):
+        with ThreadPoolExecutor(max_workers=GOOGLE_SHEETS_FETCH_CONCURRENCY) as executor:
+            pending = {}
+            for client, target_sheet in self._changed_sheets():
+                while len(pending) >= GOOGLE_SHEETS_FETCH_CONCURRENCY:
+                    yield from self._completed(pending)
+                pending[executor.submit(fetch_sheet, client, target_sheet)] = target_sheet["id"]
+            while pending:
+                yield from self._completed(pending, ALL_COMPLETED)
+
+        if self.malformed:
+            formatted_malformed_sheets = "\n    • %s" % "\n    • ".join(list(self.malformed))
             logger.warning(BAD_FORMAT_MESSAGE, formatted_malformed_sheets)
-
-        return (output, sheet_metadata)
+        if not self.listed_all:
+            self.seen = None
 
 
 def main():
+    """
+    Refreshes the cache. Returns counts of the sheets fetched, the edge rows written,
+    the sheets removed, the malformed sheets and the sheets that couldn't be fetched,
+    which the datacacher reports.
+    """
     writer = CacheWriter()
-    logger.info("clearing sheet metadata and sheet rows")
-    writer.clear(GOOGLE_SHEETS_META_TABLE_NAME)
-    writer.clear(GOOGLE_SHEETS_TABLE_NAME)
-    records, metadata = fetch()
-
-    for sheet_id, rows in records.items():
-        logger.info("Fetched %s Edge rows from Google Sheet with ID [%s]", len(rows), sheet_id)
-        writer.insert_metadata(
-            sheet_id,
-            metadata[sheet_id]["name"],
-            metadata[sheet_id]["columns"],
-            metadata[sheet_id]["types"],
-        )
-        logger.info(
-            "Inserting %s rows into '%s' for [%s]", len(rows), GOOGLE_SHEETS_TABLE_NAME, sheet_id
-        )
-        writer.insert(sheet_id, rows, GOOGLE_SHEETS_TABLE_NAME)
+    known_versions = writer.sheet_versions()
+    sheets = SheetsFetch(known_versions)
+    fetched = rows_written = 0
+
+    writer.begin_refresh()
+    try:
+        for sheet_id, metadata, rows in sheets:
+            logger.info(
+                "Fetched %s Edge rows from Google Sheet with ID [%s]", len(rows), sheet_id
+            )
+            writer.stage_sheet(sheet_id, metadata, rows)
+            fetched += 1
+            rows_written += len(rows)
+        # sheets that are no longer shared with any credential
+        removed = set(known_versions) - sheets.seen if sheets.seen is not None else set()
+        writer.finish_refresh(removed)
+    except Exception:
+        writer.abort_refresh()
+        raise
+
+    return {
+        "sheets_fetched": fetched,
+        "rows_written": rows_written,
+        "sheets_removed": len(removed),
+        "sheets_malformed": len(sheets.malformed),
+        "sheets_failed": len(sheets.failed),
+    }
 
 
 if __name__ == "__main__":
@@ -40,6 +40,10 @@ def _decode_field(field_name):
     return (field_name, operator)
 
 
+# query parameters of the edges route that aren't filters
+PAGE_PARAMS = ("limit", "after", "count")
+
+
 @router.get("/sheets/{sheet_id}/edges/")
 @version(1)
 def edges(
@@ -47,8 +51,15 @@ def edges(
     sheet_id: str,
     filters: TypeFilters = Depends(),
     limit: int = 10,
+    after: int | None = None,
+    count: bool = True,
     user: User = Security(auth_check, scopes=[TOKEN_SCOPES["read"]]),
 ) -> List[Edge]:
+    """
+    Returns a page of the sheet's edges that match the filters. The next page starts
+    after the edge in the X-Next-After header, which is only sent if there may be more.
+    X-Result-Count holds the number of matching edges, unless count is false.
+    """
     filts = []
     # in other contexts we would do something like this
     # filts = [f for f in filters if f.value]
@@ -57,6 +68,8 @@ def edges(
     # deal with the case where we have multiple values for each field
     for field_tuple in request.query_params.multi_items():
         name, value = field_tuple
+        if name in PAGE_PARAMS:
+            continue
         query_params[name].append(value)
     # then create filters from the field/value list pairs
     for fld, value in query_params.items():
@@ -68,11 +81,14 @@ def edges(
                 value=value,
             )
         )
-    response = backend.query(filts, sheet_id=sheet_id, limit=limit)
-    headers = {
-        "X-Result-Count": "%s" % response.count,
-        "Access-Control-Expose-Headers": "X-Result-Count",
-    }
+    response = backend.query(filts, sheet_id=sheet_id, limit=limit, after=after, count=count)
+    headers = {}
+    if response.count is not None:
+        headers["X-Result-Count"] = "%s" % response.count
+    if response.next_after is not None:
+        headers["X-Next-After"] = "%s" % response.next_after
+    if headers:
+        headers["Access-Control-Expose-Headers"] = ", ".join(headers)
     return JSONResponse(content=response.data, headers=headers)
 
 
@@ -20,6 +20,8 @@ def configure():
             # (see: dynamic)
         credential_type: static
         cache_file: /var/tmp/google_sheets.sqlite
+        # requests to Google made at the same time during a cache refresh
+        fetch_concurrency: 8
         static:
             token_files:
                 # these are provisioned by creating a service account,
@@ -51,6 +53,17 @@ def configure():
     settings.GOOGLE_SHEETS_META_TABLE_NAME = GOOGLE_SHEETS.get(
         "metadata_table_name", "sheet_metadata"
     )
+    # the edges broken down for the query engine: their endpoints, and the values of
+    # every other column
+    settings.GOOGLE_SHEETS_ENDPOINT_TABLE_NAME = "%s_endpoints" % settings.GOOGLE_SHEETS_TABLE_NAME
+    settings.GOOGLE_SHEETS_VALUE_TABLE_NAME = "%s_values" % settings.GOOGLE_SHEETS_TABLE_NAME
+    # a counter the fetcher bumps whenever it changes the cache
+    settings.GOOGLE_SHEETS_VERSION_TABLE_NAME = (
+        "%s_version" % settings.GOOGLE_SHEETS_META_TABLE_NAME
+    )
+
+    # requests to Google made at the same time during a cache refresh
+    settings.GOOGLE_SHEETS_FETCH_CONCURRENCY = GOOGLE_SHEETS.get("fetch_concurrency", 8)
 
     # # either 'static' (sourced from env vars) or 'dynamic' (AES-256 encrypted and ES-backed)
     settings.GOOGLE_SHEETS_CREDENTIAL_SOURCE = GOOGLE_SHEETS.get("credential_type", "static")
@@ -18,8 +18,10 @@ class TerranovaNotFoundException(Exception):
 
 # Pydantic Models for data output
 class QueryResult(BaseModel):
-    count: int
+    count: int | None
     data: List
+    # where the next page starts, for results paged with a cursor
+    next_after: Any = None
 
 
 class Tag(BaseModel):
@@ -235,6 +237,13 @@ class Template(BaseModel):
     #     allow_population_by_field_name = True
 
 
+class BulkImport(BaseModel):
+    # complete revisions, eg. as listed by the API with version=all and every field
+    maps: List[Map] = []
+    datasets: List[Dataset] = []
+    templates: List[Template] = []
+
+
 class ScopeEnum(str, Enum):
     read = TOKEN_SCOPES["read"]
     write = TOKEN_SCOPES["write"]
@@ -0,0 +1,229 @@
+"""
+Cache of rendered dataset topologies.
+
+Rendering a dataset queries its datasource, renders every node template and, for the
+logical layout, runs graphviz. The output only depends on the dataset revision, the
+layout, datatype and output type, the node template, the query parameters (templated
+filters read them) and, for live data, the contents of the datasource's cache. The
+output route looks results up here under a key made from all of these.
+
+Entries are kept in memory, least recently used first out, and optionally in a SQLite
+file that every server process shares.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import orjson as json
+
+from terranova.abstract_models import Topology
+from terranova.logging import logger
+from terranova.settings import (
+    TOPOLOGY_CACHE_SIZE,
+    TOPOLOGY_CACHE_FILE,
+    TOPOLOGY_CACHE_FILE_SIZE,
+)
+
+
+def topology_key(
+    dataset_id: str,
+    version: int,
+    layout: str,
+    datatype: str,
+    output_type: str,
+    node_template: str,
+    query_params,
+    source_version=None,
+) -> str:
+    """
+    Returns the cache key for a dataset output.
+
+    :param str dataset_id:              The dataset
+    :param int version:                 The dataset's resolved version (not 'latest')
+    :param str layout:                  geographic or logical
+    :param str datatype:                live or snapshot
+    :param str output_type:             json or svg
+    :param str node_template:           The node template source
+    :param query_params:                The query parameters the output is rendered from (the
+                                        values of templated filters), as (name, value) pairs
+    :param source_version:              The datasource's cache version, for live data
+    :returns: The key
+    """
+    parts = [
+        dataset_id,
+        version,
+        layout,
+        datatype,
+        output_type,
+        hashlib.sha256(node_template.encode()).hexdigest(),
+        # the order of parameters doesn't change the output, so it isn't part of the key
+        sorted([list(pair) for pair in query_params]),
+        str(source_version),
+    ]
+    return hashlib.sha256(json.dumps(parts)).hexdigest()
+
+
+class TopologyCache:
+    """
+    Bounded cache of rendered dataset outputs: a Topology, or SVG markup.
+
+    Every entry belongs to a datasource endpoint and records the endpoint's cache version
+    (see BaseDatasource.cache_version) it was rendered from; None for snapshot output,
+    which doesn't read the datasource. When an endpoint's cache version changes, its
+    live entries are dropped.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TOPOLOGY_CACHE_SIZE,
+        path: str = TOPOLOGY_CACHE_FILE,
+        max_file_entries: int = TOPOLOGY_CACHE_FILE_SIZE,
+    ):
+        self.max_entries = max_entries
+        self.path = path
+        self.max_file_entries = max_file_entries
+        self._entries = OrderedDict()  # key => (endpoint, source version, value)
+        self._versions = {}  # endpoint => latest source version seen
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=wal")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS topologies
+                (key TEXT PRIMARY KEY,
+                 endpoint TEXT,
+                 source_version TEXT,
+                 kind TEXT,
+                 value BLOB,
+                 accessed REAL)
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _check_version(self, endpoint: str, source_version):
+        # called with the lock held
+        if source_version is None or self._versions.get(endpoint) == source_version:
+            return
+        self._versions[endpoint] = source_version
+        stale = [
+            key
+            for key, (entry_endpoint, entry_version, _) in self._entries.items()
+            if entry_endpoint == endpoint and entry_version not in (None, source_version)
+        ]
+        for key in stale:
+            del self._entries[key]
+        if self.path:
+            try:
+                self.conn.execute(
+                    "DELETE FROM topologies WHERE endpoint = ? AND source_version IS NOT NULL "
+                    "AND source_version != ?",
+                    (endpoint, str(source_version)),
+                )
+                self.conn.commit()
+            except sqlite3.Error as e:
+                logger.warning("Unable to write topology cache file %s: %s" % (self.path, e))
+
+    def get(self, key: str, endpoint: str, source_version=None):
+        """
+        Returns the cached output for key, or None. Reads the cache file if there is
+        one, so call it off the event loop.
+        """
+        with self._lock:
+            self._check_version(endpoint, source_version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            value = self._read_file(key) if self.path else None
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, endpoint, source_version, value)
+            return value
+
+    def set(self, key: str, endpoint: str, source_version, value):
+        """Stores a Topology or SVG markup under key"""
+        with self._lock:
+            self._check_version(endpoint, source_version)
+            self._store(key, endpoint, source_version, value)
+            if self.path:
+                self._write_file(key, endpoint, source_version, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            if self.path:
+                try:
+                    self.conn.execute("DELETE FROM topologies")
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning("Unable to clear topology cache file %s: %s" % (self.path, e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _store(self, key, endpoint, source_version, value):
+        self._entries[key] = (endpoint, source_version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_file(self, key):
+        try:
+            row = self.conn.execute(
+                "SELECT kind, value FROM topologies WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE topologies SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            # the cache file is an optimization; fall back to rendering
+            logger.warning("Unable to read topology cache file %s: %s" % (self.path, e))
+            return None
+        kind, value = row
+        if kind == "svg":
+            return value.decode()
+        return Topology(**json.loads(value))
+
+    def _write_file(self, key, endpoint, source_version, value):
+        if isinstance(value, str):
+            kind, payload = "svg", value.encode()
+        else:
+            kind, payload = "topology", json.dumps(value.model_dump())
+        version = str(source_version) if source_version is not None else None
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO topologies "
+                "(key, endpoint, source_version, kind, value, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, version, kind, payload, time.time()),
+            )
+            self.conn.execute(
+                "DELETE FROM topologies WHERE key IN "
+                "(SELECT key FROM topologies ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_file_entries,),
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.warning("Unable to write topology cache file %s: %s" % (self.path, e))
+
+
+topology_cache = TopologyCache()
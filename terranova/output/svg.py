@@ -1,9 +1,10 @@
 from pygraphviz import AGraph
 from terranova.models import Map
 from terranova.abstract_models import Topology
-from jinja2 import Template as JinjaTemplate
+from terranova.output.templates import compile_template
 from terranova.settings import SVG_OUTPUT_TEMPLATE
 import orjson as json
+from typing import Any, Dict, List
 
 
 def render_svg(topology: Topology):
@@ -67,18 +68,24 @@ def compute_path(edge, quadratic=False):
     return " ".join(output)
 
 
-def render_map_svg(map_instance: Map):
+def render_map_svg(map_instance: Map, topologies: List[Dict[str, Any] | None] = None):
     """
-    Takes a map instance
+    Takes a map instance and, optionally, the topology of each of its layers as
+    returned by output._normalize_map (modified in place). Layers without one are
+    read from their mapjson.
 
     Outputs an SVG rendering of the map
     """
-    templ = JinjaTemplate(SVG_OUTPUT_TEMPLATE)
+    templ = compile_template(SVG_OUTPUT_TEMPLATE)
 
-    map_instance = map_instance.model_dump()
-    configuration = map_instance["configuration"]
+    configuration = map_instance.configuration.model_dump()
 
-    layers = [json.loads(layer["mapjson"]) for layer in configuration["layers"]]
+    if topologies is None:
+        topologies = [None] * len(configuration["layers"])
+    layers = [
+        topology if topology is not None else json.loads(layer["mapjson"])
+        for topology, layer in zip(topologies, configuration["layers"])
+    ]
     viewbox = {"min": {"y": 0, "x": 0}, "max": {"y": 0, "x": 0}, "delta": {"y": 0, "x": 0}}
     LATLNG_SCALE_FACTOR = 11
     for idx, layer in enumerate(layers):
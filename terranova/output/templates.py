@@ -0,0 +1,114 @@
+import functools
+from typing import Any, Dict, Tuple
+
+from jinja2 import Environment, meta, nodes
+from jinja2 import Template as JinjaTemplate
+
+# distinct template sources kept compiled; node templates are user-editable, so this
+# bounds the memory used by old revisions that are no longer rendered
+TEMPLATE_CACHE_SIZE = 256
+
+_environment = Environment()
+_MISSING = object()  # a value that's absent renders differently from one that's None
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(source: str) -> JinjaTemplate:
+    """
+    Returns the compiled Jinja template for source, compiling it only on the first call
+    for a given source. The result is shared between callers and threads, which is safe
+    as rendering never modifies a compiled template.
+
+    :param str source:                  The template markup
+    :returns: The compiled template
+    """
+    return JinjaTemplate(source)
+
+
+def _reference(node: nodes.Node):
+    # the path of a chain of constant lookups on a variable, e.g. meta.type or
+    # meta["type"] => ("meta", "type"), or None if node is anything else. Lookups of
+    # dict attributes (meta.items, ...) end the chain, as Jinja resolves those first.
+    keys = []
+    while True:
+        if isinstance(node, nodes.Getattr) and not hasattr(dict, node.attr):
+            keys.append(node.attr)
+        elif (
+            isinstance(node, nodes.Getitem)
+            and isinstance(node.arg, nodes.Const)
+            and isinstance(node.arg.value, str)
+        ):
+            keys.append(node.arg.value)
+        else:
+            break
+        node = node.node
+    if isinstance(node, nodes.Name) and node.ctx == "load":
+        return (node.name, *reversed(keys))
+    return None
+
+
+def _collect_references(node: nodes.Node, names, references: set):
+    path = _reference(node)
+    if path is not None and path[0] in names:
+        references.add(path)
+        return
+    for child in node.iter_child_nodes():
+        _collect_references(child, names, references)
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def template_references(source: str) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Returns the parts of the render context that the template in source reads, as
+    paths: ("endpoint_name",) for a whole variable, ("meta", "type") for meta.type.
+    Nothing else passed to render() can change its output.
+
+    :param str source:                  The template markup
+    :returns: The paths, sorted
+    """
+    ast = _environment.parse(source)
+    references = set()
+    _collect_references(ast, meta.find_undeclared_variables(ast), references)
+    return tuple(sorted(references))
+
+
+def _freeze(value: Any):
+    # 1, 1.0 and True are equal but render differently, as do lists and tuples, so the
+    # type is part of the key. Dicts keep their order, which a template can iterate.
+    if isinstance(value, dict):
+        return (dict, tuple((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_freeze(v) for v in value))
+    hash(value)
+    return (type(value), value)
+
+
+def _lookup(context: Dict[str, Any], path: Tuple[str, ...]):
+    if path[0] not in context:
+        return _MISSING
+    value = context[path[0]]
+    for key in path[1:]:
+        if not isinstance(value, dict):
+            # not a plain lookup any more; the whole value decides the output
+            break
+        if key not in value:
+            return _MISSING
+        value = value[key]
+    return _freeze(value)
+
+
+def render_key(context: Dict[str, Any], references: Tuple[Tuple[str, ...], ...]):
+    """
+    Returns a hashable key of the values at the paths (from template_references) in
+    context: two contexts with the same key render to the same output.
+    Returns None if a value can't be used as a key, in which case the caller should
+    just render the template.
+
+    :param dict context:                The keyword arguments for render()
+    :param tuple references:            The paths the template reads
+    :returns: The key, or None
+    """
+    try:
+        return tuple(_lookup(context, path) for path in references)
+    except TypeError:
+        return None
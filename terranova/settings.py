@@ -24,12 +24,20 @@ SERVICENAME = "terranova"
 
 STORAGE = config.get("storage", {})  # Storage backend configuration
 STORAGE_BACKEND = STORAGE.get("backend", "sqlite")  # Default to sqlite for simplicity
+# read-through cache for map, dataset and template lookups by id made by the API, of the
+# latest or a specific version. cache_size is the number of (entity, id, version)
+# entries kept, 0 disables the cache; cache_ttl (seconds) bounds how long a revision
+# saved by another process (e.g. another uvicorn worker) can go unnoticed.
+STORAGE_CACHE_SIZE = STORAGE.get("cache_size", 1024)
+STORAGE_CACHE_TTL = STORAGE.get("cache_ttl", 30)
 
 ELASTIC = config.get("elastic", {})  # default to empty dict so we can set further defaults
 AUTH = config.get("auth", {})
 KEYCLOAK = config.get("keycloak", {})  # default to empty dict so we can set further defaults
 BASIC_AUTH = config.get("basic_auth", {})
 OTLP = config.get("otlp", {})
+OUTPUT = config.get("output", {})
+DATACACHER = config.get("datacacher", {})
 
 DATASOURCES = config.get("datasources", {})
 if DATASOURCES is None:
@@ -38,6 +46,22 @@ if DATASOURCES is None:
 ELASTIC_USER = ELASTIC.get("username")
 ELASTIC_PASS = ELASTIC.get("password")
 ELASTIC_URL = ELASTIC.get("url")
+# connection pool / transport tuning for the shared Elasticsearch client
+ELASTIC_CONNECTIONS_PER_NODE = ELASTIC.get("connections_per_node", 10)
+ELASTIC_REQUEST_TIMEOUT = ELASTIC.get("request_timeout", 5)
+ELASTIC_MAX_RETRIES = ELASTIC.get("max_retries", 3)
+ELASTIC_RETRY_ON_TIMEOUT = ELASTIC.get("retry_on_timeout", False)
+ELASTIC_KEEP_ALIVE = ELASTIC.get("keep_alive", True)
+# consistency mode for bulk writes (imports, template seeding): "wait_for" (block until
+# the next scheduled refresh makes the documents searchable), "true" (force a refresh)
+# or "false" (return immediately; searches may briefly lag behind). Saving a single map,
+# dataset or template always waits, as the next revision is numbered from a search.
+ELASTIC_REFRESH = str(ELASTIC.get("refresh", "wait_for")).lower()
+if ELASTIC_REFRESH not in ("wait_for", "true", "false"):
+    raise RuntimeError(
+        "Misconfiguration in elastic.refresh. "
+        "Expected one of 'wait_for', 'true' or 'false', got '%s'" % ELASTIC_REFRESH
+    )
 ELASTIC_INDICES = {
     "template": {
         "read": ELASTIC.get("indices", {}).get("template", {}).get("read"),
@@ -72,6 +96,56 @@ if STORAGE_BACKEND == "elasticsearch":
 
 # SQLite configuration
 SQLITE_DB_PATH = STORAGE.get("sqlite_path", "./terranova.db")
+# connection profile, applied to every connection the SQLite storage backend opens.
+# WAL lets readers carry on while a write is in progress, and synchronous=NORMAL is
+# crash-safe in WAL mode (a power loss may only roll back the most recent commits).
+SQLITE_JOURNAL_MODE = str(STORAGE.get("sqlite_journal_mode", "wal")).lower()
+if SQLITE_JOURNAL_MODE not in ("wal", "delete", "truncate", "persist", "memory", "off"):
+    raise RuntimeError(
+        "Misconfiguration in storage.sqlite_journal_mode. "
+        "Expected one of 'wal', 'delete', 'truncate', 'persist', 'memory' or 'off', "
+        "got '%s'" % SQLITE_JOURNAL_MODE
+    )
+SQLITE_SYNCHRONOUS = str(STORAGE.get("sqlite_synchronous", "normal")).lower()
+if SQLITE_SYNCHRONOUS not in ("off", "normal", "full", "extra"):
+    raise RuntimeError(
+        "Misconfiguration in storage.sqlite_synchronous. "
+        "Expected one of 'off', 'normal', 'full' or 'extra', got '%s'" % SQLITE_SYNCHRONOUS
+    )
+SQLITE_BUSY_TIMEOUT = STORAGE.get("sqlite_busy_timeout", 5000)  # milliseconds
+SQLITE_MMAP_SIZE = STORAGE.get("sqlite_mmap_size", 268435456)  # bytes; 0 disables mmap
+# pages if positive, KiB if negative (SQLite's own convention)
+SQLITE_CACHE_SIZE = STORAGE.get("sqlite_cache_size", -65536)
+SQLITE_STATEMENT_CACHE_SIZE = STORAGE.get("sqlite_statement_cache_size", 512)
+# worker threads (each with its own connection) serving reads for the async SQLite backend.
+# Writes always go through a single, separate worker.
+SQLITE_ASYNC_WORKERS = STORAGE.get("sqlite_async_workers", 4)
+
+# rendered dataset outputs (topologies / SVG) kept per process; 0 disables the cache.
+# topology_cache_file optionally names a SQLite file that persists them across restarts
+# and shares them between server processes, holding up to topology_cache_file_size.
+TOPOLOGY_CACHE_SIZE = OUTPUT.get("topology_cache_size", 128)
+TOPOLOGY_CACHE_FILE = OUTPUT.get("topology_cache_file")
+TOPOLOGY_CACHE_FILE_SIZE = OUTPUT.get("topology_cache_file_size", 1024)
+# map layers rendered at the same time for one map output request
+OUTPUT_LAYER_CONCURRENCY = OUTPUT.get("layer_concurrency", 4)
+# Cache-Control for rendered output that carries an ETag. Browsers may keep a copy but
+# must revalidate it, which costs a 304 when nothing changed. Public maps can also be
+# stored by shared caches (e.g. a reverse proxy); raise max-age to let them skip
+# revalidation. Everything else is sent with "no-store".
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+PUBLIC_CACHE_CONTROL = OUTPUT.get("public_cache_control", "public, no-cache")
+
+# datasource cache refreshes made by the long-lived datacacher. Each datasource is
+# refreshed every `interval` seconds, give or take `jitter` (a fraction of the interval);
+# after a failure the interval doubles per consecutive failure, up to `max_backoff`.
+# `datasources` overrides any of these per datasource, e.g. {google_sheets: {interval: 300}}.
+DATACACHER_INTERVAL = DATACACHER.get("interval", 120)
+DATACACHER_JITTER = DATACACHER.get("jitter", 0.1)
+DATACACHER_MAX_BACKOFF = DATACACHER.get("max_backoff", 3600)
+DATACACHER_DATASOURCES = DATACACHER.get("datasources") or {}
+# the outcome of each datasource's latest refresh, also served by GET /cache/datasources/
+DATACACHER_STATUS_FILE = DATACACHER.get("status_file", "/var/tmp/terranova-datacacher.json")
 
 KEYCLOAK_SERVER = KEYCLOAK.get("server")
 KEYCLOAK_REALM = KEYCLOAK.get("realm")
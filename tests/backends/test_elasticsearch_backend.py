@@ -1,11 +1,17 @@
+import asyncio
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+import threading
+from unittest.mock import AsyncMock, Mock, patch, MagicMock
 from datetime import datetime
 import elasticsearch
+import elasticsearch.helpers
 from terranova.backends.elasticsearch import ElasticSearchBackend
+from terranova.backends.elasticsearch.async_backend import AsyncElasticSearchBackend
 from terranova.backends.auth import User
 from terranova.models import (
+    Map,
     MapRevision,
+    Template,
     DatasetRevision,
     NewTemplate,
     UserDataRevision,
@@ -124,8 +130,29 @@ class TestElasticSearchBackend:
                 verify_certs=backend.verify_certs,
                 ssl_show_warn=False,
                 request_timeout=5,
+                connections_per_node=10,
+                max_retries=3,
+                retry_on_timeout=False,
             )
 
+    def test_es_property_reuses_client(self, backend):
+        """Test that the Elasticsearch client is created once and shared"""
+        with patch(
+            "terranova.backends.elasticsearch.elasticsearch.Elasticsearch"
+        ) as mock_es_class:
+            clients = []
+            threads = [
+                threading.Thread(target=lambda: clients.append(backend.es)) for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert backend.es is clients[0]
+            assert all(client is clients[0] for client in clients)
+            mock_es_class.assert_called_once()
+
     def test_create_success(self, backend, mock_es):
         """Test successful document creation"""
         mock_es.create.return_value = {"result": "created"}
@@ -134,7 +161,7 @@ class TestElasticSearchBackend:
             result = backend.create("test-index", "test-id", {"field": "value"})
 
         mock_es.create.assert_called_once_with(
-            index="test-index", id="test-id", document={"field": "value"}, refresh=True
+            index="test-index", id="test-id", document={"field": "value"}, refresh="wait_for"
         )
         assert result == {"result": "created"}
 
@@ -154,10 +181,66 @@ class TestElasticSearchBackend:
             result = backend.update("test-index", "test-id", {"field": "new_value"})
 
         mock_es.update.assert_called_once_with(
-            index="test-index", id="test-id", body={"doc": {"field": "new_value"}}, refresh=True
+            index="test-index",
+            id="test-id",
+            body={"doc": {"field": "new_value"}},
+            refresh="wait_for",
         )
         assert result == {"result": "updated"}
 
+    def test_create_with_refresh_mode(self, mock_es):
+        """Test that the configured refresh mode only applies to bulk writes"""
+        backend = ElasticSearchBackend(url="http://localhost:9200", refresh="false")
+        mock_es.create.return_value = {"result": "created"}
+
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            backend.create("test-index", "test-id", {"field": "value"})
+            with patch(
+                "terranova.backends.elasticsearch.helpers.bulk", return_value=(1, [])
+            ) as mock_bulk:
+                backend.bulk_create("test-index", {"test-id": {"field": "value"}})
+
+        assert mock_es.create.call_args.kwargs["refresh"] == "wait_for"
+        assert mock_bulk.call_args.kwargs["refresh"] == "false"
+
+    def test_create_then_update_without_refresh(self, test_user, test_map_configuration):
+        """Test that revisions saved in a row are numbered in turn with refresh=false"""
+
+        class FakeElasticsearch:
+            """Only shows documents to searches once a refresh has made them visible"""
+
+            def __init__(self):
+                self.searchable, self.pending = [], []
+
+            def create(self, index, id, document, refresh):
+                if refresh == "false":
+                    self.pending.append(document)
+                else:
+                    self.searchable += self.pending + [document]
+                    self.pending = []
+                return {"result": "created"}
+
+            def search(self, query, **kwargs):
+                map_id = query["bool"]["filter"][0]["term"]["mapId"]
+                hits = [doc for doc in self.searchable if doc["mapId"] == map_id]
+                hits.sort(key=lambda doc: doc["version"], reverse=True)
+                return {"hits": {"hits": [{"_source": doc} for doc in hits[:1]]}}
+
+        backend = ElasticSearchBackend(url="http://localhost:9200", refresh="false")
+        fake_es = FakeElasticsearch()
+        revision = MapRevision(name="Map", configuration=test_map_configuration, overrides={})
+
+        with patch.object(type(backend), 'es', property(lambda self: fake_es)):
+            with patch(
+                "terranova.backends.elasticsearch.ELASTIC_INDICES",
+                {"map": {"read": "test-map", "write": "test-map"}},
+            ):
+                map_id = backend.create_map(revision, test_user)["object"]["mapId"]
+                backend.update_map(map_id, revision, test_user)
+                backend.publish_map(map_id, test_user)
+
+        assert [doc["version"] for doc in fake_es.searchable] == [1, 2, 3]
+
     def test_update_not_found(self, backend, mock_es):
         """Test update of non-existent document"""
         mock_es.update.side_effect = elasticsearch.NotFoundError("Not found", {}, {})
@@ -748,15 +831,83 @@ class TestElasticSearchBackend:
     def test_initialize_templates_empty(self, backend, mock_es, test_user):
         """Test initializing templates when none exist"""
         mock_es.search.return_value = {"hits": {"hits": []}}
-        mock_es.create.return_value = {"result": "created"}
 
         with patch.object(type(backend), 'es', property(lambda self: mock_es)):
             with patch("terranova.backends.elasticsearch.ELASTIC_INDICES", {"template": {"read": "test-template", "write": "test-template"}}):
                 with patch("terranova.backends.elasticsearch.INITIAL_TEMPLATES", {"Template1": "<svg>test</svg>"}):
-                    backend.initialize_templates()
+                    with patch(
+                        "terranova.backends.elasticsearch.helpers.bulk", return_value=(1, [])
+                    ) as mock_bulk:
+                        backend.initialize_templates()
+
+        # Should create initial templates, in a single bulk request
+        actions = list(mock_bulk.call_args[0][1])
+        assert len(actions) == 1
+        assert actions[0]["_op_type"] == "index"
+        assert actions[0]["_index"] == "test-template"
+        assert actions[0]["_id"] == "%s-1" % actions[0]["_source"]["templateId"]
+        assert actions[0]["_source"]["name"] == "Template1"
+        assert actions[0]["_source"]["version"] == 1
+        assert not mock_es.create.called
 
-        # Should create initial templates
-        assert mock_es.create.called
+    def test_bulk_create(self, backend, mock_es):
+        """Test that bulk_create sends every document through the bulk helper"""
+        docs = {"id1": {"field": "a"}, "id2": {"field": "b"}}
+
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            with patch(
+                "terranova.backends.elasticsearch.helpers.bulk", return_value=(2, [])
+            ) as mock_bulk:
+                result = backend.bulk_create("test-index", docs)
+
+        assert result == {"result": "created", "count": 2}
+        actions = list(mock_bulk.call_args[0][1])
+        assert [action["_id"] for action in actions] == ["id1", "id2"]
+        assert actions[1]["_source"] == {"field": "b"}
+        assert mock_bulk.call_args[1]["refresh"] == "wait_for"
+
+    def test_import_is_idempotent(self, backend, mock_es, test_map_configuration):
+        """Test that importing the same revisions twice leaves a single copy of each"""
+        stored = {}
+
+        def bulk(es, actions, refresh):
+            actions = list(actions)
+            for action in actions:
+                assert action["_op_type"] == "index"
+                stored[action["_id"]] = action["_source"]
+            return len(actions), []
+
+        maps = [
+            Map(
+                mapId="abc1234",
+                name="Map",
+                version=version,
+                configuration=test_map_configuration,
+                overrides={},
+                lastUpdatedBy="importer",
+                lastUpdatedOn=datetime(2024, 1, 1),
+            )
+            for version in (1, 2)
+        ]
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            with patch("terranova.backends.elasticsearch.helpers.bulk", side_effect=bulk):
+                assert backend.import_maps(maps) == {"result": "created", "count": 2}
+                backend.import_maps(maps)
+
+        assert sorted(stored) == ["abc1234-1", "abc1234-2"]
+        assert stored["abc1234-2"]["lastUpdatedBy"] == "importer"
+
+    def test_bulk_update_not_found(self, backend, mock_es):
+        """Test that missing documents in a bulk update raise TerranovaNotFoundException"""
+        error = elasticsearch.helpers.BulkIndexError(
+            "1 document(s) failed to index.",
+            [{"update": {"_id": "missing", "status": 404, "error": {}}}],
+        )
+
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            with patch("terranova.backends.elasticsearch.helpers.bulk", side_effect=error):
+                with pytest.raises(TerranovaNotFoundException):
+                    backend.bulk_update("test-index", {"missing": {"field": "value"}})
 
     def test_initialize_templates_already_exist(self, backend, mock_es):
         """Test initializing templates when they already exist"""
@@ -770,3 +921,143 @@ class TestElasticSearchBackend:
 
         # Should not create if templates already exist
         assert not mock_es.create.called
+
+
+class TestAsyncElasticSearchBackend:
+    """Tests for AsyncElasticSearchBackend"""
+
+    @pytest.fixture
+    def backend(self):
+        """Create an async backend instance for testing"""
+        return AsyncElasticSearchBackend(
+            url="http://localhost:9200",
+            user="test_user",
+            password="test_pass",
+            verify_certs=False,
+        )
+
+    @pytest.fixture
+    def mock_es(self):
+        """Mock AsyncElasticsearch client"""
+        return AsyncMock()
+
+    @pytest.fixture
+    def test_user(self):
+        """Create a test user"""
+        return User(
+            name="Test User",
+            email="test@example.com",
+            username="testuser",
+            scope=["read", "write"]
+        )
+
+    def test_es_property(self, backend):
+        """Test that the async client is created once, with the shared settings"""
+        with patch(
+            "terranova.backends.elasticsearch.async_backend.elasticsearch.AsyncElasticsearch"
+        ) as mock_es_class:
+            client = backend.es
+            assert backend.es is client
+
+        mock_es_class.assert_called_once_with(
+            "http://localhost:9200",
+            basic_auth=("test_user", "test_pass"),
+            verify_certs=False,
+            ssl_show_warn=False,
+            request_timeout=5,
+            connections_per_node=10,
+            max_retries=3,
+            retry_on_timeout=False,
+        )
+
+    def test_get_maps(self, backend, mock_es):
+        """Test that get_maps awaits the search and collapses on mapId"""
+        mock_es.search.return_value = {
+            "hits": {"hits": [{"_source": {"mapId": "map1", "version": 2}}]}
+        }
+
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            with patch(
+                "terranova.backends.elasticsearch.async_backend.ELASTIC_INDICES",
+                {"map": {"read": "test-map"}},
+            ):
+                result = asyncio.run(backend.get_maps(map_id="map1"))
+
+        assert result == [{"mapId": "map1", "version": 2}]
+        call_kwargs = mock_es.search.call_args[1]
+        assert call_kwargs["index"] == "test-map"
+        assert call_kwargs["collapse"] == {"field": "mapId"}
+
+    def test_update_template(self, backend, mock_es, test_user):
+        """Test that update_template awaits the lookup before writing the next version"""
+        mock_es.search.return_value = {
+            "hits": {"hits": [{"_source": {"templateId": "tmpl1", "version": 1}}]}
+        }
+        mock_es.create.return_value = {"result": "created"}
+
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            with patch(
+                "terranova.backends.elasticsearch.async_backend.ELASTIC_INDICES",
+                {"template": {"read": "test-template", "write": "test-template"}},
+            ):
+                result = asyncio.run(
+                    backend.update_template(
+                        "tmpl1", NewTemplate(name="Template", template="<svg/>"), test_user
+                    )
+                )
+
+        assert result["object"]["templateId"] == "tmpl1"
+        assert result["object"]["version"] == 2
+        assert mock_es.create.call_args[1]["refresh"] == "wait_for"
+
+    def test_update_not_found(self, backend, mock_es):
+        """Test that a missing document raises TerranovaNotFoundException"""
+        mock_es.update.side_effect = elasticsearch.NotFoundError(
+            message="Not found", meta=Mock(status=404), body={}
+        )
+
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            with pytest.raises(TerranovaNotFoundException):
+                asyncio.run(backend.update("test-index", "missing", {"field": "value"}))
+
+    def test_same_searches_as_sync_backend(self, backend, mock_es):
+        """Test that both backends send the same search for the same lookup"""
+        sync_backend = ElasticSearchBackend(url="http://localhost:9200")
+        sync_es = Mock()
+        sync_es.search.return_value = mock_es.search.return_value = {"hits": {"hits": []}}
+        indices = {"map": {"read": "test-map"}}
+        filters = MapFilters(name=["Map"], public=True)
+
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            with patch("terranova.backends.elasticsearch.async_backend.ELASTIC_INDICES", indices):
+                asyncio.run(backend.get_maps(filters=filters, version="all"))
+        with patch.object(type(sync_backend), 'es', property(lambda self: sync_es)):
+            with patch("terranova.backends.elasticsearch.ELASTIC_INDICES", indices):
+                sync_backend.get_maps(filters=filters, version="all")
+
+        assert mock_es.search.call_args == sync_es.search.call_args
+        filter_spec = sync_es.search.call_args.kwargs["query"]["bool"]["filter"]
+        assert {"term": {"public": True}} in filter_spec
+
+    def test_import_overwrites(self, backend, mock_es):
+        """Test that imported revisions are indexed under ids derived from the revision"""
+        template = Template(
+            templateId="tmpl1",
+            name="Template",
+            version=3,
+            template="<svg/>",
+            lastUpdatedBy="importer",
+            lastUpdatedOn=datetime(2024, 1, 1),
+        )
+
+        with patch.object(type(backend), 'es', property(lambda self: mock_es)):
+            with patch(
+                "terranova.backends.elasticsearch.async_backend.helpers.async_bulk",
+                AsyncMock(return_value=(1, [])),
+            ) as mock_bulk:
+                asyncio.run(backend.import_templates([template]))
+
+        actions = list(mock_bulk.call_args[0][1])
+        assert [(action["_op_type"], action["_id"]) for action in actions] == [
+            ("index", "tmpl1-3")
+        ]
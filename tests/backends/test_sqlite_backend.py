@@ -1,13 +1,21 @@
+import asyncio
 import pytest
 import tempfile
 import os
+import json
+import sqlite3
+import threading
 from datetime import datetime
 from terranova.backends.sqlite import SQLiteBackend
+from terranova.backends.sqlite.async_backend import AsyncSQLiteBackend
+from terranova.backends.sqlite.query import compile_query
 from terranova.backends.auth import User
 from terranova.models import (
+    Map,
     MapRevision,
     DatasetRevision,
     NewTemplate,
+    Template,
     UserDataRevision,
     MapFilters,
     PublicMapFilters,
@@ -122,6 +130,54 @@ class TestSQLiteBackend:
         assert backend.db_path == ":memory:"
         assert backend.is_connected()
 
+    def test_connection_profile(self, backend):
+        """Test that connections are opened with the configured profile"""
+        conn = backend.conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        # 1 == NORMAL
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == backend.busy_timeout
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == backend.cache_size
+
+    def test_custom_connection_profile(self):
+        """Test that the profile can be overridden per backend"""
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".db")
+        os.close(temp_fd)
+
+        backend = SQLiteBackend(
+            db_path=temp_path, journal_mode="delete", synchronous="full", busy_timeout=250
+        )
+        conn = backend.conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 250
+
+        conn.close()
+        os.remove(temp_path)
+
+    def test_reads_proceed_during_write(self, backend):
+        """Test that a reader sees the last committed data while a write is in progress"""
+        backend.create("template", "t1", {"templateId": "t1", "version": 1})
+
+        # with a rollback journal an exclusive lock (as taken to commit) blocks readers;
+        # in WAL mode it doesn't
+        writer = sqlite3.connect(backend.db_path, isolation_level=None)
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.execute(
+            "INSERT INTO template (id, document) VALUES (?, ?)",
+            ("t2", json.dumps({"templateId": "t2", "version": 1})),
+        )
+
+        results = []
+        reader = threading.Thread(target=lambda: results.append(backend.get_templates()))
+        reader.start()
+        reader.join(timeout=1)
+        writer.rollback()
+        writer.close()
+
+        assert not reader.is_alive()
+        assert [t["templateId"] for t in results[0]] == ["t1"]
+
     def test_create_success(self, backend):
         """Test successful document creation"""
         result = backend.create("map", "test-id", {"field": "value"})
@@ -196,6 +252,58 @@ class TestSQLiteBackend:
 
         assert len(results) == 5
 
+    def test_query_collapse_keeps_latest_per_id(self, backend):
+        """Test that collapse returns the latest version of every id, ordered by sort"""
+        backend.create("map", "id1", {"mapId": "map1", "version": 1, "name": "a1"})
+        backend.create("map", "id2", {"mapId": "map2", "version": 1, "name": "b1"})
+        backend.create("map", "id3", {"mapId": "map1", "version": 3, "name": "a3"})
+        backend.create("map", "id4", {"mapId": "map1", "version": 2, "name": "a2"})
+
+        query = {"bool": {"filter": []}}
+        sort = [{"version": {"order": "desc"}}]
+        results = backend.query("map", query, collapse={"field": "mapId"}, sort=sort)
+
+        assert [r["name"] for r in results] == ["a3", "b1"]
+
+    def test_query_collapse_with_filter_and_limit(self, backend):
+        """Test that filters apply before collapsing and limit applies after"""
+        for i in range(5):
+            backend.create("map", f"old{i}", {"mapId": f"map{i}", "version": 1, "public": True})
+            backend.create("map", f"new{i}", {"mapId": f"map{i}", "version": 2, "public": False})
+
+        query = {"bool": {"filter": [{"term": {"public": True}}]}}
+        results = backend.query("map", query, collapse={"field": "mapId"}, limit=3)
+
+        assert len(results) == 3
+        assert all(r["version"] == 1 for r in results)
+
+    def test_query_terms_filter(self, backend):
+        """Test terms filters, including matching documents missing the field"""
+        backend.create("map", "id1", {"mapId": "map1", "name": "one", "version": 1})
+        backend.create("map", "id2", {"mapId": "map2", "name": "two", "version": 1})
+        backend.create("map", "id3", {"mapId": "map3", "version": 1})
+
+        query = {"bool": {"filter": [{"terms": {"name": ["one", "two"]}}]}}
+        assert len(backend.query("map", query)) == 2
+
+        query = {"bool": {"filter": [{"terms": {"name": ["one", None]}}]}}
+        results = backend.query("map", query)
+        assert sorted(r["mapId"] for r in results) == ["map1", "map3"]
+
+    def test_query_fields_preserves_types(self, backend):
+        """Test that field projection keeps booleans and nested objects intact"""
+        backend.create(
+            "map",
+            "id1",
+            {"mapId": "map1", "public": False, "configuration": {"layers": [1]}, "version": 1},
+        )
+
+        results = backend.query(
+            "map", {"bool": {"filter": []}}, fields=["public", "configuration", "missing"]
+        )
+
+        assert results == [{"public": False, "configuration": {"layers": [1]}}]
+
     def test_delete_by_query(self, backend):
         """Test delete by query"""
         backend.create("map", "map1", {"mapId": "map1", "status": "deleted", "version": 1})
@@ -621,6 +729,60 @@ class TestSQLiteBackend:
         assert "template" in tables
         assert "userdata" in tables
 
+    def test_create_indices_migrates_legacy_tables(self):
+        """Test that (id, document) tables from older versions are migrated in place"""
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".db")
+        os.close(temp_fd)
+
+        legacy = sqlite3.connect(temp_path)
+        legacy.execute("CREATE TABLE map (id TEXT PRIMARY KEY, document TEXT NOT NULL)")
+        for version in (1, 2, 3):
+            legacy.execute(
+                "INSERT INTO map (id, document) VALUES (?, ?)",
+                (f"rev{version}", json.dumps({"mapId": "map1", "version": version})),
+            )
+        legacy.commit()
+        legacy.close()
+
+        migrated = SQLiteBackend(db_path=temp_path)
+        cursor = migrated.conn.cursor()
+        cursor.execute("PRAGMA table_xinfo(map)")
+        columns = [row["name"] for row in cursor.fetchall()]
+        assert "mapId" in columns
+        assert "version" in columns
+
+        cursor.execute("SELECT id FROM map_latest WHERE entity_id = 'map1'")
+        assert cursor.fetchone()["id"] == "rev3"
+        assert migrated.get_maps(map_id="map1")[0]["version"] == 3
+
+        # running the migration a second time is a no-op
+        SQLiteBackend(db_path=temp_path)
+
+        migrated._local.conn.close()
+        os.remove(temp_path)
+
+    def test_latest_revision_lookup_uses_index(self, backend, test_user, test_map_configuration):
+        """Test that the latest revision is tracked on write and looked up by index"""
+        map_revision = MapRevision(
+            name="Test Map", configuration=test_map_configuration, overrides={}
+        )
+        map_id = backend.create_map(map_revision, test_user)["object"]["mapId"]
+        backend.update_map(map_id, map_revision, test_user)
+        backend.update_map(map_id, map_revision, test_user)
+
+        assert backend.get_maps(map_id=map_id)[0]["version"] == 3
+
+        sql, params = compile_query(
+            "map",
+            {"bool": {"filter": [{"term": {"mapId": map_id}}]}},
+            collapse={"field": "mapId"},
+            sort=[{"version": {"order": "desc"}}],
+        )
+        cursor = backend.conn.cursor()
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        plan = " ".join(row["detail"] for row in cursor.fetchall())
+        assert "SCAN" not in plan
+
     def test_initialize_templates(self, backend, test_user):
         """Test initializing default templates"""
         # Create a fresh backend without templates
@@ -681,3 +843,173 @@ class TestSQLiteBackend:
         query = {"bool": {"filter": []}}
         result = backend.delete_by_query("nonexistent_table_2", query)
         assert result["deleted"] == 0
+
+    def test_bulk_create(self, backend):
+        """Test that bulk_create writes every document and tracks the latest revisions"""
+        docs = {
+            "rev-%d" % i: {"templateId": "tmpl-%d" % (i % 10), "version": i // 10 + 1}
+            for i in range(100)
+        }
+        result = backend.bulk_create("template", docs)
+        assert result == {"result": "created", "count": 100}
+
+        assert len(backend.get_templates(version="all")) == 100
+        latest = backend.get_templates()
+        assert len(latest) == 10
+        assert all(template["version"] == 10 for template in latest)
+
+    def test_bulk_create_is_atomic(self, backend):
+        """Test that a failing bulk_create leaves nothing behind"""
+        backend.create("template", "taken", {"templateId": "tmpl", "version": 1})
+        docs = {"new": {"templateId": "other", "version": 1}, "taken": {"templateId": "tmpl"}}
+        with pytest.raises(sqlite3.IntegrityError):
+            backend.bulk_create("template", docs)
+
+        assert [t["templateId"] for t in backend.get_templates(version="all")] == ["tmpl"]
+
+    def test_bulk_update(self, backend):
+        """Test that bulk_update replaces documents and refreshes the latest revisions"""
+        backend.bulk_create(
+            "template",
+            {
+                "a1": {"templateId": "a", "version": 1},
+                "a2": {"templateId": "a", "version": 2},
+            },
+        )
+        result = backend.bulk_update(
+            "template", {"a2": {"templateId": "b", "version": 1, "name": "moved"}}
+        )
+        assert result == {"result": "updated", "count": 1}
+
+        assert backend.get_templates(template_id="a")[0]["version"] == 1
+        assert backend.get_templates(template_id="b")[0]["name"] == "moved"
+
+    def test_bulk_update_not_found(self, backend):
+        """Test that bulk_update writes nothing if any document is missing"""
+        backend.create("template", "a1", {"templateId": "a", "version": 1})
+        with pytest.raises(TerranovaNotFoundException):
+            backend.bulk_update(
+                "template",
+                {"a1": {"templateId": "a", "version": 5}, "missing": {"templateId": "b"}},
+            )
+
+        assert backend.get_templates(template_id="a")[0]["version"] == 1
+
+    def test_import_maps_preserves_revisions(self, backend, test_user, test_map_configuration):
+        """Test that imported maps keep their ids, versions and authorship"""
+        created = backend.create_map(
+            MapRevision(name="Map", configuration=test_map_configuration, overrides={}),
+            test_user,
+        )["object"]
+        exported = [Map(**m) for m in backend.get_maps(version="all", fields=None)]
+        restored = [m.model_copy(update={"mapId": "restored"}) for m in exported]
+        restored.append(restored[0].model_copy(update={"version": 2, "lastUpdatedBy": "other"}))
+
+        result = backend.import_maps(restored)
+
+        assert result["count"] == 2
+        latest = backend.get_maps(map_id="restored")
+        assert latest[0]["version"] == 2
+        assert latest[0]["lastUpdatedBy"] == "other"
+        assert backend.get_maps(map_id=created["mapId"])[0]["version"] == 1
+
+    def test_import_is_idempotent(self, backend):
+        """Test that importing the same revisions again replaces them instead of adding more"""
+        templates = [
+            Template(
+                templateId="tmpl",
+                name="Template",
+                version=version,
+                template="<svg/>",
+                lastUpdatedBy="admin",
+                lastUpdatedOn="2024-01-01T00:00:00",
+            )
+            for version in (1, 2)
+        ]
+        backend.import_templates(templates)
+        templates[1] = templates[1].model_copy(update={"name": "Renamed"})
+        result = backend.import_templates(templates)
+
+        assert result["count"] == 2
+        revisions = backend.get_templates(template_id="tmpl", version="all")
+        assert sorted(t["version"] for t in revisions) == [1, 2]
+        assert backend.get_templates(template_id="tmpl")[0]["name"] == "Renamed"
+
+
+class TestAsyncSQLiteBackend:
+    """Tests for the asynchronous interface to SQLiteBackend"""
+
+    @pytest.fixture
+    def backend(self):
+        """Create an async backend around a temporary database"""
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".db")
+        os.close(temp_fd)
+
+        backend = AsyncSQLiteBackend(SQLiteBackend(db_path=temp_path), workers=2)
+        yield backend
+
+        asyncio.run(backend.close())
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    @pytest.fixture
+    def test_user(self):
+        """Create a test user"""
+        return User(
+            name="Test User",
+            email="test@example.com",
+            username="testuser",
+            scope=["read", "write"]
+        )
+
+    def test_create_and_update_template(self, backend, test_user):
+        """Test that writes are awaitable and visible to subsequent reads"""
+        async def scenario():
+            created = await backend.create_template(
+                NewTemplate(name="Template", template="<svg/>"), test_user
+            )
+            template_id = created["object"]["templateId"]
+            await backend.update_template(
+                template_id, NewTemplate(name="Template", template="<svg></svg>"), test_user
+            )
+            return await backend.get_templates(template_id=template_id)
+
+        result = asyncio.run(scenario())
+        assert len(result) == 1
+        assert result[0]["version"] == 2
+        assert result[0]["template"] == "<svg></svg>"
+
+    def test_concurrent_reads(self, backend, test_user):
+        """Test that many concurrent reads on the worker pool all get their results"""
+        async def scenario():
+            created = await backend.create_dataset(
+                DatasetRevision(
+                    name="Dataset",
+                    query=DatasetQuery(endpoint="test-endpoint", filters=[]),
+                ),
+                test_user,
+            )
+            dataset_id = created["object"]["datasetId"]
+            return await asyncio.gather(
+                *[backend.get_datasets(dataset_id=dataset_id) for _ in range(20)]
+            )
+
+        results = asyncio.run(scenario())
+        assert len(results) == 20
+        assert all(len(result) == 1 and result[0]["version"] == 1 for result in results)
+
+    def test_not_found_is_raised(self, backend, test_user):
+        """Test that backend exceptions propagate to the awaiting caller"""
+        with pytest.raises(TerranovaNotFoundException):
+            asyncio.run(
+                backend.update_userdata(UserDataRevision(), test_user)
+            )
+
+    def test_usable_after_close(self, backend):
+        """Test that the worker threads are recreated after close()"""
+        async def scenario():
+            await backend.is_connected()
+            await backend.close()
+            return await backend.is_connected()
+
+        assert asyncio.run(scenario())
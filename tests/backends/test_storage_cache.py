@@ -0,0 +1,282 @@
+import asyncio
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import pytest
+
+from terranova.backends.auth import User
+from terranova.backends.cache import StorageCache, CachedStorageBackend
+from terranova.backends.sqlite import SQLiteBackend
+from terranova.backends.sqlite.async_backend import AsyncSQLiteBackend
+from terranova.models import (
+    DatasetQuery,
+    DatasetRevision,
+    MapConfiguration,
+    MapFilters,
+    MapRevision,
+    NewTemplate,
+    TemplateFilters,
+    TerranovaVersion,
+    TilesetConfiguration,
+    Viewport,
+    ViewportCenter,
+)
+
+
+class TestStorageCache:
+    """Tests for the LRU / TTL cache itself"""
+
+    def test_hit_and_miss_counters(self):
+        """Test that lookups are counted as hits or misses"""
+        cache = StorageCache(max_entries=10, ttl=60)
+        assert cache.get(("map", "a", "latest")) is None
+        cache.set(("map", "a", "latest"), [{"mapId": "a"}])
+        assert cache.get(("map", "a", "latest")) == [{"mapId": "a"}]
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+        assert stats["entries"] == 1
+
+    def test_hits_are_copies(self):
+        """Test that modifying a returned value doesn't modify the cached one"""
+        cache = StorageCache(max_entries=10, ttl=60)
+        cache.set(("dataset", "a", "latest"), [{"results": [{"name": "edge"}]}])
+        cache.get(("dataset", "a", "latest"))[0]["results"][0]["name"] = "changed"
+        assert cache.get(("dataset", "a", "latest"))[0]["results"][0]["name"] == "edge"
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted when the cache is full"""
+        cache = StorageCache(max_entries=2, ttl=60)
+        cache.set(("map", "a", "latest"), ["a"])
+        cache.set(("map", "b", "latest"), ["b"])
+        cache.get(("map", "a", "latest"))
+        cache.set(("map", "c", "latest"), ["c"])
+
+        assert cache.get(("map", "b", "latest")) is None
+        assert cache.get(("map", "a", "latest")) == ["a"]
+        assert cache.get(("map", "c", "latest")) == ["c"]
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after the TTL"""
+        cache = StorageCache(max_entries=10, ttl=30)
+        cache.set(("map", "a", "latest"), ["a"])
+        with patch("terranova.backends.cache.time.monotonic", return_value=time.monotonic() + 31):
+            assert cache.get(("map", "a", "latest")) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_invalidate(self):
+        """Test that invalidating an id drops all of its versions and nothing else"""
+        cache = StorageCache(max_entries=10, ttl=60)
+        cache.set(("map", "a", "latest"), ["a"])
+        cache.set(("map", "a", "1"), ["a1"])
+        cache.set(("map", "b", "latest"), ["b"])
+        cache.set(("template", "a", "latest"), ["t"])
+
+        cache.invalidate("map", "a")
+        assert cache.get(("map", "a", "latest")) is None
+        assert cache.get(("map", "a", "1")) is None
+        assert cache.get(("map", "b", "latest")) == ["b"]
+        assert cache.get(("template", "a", "latest")) == ["t"]
+
+    def test_set_after_invalidation_is_dropped(self):
+        """Test that a value read before an invalidation isn't stored after it"""
+        cache = StorageCache(max_entries=10, ttl=60)
+        generation = cache.generation
+        cache.invalidate("map", "a")
+        cache.set(("map", "a", "latest"), ["stale"], generation)
+        assert cache.get(("map", "a", "latest")) is None
+
+
+class TestCachedStorageBackend:
+    """Tests for the read-through cache around an async storage backend"""
+
+    @pytest.fixture
+    def backend(self):
+        """Create a cached async backend around a temporary database"""
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".db")
+        os.close(temp_fd)
+
+        async_backend = AsyncSQLiteBackend(SQLiteBackend(db_path=temp_path), workers=2)
+        backend = CachedStorageBackend(async_backend, StorageCache(max_entries=100, ttl=60))
+        yield backend
+
+        asyncio.run(async_backend.close())
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    @pytest.fixture
+    def test_user(self):
+        """Create a test user"""
+        return User(
+            name="Test User",
+            email="test@example.com",
+            username="testuser",
+            scope=["read", "write"]
+        )
+
+    @pytest.fixture
+    def test_map_revision(self):
+        """Create a test MapRevision"""
+        configuration = MapConfiguration(
+            initialViewStrategy="fitBounds",
+            viewport=Viewport(center=ViewportCenter(lat=0.0, lng=0.0)),
+            background="#000000",
+            tileset=TilesetConfiguration(),
+            editMode=False,
+            showSidebar=True,
+            showViewControls=True,
+            showLegend=True,
+            enableScrolling=True,
+            enableEditing=False,
+            enableNodeAnimation=False,
+            enableEdgeAnimation=False,
+            zIndexBase=100,
+            layers=[],
+        )
+        return MapRevision(name="Test Map", configuration=configuration, overrides={})
+
+    def count_queries(self, backend):
+        """Counts the queries that reach the underlying SQLite backend"""
+        calls = []
+        query = backend.backend.backend.query
+
+        def counting_query(*args, **kwargs):
+            calls.append(args[0])
+            return query(*args, **kwargs)
+
+        backend.backend.backend.query = counting_query
+        return calls
+
+    def test_repeated_reads_hit_the_cache(self, backend, test_user):
+        """Test that reading the same template twice only queries storage once"""
+        async def scenario():
+            created = await backend.create_template(
+                NewTemplate(name="Template", template="<svg/>"), test_user
+            )
+            template_id = created["object"]["templateId"]
+            calls = self.count_queries(backend)
+            first = await backend.get_templates(template_id=template_id)
+            second = await backend.get_templates(template_id=template_id)
+            return first, second, calls
+
+        first, second, calls = asyncio.run(scenario())
+        assert first == second
+        assert calls == ["template"]
+        assert backend.cache.stats()["hits"] == 1
+
+    def test_latest_is_served_until_the_ttl(self, backend, test_user, test_map_revision):
+        """Test that a revision saved by another process is read once the TTL expires"""
+        async def scenario():
+            created = await backend.create_map(test_map_revision, test_user)
+            map_id = created["object"]["mapId"]
+            latest = TerranovaVersion(version="latest")
+            before = await backend.get_maps(map_id=map_id, version=latest)
+            # written around the cache, as another uvicorn worker would
+            await backend.backend.update_map(map_id, test_map_revision, test_user)
+            cached = await backend.get_maps(map_id=map_id)
+            expired = time.monotonic() + backend.cache.ttl + 1
+            with patch("terranova.backends.cache.time.monotonic", return_value=expired):
+                after = await backend.get_maps(map_id=map_id, version=latest)
+            return before, cached, after
+
+        before, cached, after = asyncio.run(scenario())
+        # the default version and "latest" are the same entry
+        assert before[0]["version"] == cached[0]["version"] == 1
+        assert after[0]["version"] == 2
+
+    def test_versions_are_cached_separately(self, backend, test_user):
+        """Test that the version is part of the cache key"""
+        async def scenario():
+            created = await backend.create_template(
+                NewTemplate(name="Template", template="<svg/>"), test_user
+            )
+            template_id = created["object"]["templateId"]
+            await backend.update_template(
+                template_id, NewTemplate(name="Template", template="<svg></svg>"), test_user
+            )
+            latest = await backend.get_templates(template_id=template_id)
+            first = await backend.get_templates(template_id=template_id, version="1")
+            return latest, first
+
+        latest, first = asyncio.run(scenario())
+        assert latest[0]["version"] == 2
+        assert first[0]["version"] == 1
+
+    def test_update_invalidates(self, backend, test_user):
+        """Test that an update is visible to the next read"""
+        async def scenario():
+            created = await backend.create_dataset(
+                DatasetRevision(
+                    name="Dataset",
+                    query=DatasetQuery(endpoint="test-endpoint", filters=[]),
+                ),
+                test_user,
+            )
+            dataset_id = created["object"]["datasetId"]
+            before = await backend.get_datasets(dataset_id=dataset_id)
+            await backend.update_dataset(
+                dataset_id,
+                DatasetRevision(
+                    name="Renamed",
+                    query=DatasetQuery(endpoint="test-endpoint", filters=[]),
+                ),
+                [],
+                test_user,
+            )
+            after = await backend.get_datasets(dataset_id=dataset_id)
+            return before, after
+
+        before, after = asyncio.run(scenario())
+        assert before[0]["name"] == "Dataset"
+        assert after[0]["name"] == "Renamed"
+        assert after[0]["version"] == 2
+
+    def test_publish_invalidates_public_maps(self, backend, test_user, test_map_revision):
+        """Test that publishing a map is visible to the next public map read"""
+        async def scenario():
+            created = await backend.create_map(test_map_revision, test_user)
+            map_id = created["object"]["mapId"]
+            version = TerranovaVersion(version="latest")
+            before = await backend.get_public_maps(map_id=map_id, version=version)
+            private = await backend.get_maps(map_id=map_id, version=version)
+            await backend.publish_map(map_id, test_user)
+            after = await backend.get_public_maps(map_id=map_id, version=version)
+            latest = await backend.get_maps(map_id=map_id, version=version)
+            return before, private, after, latest
+
+        before, private, after, latest = asyncio.run(scenario())
+        assert before == []
+        assert private[0]["version"] == 1
+        assert after[0]["public"] is True
+        assert latest[0]["version"] == 2
+
+    def test_filtered_reads_bypass_the_cache(self, backend, test_user):
+        """Test that lookups narrowed by fields or filters always go to storage"""
+        async def scenario():
+            created = await backend.create_template(
+                NewTemplate(name="Template", template="<svg/>"), test_user
+            )
+            template_id = created["object"]["templateId"]
+            calls = self.count_queries(backend)
+            for _ in range(2):
+                await backend.get_templates(template_id=template_id, fields=["name"])
+                await backend.get_templates(
+                    template_id=template_id, filters=TemplateFilters(name=["Template"])
+                )
+                await backend.get_templates()
+                await backend.get_maps(filters=MapFilters(public=True))
+            return calls
+
+        calls = asyncio.run(scenario())
+        assert len(calls) == 8
+        assert backend.cache.stats()["entries"] == 0
+
+    def test_other_methods_pass_through(self, backend):
+        """Test that methods the cache doesn't wrap reach the backend"""
+        assert asyncio.run(backend.is_connected()) is True
+        assert backend.db_path == backend.backend.db_path
@@ -0,0 +1,375 @@
+import importlib
+import os
+import sqlite3
+import tempfile
+
+import orjson
+import pytest
+from google.auth.credentials import AnonymousCredentials
+
+from terranova.settings import GOOGLE_SHEETS_TABLE_NAME, GOOGLE_SHEETS_META_TABLE_NAME
+from tests.fixtures.fake_google import BATCH_GET
+
+# the package exports a `fetch` function that shadows the submodule's name
+fetcher = importlib.import_module("terranova.datasources.google_sheets.fetcher")
+
+NODES = [
+    ["Name", "Latitude", "Longitude", "Description", "Site"],
+    ["A", "1", "2", "node a", "x"],
+    ["B", "3", "4", "node b", "y"],
+]
+EDGES = [
+    ["Name", "Description", "Source", "Destination", "Speed"],
+    ["A--B", "edge", "A", "B", "100"],
+]
+
+
+def make_sheet(name, version, nodes=NODES, edges=EDGES):
+    return {"name": name, "version": version, "Nodes!A:Z": nodes, "Edges!A:Z": edges}
+
+
+class TestIncrementalRefresh:
+    """Tests for refreshing the Google Sheets cache from Drive"""
+
+    @pytest.fixture
+    def sheets(self, fake_google, monkeypatch):
+        """Points the fetcher at a fake Google serving a mutable dict of sheets"""
+        fake, url = fake_google
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".sqlite")
+        os.close(temp_fd)
+
+        monkeypatch.setattr(fetcher, "GOOGLE_SHEETS_CACHE_FILE", temp_path)
+        monkeypatch.setattr(fetcher, "enumerate_credentials", lambda: [{}])
+        monkeypatch.setattr(fetcher, "make_credentials", lambda token: AnonymousCredentials())
+        monkeypatch.setattr(
+            fetcher,
+            "CLIENT_OPTIONS",
+            {"drive": {"api_endpoint": url}, "sheets": {"api_endpoint": url}},
+        )
+        yield fake.sheets, fake, temp_path
+
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(temp_path + suffix):
+                os.remove(temp_path + suffix)
+
+    def reads(self, fake):
+        """The sheets fetched from the fake, in order"""
+        matches = [BATCH_GET.match(path) for path in fake.requests]
+        return [match.group("sheet_id") for match in matches if match]
+
+    def read_cache(self, path):
+        conn = sqlite3.connect(path)
+        edges = conn.execute(
+            "SELECT sheet_id, edge FROM %s ORDER BY id" % GOOGLE_SHEETS_TABLE_NAME
+        ).fetchall()
+        metadata = conn.execute(
+            "SELECT sheet_id, sheet_name, version FROM %s ORDER BY sheet_id"
+            % GOOGLE_SHEETS_META_TABLE_NAME
+        ).fetchall()
+        conn.close()
+        return [(sheet_id, orjson.loads(edge)) for sheet_id, edge in edges], metadata
+
+    def test_first_refresh_loads_every_sheet(self, sheets):
+        """Test that an empty cache is filled with every shared sheet"""
+        sheets_data, fake, path = sheets
+        sheets_data["s1"] = make_sheet("one", "1")
+        sheets_data["s2"] = make_sheet("two", "1")
+        fetcher.main()
+
+        edges, metadata = self.read_cache(path)
+        assert metadata == [("s1", "one", "1"), ("s2", "two", "1")]
+        # sheets are fetched concurrently, so their rows are written in no particular order
+        assert sorted(sheet_id for sheet_id, _ in edges) == ["s1", "s2"]
+        assert edges[0][1]["name"] == "A--B"
+        assert [endpoint["name"] for endpoint in edges[0][1]["endpoints"]] == ["A", "B"]
+
+    def test_unchanged_sheets_are_skipped(self, sheets):
+        """Test that only sheets with a new Drive version are read again"""
+        sheets_data, fake, path = sheets
+        sheets_data["s1"] = make_sheet("one", "1")
+        sheets_data["s2"] = make_sheet("two", "1")
+        fetcher.main()
+        fake.requests.clear()
+
+        renamed = [row[:] for row in EDGES]
+        renamed[1][0] = "A--B renamed"
+        sheets_data["s2"] = make_sheet("two", "2", edges=renamed)
+        fetcher.main()
+
+        assert self.reads(fake) == ["s2"]
+        edges, metadata = self.read_cache(path)
+        assert metadata == [("s1", "one", "1"), ("s2", "two", "2")]
+        assert sorted((sheet_id, edge["name"]) for sheet_id, edge in edges) == [
+            ("s1", "A--B"),
+            ("s2", "A--B renamed"),
+        ]
+
+    def test_unshared_sheets_are_removed(self, sheets):
+        """Test that sheets no longer listed in Drive are dropped from the cache"""
+        sheets_data, fake, path = sheets
+        sheets_data["s1"] = make_sheet("one", "1")
+        sheets_data["s2"] = make_sheet("two", "1")
+        fetcher.main()
+
+        del sheets_data["s1"]
+        fetcher.main()
+
+        edges, metadata = self.read_cache(path)
+        assert metadata == [("s2", "two", "1")]
+        assert [sheet_id for sheet_id, _ in edges] == ["s2"]
+
+    def test_refresh_without_changes_keeps_the_table(self, sheets):
+        """Test that a refresh where nothing changed doesn't rebuild the edge table"""
+        sheets_data, fake, path = sheets
+        sheets_data["s1"] = make_sheet("one", "1")
+        fetcher.main()
+
+        query = "SELECT rootpage FROM sqlite_master WHERE name = '%s'" % GOOGLE_SHEETS_TABLE_NAME
+        conn = sqlite3.connect(path)
+        before = conn.execute(query).fetchone()
+        fetcher.main()
+        assert conn.execute(query).fetchone() == before
+        conn.close()
+        assert self.read_cache(path)[1] == [("s1", "one", "1")]
+
+    def test_unchanged_sheets_are_not_rewritten(self, sheets):
+        """Test that a refresh only replaces the rows of the sheets that changed"""
+        sheets_data, fake, path = sheets
+        sheets_data["s1"] = make_sheet("one", "1")
+        sheets_data["s2"] = make_sheet("two", "1")
+        fetcher.main()
+
+        query = "SELECT sheet_id, id FROM %s ORDER BY id" % GOOGLE_SHEETS_TABLE_NAME
+        conn = sqlite3.connect(path)
+        before = dict(conn.execute(query).fetchall())
+        sheets_data["s2"] = make_sheet("two", "2")
+        fetcher.main()
+        after = dict(conn.execute(query).fetchall())
+        conn.close()
+        assert after["s1"] == before["s1"]
+        assert after["s2"] > before["s2"]
+
+    def test_cache_is_not_locked_while_fetching(self, sheets):
+        """Test that staged sheets are committed, so other writers aren't blocked"""
+        sheets_data, fake, path = sheets
+        columns, types, edges = fetcher.parse_sheet({"Nodes!A:Z": NODES, "Edges!A:Z": EDGES})
+        writer = fetcher.CacheWriter()
+        writer.begin_refresh()
+        writer.stage_sheet(
+            "s1",
+            {"name": "one", "columns": columns, "types": types, "version": "1"}
+            | {"modified_time": None},
+            edges,
+        )
+        other = sqlite3.connect(path, timeout=0, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        other.execute("ROLLBACK")
+        other.close()
+
+        writer.finish_refresh()
+        writer.conn.close()
+        assert self.read_cache(path)[1] == [("s1", "one", "1")]
+
+    def test_failed_fetch_keeps_the_sheet(self, sheets, monkeypatch):
+        """Test that a sheet Google fails to serve keeps its rows until it can be fetched"""
+        sheets_data, fake, path = sheets
+        monkeypatch.setattr(fetcher, "RETRY_BACKOFF", 0)
+        edges = [EDGES[0]] + [["A--B %d" % i, "edge", "A", "B", "100"] for i in range(3)]
+        sheets_data["s1"] = make_sheet("one", "1", edges=edges)
+        fetcher.main()
+        before = self.read_cache(path)
+
+        sheets_data["s1"] = make_sheet("one", "2", edges=edges[:2])
+        fake.failures["s1"] = [503] * (fetcher.FETCH_RETRIES + 1)
+        assert fetcher.main()["sheets_failed"] == 1
+        assert self.read_cache(path) == before
+
+        # the version wasn't recorded, so the next refresh fetches the sheet again
+        assert fetcher.main()["sheets_failed"] == 0
+        edges_after, metadata = self.read_cache(path)
+        assert [edge["name"] for _, edge in edges_after] == ["A--B 0"]
+        assert metadata == [("s1", "one", "2")]
+
+    def test_large_sheets_are_written_in_batches(self, sheets, monkeypatch):
+        """Test that every row of a sheet larger than a write batch is stored"""
+        sheets_data, fake, path = sheets
+        monkeypatch.setattr(fetcher, "WRITE_BATCH_SIZE", 3)
+        edges = [EDGES[0]] + [["A--B %d" % i, "edge", "A", "B", "100"] for i in range(10)]
+        sheets_data["s1"] = make_sheet("one", "1", edges=edges)
+        fetcher.main()
+
+        assert [edge["name"] for _, edge in self.read_cache(path)[0]] == [
+            "A--B %d" % i for i in range(10)
+        ]
+
+    def test_failed_write_keeps_previous_contents(self, sheets, monkeypatch):
+        """Test that a refresh that fails part way leaves the cache as it was"""
+        sheets_data, fake, path = sheets
+        sheets_data["s1"] = make_sheet("one", "1")
+        fetcher.main()
+        before = self.read_cache(path)
+
+        sheets_data["s1"] = make_sheet("one", "2")
+        sheets_data["s2"] = make_sheet("two", "1")
+
+        def failing_insert(self, sheet_id, data, table):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(fetcher.CacheWriter, "_insert", failing_insert)
+        with pytest.raises(sqlite3.OperationalError):
+            fetcher.main()
+        assert self.read_cache(path) == before
+
+    def test_readers_see_the_previous_or_the_new_cache(self, sheets):
+        """Test that a reader in the middle of a refresh keeps seeing the previous contents"""
+        sheets_data, fake, path = sheets
+        sheets_data["s1"] = make_sheet("one", "1")
+        fetcher.main()
+
+        reader = sqlite3.connect(path, isolation_level=None)
+        reader.execute("BEGIN")
+        query = "SELECT count(*) FROM %s" % GOOGLE_SHEETS_TABLE_NAME
+        assert reader.execute(query).fetchone() == (1,)
+
+        sheets_data["s2"] = make_sheet("two", "1")
+        fetcher.main()
+        assert reader.execute(query).fetchone() == (1,)
+        reader.execute("COMMIT")
+        assert reader.execute(query).fetchone() == (2,)
+        reader.close()
+
+    def test_edge_table_is_indexed_by_sheet(self, sheets):
+        """Test that the edge table keeps its index across refreshes"""
+        sheets_data, fake, path = sheets
+        for version in ("1", "2", "3"):
+            sheets_data["s1"] = make_sheet("one", version)
+            fetcher.main()
+
+        conn = sqlite3.connect(path)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT edge FROM %s WHERE sheet_id = ?" % GOOGLE_SHEETS_TABLE_NAME,
+            ("s1",),
+        ).fetchall()
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master")]
+        conn.close()
+        assert "USING INDEX" in plan[0][3]
+        assert "%s_staging" % GOOGLE_SHEETS_TABLE_NAME not in tables
+
+
+def fetch_all(known_versions=None):
+    """Runs a SheetsFetch to the end, returning (edges, metadata, seen) by sheet id"""
+    sheets = fetcher.SheetsFetch(known_versions)
+    output, metadata = {}, {}
+    for sheet_id, sheet_metadata, edges in sheets:
+        output[sheet_id] = edges
+        metadata[sheet_id] = sheet_metadata
+    return output, metadata, sheets.seen
+
+
+class TestConcurrentFetch:
+    """Tests for fetching many sheets and credentials against a fake Google"""
+
+    @pytest.fixture
+    def google(self, fake_google, monkeypatch):
+        fake, url = fake_google
+        monkeypatch.setattr(
+            fetcher,
+            "CLIENT_OPTIONS",
+            {"drive": {"api_endpoint": url}, "sheets": {"api_endpoint": url}},
+        )
+        monkeypatch.setattr(fetcher, "make_credentials", lambda token: AnonymousCredentials())
+        return fake
+
+    def test_one_request_per_sheet(self, google, monkeypatch):
+        """Test that both ranges of a sheet are read with a single batchGet"""
+        monkeypatch.setattr(fetcher, "enumerate_credentials", lambda: [{}])
+        google.sheets.update({"s%d" % i: make_sheet("sheet %d" % i, "1") for i in range(5)})
+        output, metadata, seen = fetch_all()
+
+        batch_gets = [path for path in google.requests if BATCH_GET.match(path)]
+        assert sorted(batch_gets) == sorted(set(batch_gets))
+        assert len(batch_gets) == 5
+        assert seen == set(google.sheets)
+        assert all(len(edges) == 1 for edges in output.values())
+        assert metadata["s0"]["columns"][:4] == ["name", "description", "source", "destination"]
+
+    def test_bounded_concurrency(self, google, monkeypatch):
+        """Test that sheets are fetched concurrently, up to the configured bound"""
+        monkeypatch.setattr(fetcher, "enumerate_credentials", lambda: [{}, {}])
+        monkeypatch.setattr(fetcher, "GOOGLE_SHEETS_FETCH_CONCURRENCY", 3)
+        google.delay = 0.05
+        google.sheets.update({"s%d" % i: make_sheet("sheet %d" % i, "1") for i in range(9)})
+        output, metadata, seen = fetch_all()
+
+        assert google.max_in_flight == 3
+        # both credentials see every sheet, but each is fetched once
+        assert len([path for path in google.requests if BATCH_GET.match(path)]) == 9
+        assert set(output) == set(google.sheets)
+
+    def test_listing_follows_pages(self, google, monkeypatch):
+        """Test that every page of the Drive listing is read"""
+        monkeypatch.setattr(fetcher, "enumerate_credentials", lambda: [{}])
+        google.page_size = 2
+        google.sheets.update({"s%d" % i: make_sheet("sheet %d" % i, "1") for i in range(5)})
+        output, metadata, seen = fetch_all()
+
+        assert len([path for path in google.requests if path.endswith("/files")]) == 3
+        assert seen == set(google.sheets)
+        assert set(output) == set(google.sheets)
+
+    def test_sheets_are_fetched_as_they_are_consumed(self, google, monkeypatch):
+        """Test that no more than the concurrency bound of sheets is fetched ahead"""
+        monkeypatch.setattr(fetcher, "enumerate_credentials", lambda: [{}])
+        monkeypatch.setattr(fetcher, "GOOGLE_SHEETS_FETCH_CONCURRENCY", 2)
+        google.sheets.update({"s%d" % i: make_sheet("sheet %d" % i, "1") for i in range(6)})
+        sheets = iter(fetcher.SheetsFetch())
+
+        next(sheets)
+        assert len([path for path in google.requests if BATCH_GET.match(path)]) <= 2
+        assert len(list(sheets)) == 5
+
+    def test_malformed_sheets(self, google, monkeypatch):
+        """Test that sheets without the Terranova ranges or columns are kept without edges"""
+        monkeypatch.setattr(fetcher, "enumerate_credentials", lambda: [{}])
+        google.sheets["good"] = make_sheet("good", "1")
+        google.sheets["no_nodes"] = {"name": "no nodes", "version": "1", "Edges!A:Z": EDGES}
+        google.sheets["no_source"] = make_sheet(
+            "no source", "1", edges=[["Name", "Description", "Destination"], ["x", "y", "A"]]
+        )
+        output, metadata, seen = fetch_all()
+
+        assert output["no_nodes"] == [] and metadata["no_nodes"]["columns"] == []
+        assert output["no_source"] == [] and metadata["no_source"]["columns"] == []
+        assert len(output["good"]) == 1
+
+    def test_transient_errors_are_retried(self, google, monkeypatch):
+        """Test that a sheet is read again after errors Google recovers from"""
+        monkeypatch.setattr(fetcher, "enumerate_credentials", lambda: [{}])
+        monkeypatch.setattr(fetcher, "RETRY_BACKOFF", 0)
+        google.sheets["s1"] = make_sheet("one", "1")
+        google.failures["s1"] = [503, 429]
+        sheets = fetcher.SheetsFetch()
+        output = {sheet_id: edges for sheet_id, _, edges in sheets}
+
+        assert len([path for path in google.requests if BATCH_GET.match(path)]) == 3
+        assert len(output["s1"]) == 1
+        assert sheets.failed == set()
+
+    def test_failed_sheet_does_not_hide_the_others(self, google, monkeypatch):
+        """Test that the other sheets are fetched when one of them fails"""
+        monkeypatch.setattr(fetcher, "enumerate_credentials", lambda: [{}])
+        google.sheets.update({"s%d" % i: make_sheet("sheet %d" % i, "1") for i in range(4)})
+        fetch_sheet = fetcher.fetch_sheet
+
+        def failing_fetch_sheet(client, target_sheet):
+            if target_sheet["id"] == "s2":
+                raise ConnectionResetError("connection reset by peer")
+            return fetch_sheet(client, target_sheet)
+
+        monkeypatch.setattr(fetcher, "fetch_sheet", failing_fetch_sheet)
+        sheets = fetcher.SheetsFetch()
+        output = {sheet_id: edges for sheet_id, _, edges in sheets}
+
+        assert sorted(output) == ["s0", "s1", "s3"]
+        assert sheets.failed == {"s2"}
+        assert sheets.seen == set(google.sheets)
@@ -0,0 +1,452 @@
+import importlib
+import os
+import re
+import sqlite3
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from terranova.abstract_models import QueryFilter, InputModifier, filter_plan
+from terranova.models import Dataset
+from terranova.settings import (
+    GOOGLE_SHEETS_TABLE_NAME,
+    GOOGLE_SHEETS_META_TABLE_NAME,
+    GOOGLE_SHEETS_ENDPOINT_TABLE_NAME,
+    GOOGLE_SHEETS_VALUE_TABLE_NAME,
+)
+
+# the package exports a `fetch` function that shadows the submodule's name
+fetcher = importlib.import_module("terranova.datasources.google_sheets.fetcher")
+backend_module = importlib.import_module("terranova.datasources.google_sheets.backend")
+
+NODES = [
+    ["Name", "Latitude", "Longitude", "Description", "Site", "Tag", "Tag"],
+    ["A", "1", "2", "node a", "chicago", "red", "blue"],
+    ["B", "3", "4", "node b", "denver", "red", ""],
+    ["C", "5", "6", "node c", "chicago", "green", ""],
+]
+EDGES = [
+    ["Name", "Description", "Source", "Destination", "Speed", "Owner", "Owner"],
+    ["A--B", "first", "A", "B", "100", "esnet", "doe"],
+    ["B--C", "second", "B", "C", "400", "doe", ""],
+    ["A--C", "third", "A", "C", "100", "", ""],
+    ["C--C", "loop", "C", "C", "10", "internet2", ""],
+]
+
+
+def make_filter(field, value, operator=None):
+    return QueryFilter(field=field, operator=operator, value=value)
+
+
+@pytest.fixture
+def sheets_backend(monkeypatch):
+    """A Google Sheets backend reading a temporary cache with one sheet, "s1", in it"""
+    temp_fd, temp_path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(temp_fd)
+    monkeypatch.setattr(fetcher, "GOOGLE_SHEETS_CACHE_FILE", temp_path)
+
+    columns, types, edges = fetcher.parse_sheet({"Nodes!A:Z": NODES, "Edges!A:Z": EDGES})
+    writer = fetcher.CacheWriter()
+    writer.begin_refresh()
+    writer.stage_sheet(
+        "s1",
+        {"name": "one", "columns": columns, "types": types, "version": "1", "modified_time": None},
+        edges,
+    )
+    writer.finish_refresh()
+    writer.conn.close()
+
+    engine = create_engine("sqlite:///" + temp_path, poolclass=NullPool)
+    backend = backend_module.GoogleSheetsBackend()
+    backend.session = sessionmaker(bind=engine)()
+    yield backend, temp_path
+
+    backend.session.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(temp_path + suffix):
+            os.remove(temp_path + suffix)
+
+
+def names(backend, filters):
+    return [edge["name"] for edge in backend.query(filters, limit=None, sheet_id="s1").data]
+
+
+def json_names(backend, filters):
+    """The edges the filters match when they're applied to the edge documents"""
+    query = backend.session.query(backend_module.EdgeTable.edge).filter_by(sheet_id="s1")
+    query = backend_module.SQLiteCacheDatasource.apply_filters(backend, query, filters, True)
+    return [row[0]["name"] for row in query.order_by(backend_module.EdgeTable.id)]
+
+
+class TestNormalizedCache:
+    """Tests for the tables the fetcher writes for the query engine"""
+
+    def test_endpoints_and_values_are_written(self, sheets_backend):
+        """Test that every edge is broken down into its endpoints and column values"""
+        backend, path = sheets_backend
+        conn = sqlite3.connect(path)
+        edge_id = conn.execute(
+            "SELECT id FROM %s WHERE name = 'A--B'" % GOOGLE_SHEETS_TABLE_NAME
+        ).fetchone()[0]
+        endpoints = conn.execute(
+            "SELECT position, name, latitude, longitude FROM %s WHERE edge_id = ? "
+            "ORDER BY position" % GOOGLE_SHEETS_ENDPOINT_TABLE_NAME,
+            (edge_id,),
+        ).fetchall()
+        values = conn.execute(
+            "SELECT endpoint, field, value FROM %s WHERE edge_id = ? ORDER BY id"
+            % GOOGLE_SHEETS_VALUE_TABLE_NAME,
+            (edge_id,),
+        ).fetchall()
+        conn.close()
+
+        assert endpoints == [(0, "A", "1", "2"), (1, "B", "3", "4")]
+        assert (None, "speed", "100") in values
+        assert (None, "owner", "esnet") in values and (None, "owner", "doe") in values
+        assert (0, "endpoints_tag", "red") in values
+        assert (0, "endpoints_tag", "blue") in values
+        assert (1, "endpoints_site", "denver") in values
+        # the edge name is kept in the edge table
+        assert not [value for value in values if value[1] == "name"]
+
+    def test_filters_use_indexes(self, sheets_backend):
+        """Test that the lookups filters make are answered by the tables' indexes"""
+        backend, path = sheets_backend
+        conn = sqlite3.connect(path)
+        for query in [
+            "SELECT edge_id FROM %s WHERE sheet_id = 's1' AND name = 'A'"
+            % GOOGLE_SHEETS_ENDPOINT_TABLE_NAME,
+            "SELECT edge_id FROM %s WHERE sheet_id = 's1' AND field = 'speed' AND value = '100'"
+            % GOOGLE_SHEETS_VALUE_TABLE_NAME,
+            "SELECT id FROM %s WHERE sheet_id = 's1' AND name = 'A--B'" % GOOGLE_SHEETS_TABLE_NAME,
+        ]:
+            plan = conn.execute("EXPLAIN QUERY PLAN %s" % query).fetchall()
+            assert "USING" in plan[0][3] and "INDEX" in plan[0][3], query
+        conn.close()
+
+    def test_indexes_are_reported(self, sheets_backend):
+        """Test that the sheet's metadata names the index each column is looked up in"""
+        backend, path = sheets_backend
+        (sheet,) = backend.list_sheets().data
+        assert sheet["indexes"]["name"] == "%s (sheet_id, name)" % GOOGLE_SHEETS_TABLE_NAME
+        assert sheet["indexes"]["endpoints_name"] == (
+            "%s (sheet_id, name, edge_id)" % GOOGLE_SHEETS_ENDPOINT_TABLE_NAME
+        )
+        value_index = "%s (sheet_id, field, value, edge_id)" % GOOGLE_SHEETS_VALUE_TABLE_NAME
+        assert sheet["indexes"]["speed"] == value_index
+        assert sheet["indexes"]["endpoints_site"] == value_index
+        assert set(sheet["indexes"]) == set(sheet["columns"])
+
+    def test_indexes_are_added_to_existing_metadata(self, sheets_backend):
+        """Test that sheets cached before indexes were reported get them on the next refresh"""
+        backend, path = sheets_backend
+        conn = sqlite3.connect(path)
+        conn.execute("ALTER TABLE %s DROP COLUMN indexes" % GOOGLE_SHEETS_META_TABLE_NAME)
+        conn.commit()
+        conn.close()
+
+        fetcher.CacheWriter().conn.close()
+        (sheet,) = backend.list_sheets().data
+        assert set(sheet["indexes"]) == set(sheet["columns"])
+
+    def test_outdated_caches_are_fetched_again(self, sheets_backend):
+        """Test that a cache written before the normalized tables existed is emptied"""
+        backend, path = sheets_backend
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+        conn.close()
+
+        writer = fetcher.CacheWriter()
+        assert writer.sheet_versions() == {}
+        tables = {
+            row[0]
+            for row in writer.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        assert {GOOGLE_SHEETS_TABLE_NAME, GOOGLE_SHEETS_META_TABLE_NAME} <= tables
+        assert writer.conn.execute("PRAGMA user_version").fetchone() == (
+            fetcher.CACHE_SCHEMA_VERSION,
+        )
+        writer.conn.close()
+
+
+class TestSheetFilters:
+    """Tests for filtering a sheet's edges on the normalized tables"""
+
+    @pytest.mark.parametrize(
+        "filters",
+        [
+            [],
+            [make_filter("name", ["A--B", "C--C"])],
+            [make_filter("name", ["A--B"], InputModifier.not_equal)],
+            [make_filter("name", ["--C"], InputModifier.like)],
+            [make_filter("name", ["A-"], InputModifier.not_like)],
+            [make_filter("speed", ["100"])],
+            [make_filter("speed", ["100", "10"], InputModifier.not_equal)],
+            [make_filter("endpoints_name", ["A", "B"])],
+            [make_filter("endpoints_name", ["A"], InputModifier.not_equal)],
+            [make_filter("endpoints_description", ["node"], InputModifier.like)],
+            [make_filter("endpoints_name", ["B"], InputModifier.not_like)],
+        ],
+    )
+    def test_same_edges_as_the_documents(self, sheets_backend, filters):
+        """Test that filters on modelled and scalar columns match as in the edge documents"""
+        backend, path = sheets_backend
+        assert names(backend, filters) == json_names(backend, filters)
+
+    def test_array_filters(self, sheets_backend):
+        """Test that array columns match if any of their values does"""
+        backend, path = sheets_backend
+        assert names(backend, [make_filter("owner", ["doe"])]) == ["A--B", "B--C"]
+        assert names(backend, [make_filter("owner", ["net"], InputModifier.like)]) == [
+            "A--B",
+            "C--C",
+        ]
+
+    def test_endpoint_filters(self, sheets_backend):
+        """Test that filters on sheet-specific endpoint columns are applied"""
+        backend, path = sheets_backend
+        assert names(backend, [make_filter("endpoints_site", ["denver"])]) == ["A--B", "B--C"]
+        assert names(backend, [make_filter("endpoints_site", ["den"], InputModifier.like)]) == [
+            "A--B",
+            "B--C",
+        ]
+        # negated filters exclude the edges with any endpoint that matches
+        assert names(
+            backend, [make_filter("endpoints_tag", ["blue"], InputModifier.not_equal)]
+        ) == ["B--C", "C--C"]
+        assert names(
+            backend, [make_filter("endpoints_site", ["den"], InputModifier.not_like)]
+        ) == ["A--C", "C--C"]
+        assert names(
+            backend, [make_filter("speed", ["100"]), make_filter("endpoints_site", ["denver"])]
+        ) == ["A--B"]
+
+    def test_unknown_fields_are_ignored(self, sheets_backend):
+        """Test that filters on columns the sheet doesn't have don't exclude anything"""
+        backend, path = sheets_backend
+        assert names(backend, [make_filter("colour", ["red"])]) == ["A--B", "B--C", "A--C", "C--C"]
+
+    def test_count_and_limit(self, sheets_backend):
+        """Test that the count covers every match while the rows stop at the limit"""
+        backend, path = sheets_backend
+        result = backend.query([make_filter("speed", ["100"])], limit=1, sheet_id="s1")
+        assert result.count == 2
+        assert [edge["name"] for edge in result.data] == ["A--B"]
+
+
+class TestPagination:
+    """Tests for counting and paging through the edges of a sheet"""
+
+    def test_pages(self, sheets_backend):
+        """Test that pages continue after the previous one and all carry the count"""
+        backend, path = sheets_backend
+        pages, after = [], None
+        while True:
+            result = backend.query([], limit=3, sheet_id="s1", after=after)
+            assert result.count == 4
+            pages.append([edge["name"] for edge in result.data])
+            after = result.next_after
+            if after is None:
+                break
+        assert pages == [["A--B", "B--C", "A--C"], ["C--C"]]
+
+        # a page past the last edge still counts them
+        result = backend.query([], limit=3, sheet_id="s1", after=10**6)
+        assert (result.count, result.data, result.next_after) == (4, [], None)
+
+    def test_filtered_pages(self, sheets_backend):
+        """Test that the count covers the matches before the cursor too"""
+        backend, path = sheets_backend
+        filters = [make_filter("speed", ["100"])]
+        first = backend.query(filters, limit=1, sheet_id="s1")
+        second = backend.query(filters, limit=1, sheet_id="s1", after=first.next_after)
+        assert [edge["name"] for edge in first.data + second.data] == ["A--B", "A--C"]
+        assert first.count == second.count == 2
+
+    def test_without_count(self, sheets_backend):
+        """Test that count=False only reads the rows"""
+        backend, path = sheets_backend
+        result = backend.query([], limit=2, sheet_id="s1", count=False)
+        assert result.count is None
+        assert [edge["name"] for edge in result.data] == ["A--B", "B--C"]
+        result = backend.query([], limit=2, sheet_id="s1", after=result.next_after, count=False)
+        assert [edge["name"] for edge in result.data] == ["A--C", "C--C"]
+
+    def test_count_only(self, sheets_backend):
+        """Test that limit=0 returns just the count"""
+        backend, path = sheets_backend
+        result = backend.query([make_filter("speed", ["100"])], limit=0, sheet_id="s1")
+        assert (result.count, result.data) == (2, [])
+
+    @pytest.mark.parametrize("after", [None, 1])
+    def test_single_query(self, sheets_backend, after):
+        """Test that the rows and their count are read with one statement"""
+        backend, path = sheets_backend
+        backend.sheet_metadata("s1")
+        statements = []
+        event.listen(
+            backend.session.get_bind(),
+            "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+        backend.query([make_filter("speed", ["100"])], limit=1, sheet_id="s1", after=after)
+        edge_reads = [s for s in statements if "FROM %s" % GOOGLE_SHEETS_TABLE_NAME in s]
+        assert len(edge_reads) == 1
+
+    def test_route(self, sheets_backend, client, readonly_jwt, monkeypatch):
+        """Test that the edges route pages with the X-Next-After header"""
+        backend, path = sheets_backend
+        router = importlib.import_module("terranova.datasources.google_sheets.router")
+        monkeypatch.setattr(router, "backend", backend)
+        headers = {"Authorization": "Bearer %s" % readonly_jwt}
+
+        response = client.get("/sheets/s1/edges/?limit=1&speed=100", headers=headers)
+        assert [edge["name"] for edge in response.json()] == ["A--B"]
+        assert response.headers["X-Result-Count"] == "2"
+        after = response.headers["X-Next-After"]
+
+        response = client.get(
+            "/sheets/s1/edges/?limit=1&speed=100&count=false&after=%s" % after, headers=headers
+        )
+        assert [edge["name"] for edge in response.json()] == ["A--C"]
+        assert "X-Result-Count" not in response.headers
+
+
+class TestFilterPlans:
+    """Tests for planning filters once per record model and filter shape"""
+
+    def test_schema_is_not_rebuilt(self, sheets_backend, monkeypatch):
+        """Test that filtering doesn't build the record model's JSON schema again"""
+        backend, path = sheets_backend
+
+        def model_json_schema(*args, **kwargs):
+            raise AssertionError("the JSON schema was built while filtering")
+
+        monkeypatch.setattr(backend.record_model, "model_json_schema", model_json_schema)
+        filters = [
+            make_filter("endpoints_name", ["A"], InputModifier.not_equal),
+            make_filter("description", ["loo"], InputModifier.not_like),
+        ]
+        assert json_names(backend, filters) == ["B--C"]
+        assert names(backend, filters) == ["B--C"]
+
+    def test_plans_are_reused(self, sheets_backend):
+        """Test that filters of the same shape share a plan"""
+        backend, path = sheets_backend
+        plan = filter_plan(backend.record_model, "endpoints_name", InputModifier.not_equal)
+        assert plan.kind == "object_array" and plan.negated
+        assert plan.path == "$.endpoints" and plan.child == "$.name"
+        assert filter_plan(backend.record_model, "endpoints_name", InputModifier.not_equal) is plan
+
+
+class TestSheetMetadataCache:
+    """Tests for keeping the metadata of the cached sheets in memory"""
+
+    def test_read_once_per_refresh(self, sheets_backend):
+        """Test that queries don't read the sheet's metadata from the cache file again"""
+        backend, path = sheets_backend
+        names(backend, [make_filter("speed", ["100"])])
+        statements = []
+        event.listen(
+            backend.session.get_bind(),
+            "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+        for _ in range(3):
+            names(backend, [make_filter("speed", ["100"]), make_filter("endpoints_site", ["x"])])
+        # the version of the cache is read on every query, its metadata isn't
+        metadata = re.compile(r"FROM %s\b" % GOOGLE_SHEETS_META_TABLE_NAME)
+        reads = [s for s in statements if metadata.search(s)]
+        assert reads == []
+
+    def test_version_unchanged_by_readers(self, sheets_backend):
+        """Test that opening and closing other connections to the cache isn't a refresh"""
+        backend, path = sheets_backend
+        version = backend.cache_version()
+        conn = sqlite3.connect(path)
+        conn.execute("SELECT count(*) FROM %s" % GOOGLE_SHEETS_TABLE_NAME).fetchone()
+        assert backend.cache_version() == version
+        conn.close()
+        assert backend.cache_version() == version
+
+        # as does a refresh where nothing changed
+        writer = fetcher.CacheWriter()
+        writer.begin_refresh()
+        writer.finish_refresh()
+        writer.conn.close()
+        assert backend.cache_version() == version
+
+    def test_reloaded_after_refresh(self, sheets_backend):
+        """Test that sheets added by a refresh are picked up"""
+        backend, path = sheets_backend
+        assert backend.sheet_metadata("s2") is None
+        assert backend.sheet_metadata("s1").column_types["owner"] == "array"
+
+        columns, types, edges = fetcher.parse_sheet({"Nodes!A:Z": NODES, "Edges!A:Z": EDGES[:2]})
+        writer = fetcher.CacheWriter()
+        writer.begin_refresh()
+        writer.stage_sheet(
+            "s2",
+            {"name": "two", "columns": columns, "types": types, "version": "1"}
+            | {"modified_time": None},
+            edges,
+        )
+        version = backend.cache_version()
+        writer.finish_refresh()
+        writer.conn.close()
+
+        assert backend.cache_version() == version + 1
+        assert backend.sheet_metadata("s2").sheet_name == "two"
+        assert backend.list_columns("s2") == columns
+        assert backend.query([], sheet_id="s2").count == 1
+
+
+class TestDistinctValues:
+    """Tests for listing the distinct values of a sheet's column"""
+
+    def distinct(self, backend, field, filters=[]):
+        return backend.get_unique_values(field, filters, extra_criteria=[{"sheet_id": "s1"}])
+
+    def test_columns(self, sheets_backend):
+        """Test that edge, endpoint and array columns list each of their values once"""
+        backend, path = sheets_backend
+        assert self.distinct(backend, "name") == ["A--B", "A--C", "B--C", "C--C"]
+        assert self.distinct(backend, "speed") == ["10", "100", "400"]
+        assert self.distinct(backend, "owner") == ["doe", "esnet", "internet2"]
+        assert self.distinct(backend, "endpoints_name") == ["A", "B", "C"]
+        assert self.distinct(backend, "endpoints_tag") == ["blue", "green", "red"]
+
+    def test_filtered(self, sheets_backend):
+        """Test that only the values of the edges matching the filters are listed"""
+        backend, path = sheets_backend
+        filters = [make_filter("speed", ["100"]), make_filter("owner", [])]
+        assert self.distinct(backend, "endpoints_site", filters) == ["chicago", "denver"]
+        assert self.distinct(backend, "name", filters) == ["A--B", "A--C"]
+
+
+class TestRendering:
+    """Tests for rendering a dataset from the sheets cache"""
+
+    def test_storage_is_not_read(self, sheets_backend, monkeypatch):
+        """Test that rendering only reads the cache; the API passes revisions in"""
+
+        class NoStorage:
+            def __getattr__(self, name):
+                raise AssertionError("storage backend used: %s" % name)
+
+        backend, path = sheets_backend
+        monkeypatch.setattr(backend_module, "storage_backend", NoStorage())
+        dataset = Dataset(
+            datasetId="abc",
+            name="test",
+            version=1,
+            query={"endpoint": "google_sheets", "filters": [make_filter("speed", ["100"])]},
+            lastUpdatedBy="test",
+            lastUpdatedOn="2000-01-01T00:00:00",
+        )
+        topology = backend.render_topology(dataset, sheet_id="s1")
+        assert len(topology.edges) == 2
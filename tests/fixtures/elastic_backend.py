@@ -2,6 +2,7 @@ import pytest
 import os
 import json
 import terranova.backends.elasticsearch
+from terranova.backends.elasticsearch.async_backend import AsyncElasticSearchBackend
 from terranova.logging import logger
 from testcontainers.elasticsearch import ElasticSearchContainer
 from collections import defaultdict
@@ -101,13 +102,14 @@ datastore = defaultdict(lambda: defaultdict(dict))
 @pytest.fixture(scope="session")
 def mock_elastic_backend():
     nonsense_url = "http://example.com:80"
-    backend = terranova.backends.elasticsearch.ElasticSearchBackend(nonsense_url)
+    # the API routers await the async interface to storage
+    backend = AsyncElasticSearchBackend(nonsense_url)
 
-    def mock_create(index, id, doc):
+    async def mock_create(index, id, doc):
         datastore[index][id] = doc
         return doc
 
-    def mock_query(index, query, collapse=None, sort=None, fields=None):
+    async def mock_query(index, query, collapse=None, sort=None, fields=None):
         # Transform e.g. "terranova-layer-*" to "terranova-layer" to match. pretty crappy
         index = index.replace("-*", "")
         idx = datastore[index]
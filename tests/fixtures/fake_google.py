@@ -0,0 +1,112 @@
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import orjson
+import pytest
+
+BATCH_GET = re.compile(r".*/v4/spreadsheets/(?P<sheet_id>[^/]+)/values:batchGet$")
+
+
+class FakeGoogle:
+    """
+    A local stand-in for the Drive files.list and Sheets values.batchGet APIs.
+    `sheets` maps a sheet id to {"name", "version", <range>: rows, ...}.
+    """
+
+    def __init__(self):
+        self.sheets = {}
+        self.requests = []
+        self.page_size = None  # files per listing page, overriding the requested pageSize
+        self.delay = 0  # seconds each batchGet takes
+        self.failures = {}  # sheet id => statuses its next batchGets fail with, in order
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def list_files(self, params):
+        page_size = self.page_size or int(params.get("pageSize", ["100"])[0])
+        start = int(params.get("pageToken", ["0"])[0])
+        files = [
+            {
+                "id": sheet_id,
+                "name": sheet["name"],
+                "version": sheet["version"],
+                "modifiedTime": "2024-01-01T00:00:%02dZ" % int(sheet["version"]),
+            }
+            for sheet_id, sheet in self.sheets.items()
+        ]
+        end = start + page_size
+        page = {"files": files[start:end]}
+        if end < len(files):
+            page["nextPageToken"] = str(end)
+        return page
+
+    def batch_get(self, sheet_id, params):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            with self.lock:
+                failures = self.failures.get(sheet_id)
+                status = failures.pop(0) if failures else None
+            if status is not None:
+                return status, {"error": {"code": status, "message": "Service unavailable"}}
+            sheet = self.sheets[sheet_id]
+            if any(cell_range not in sheet for cell_range in params["ranges"]):
+                return 400, {"error": {"code": 400, "message": "Unable to parse range"}}
+            return 200, {
+                "spreadsheetId": sheet_id,
+                "valueRanges": [
+                    {"range": cell_range, "majorDimension": "ROWS", "values": sheet[cell_range]}
+                    for cell_range in params["ranges"]
+                ],
+            }
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # headers and body are written separately; don't let them wait on each other
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                params = parse_qs(url.query)
+                with fake.lock:
+                    fake.requests.append(url.path)
+                status, body = 404, {"error": {"code": 404, "message": "Not found"}}
+                match = BATCH_GET.match(url.path)
+                if url.path.endswith("/files"):
+                    status, body = 200, fake.list_files(params)
+                elif match:
+                    status, body = fake.batch_get(match.group("sheet_id"), params)
+                payload = orjson.dumps(body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def fake_google():
+    """Runs a FakeGoogle server, yielding (fake, url)"""
+    fake = FakeGoogle()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), fake.handler())
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield fake, "http://127.0.0.1:%d/" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+
+import pytest
+
+from terranova.abstract_models import Topology
+from terranova.output.cache import TopologyCache, topology_key
+
+
+def topology(name="test"):
+    return Topology(
+        nodes=[{"name": "a", "coordinate": [1.0, 2.0], "meta": {"svg": "<g/>"}}],
+        edges=[],
+        layer="tail",
+        name=name,
+        pathLayout={"type": "curveLinear", "tension": 0.6},
+    )
+
+
+def key(**overrides):
+    args = {
+        "dataset_id": "abc1234",
+        "version": 1,
+        "layout": "geographic",
+        "datatype": "snapshot",
+        "output_type": "json",
+        "node_template": "<g/>",
+        "query_params": [],
+        "source_version": None,
+    }
+    args.update(overrides)
+    return topology_key(**args)
+
+
+class TestTopologyKey:
+    """Tests for the dataset output cache key"""
+
+    def test_query_parameter_order_is_ignored(self):
+        """Test that reordering query parameters gives the same key"""
+        assert key(query_params=[("a", "1"), ("b", "2")]) == key(
+            query_params=[("b", "2"), ("a", "1")]
+        )
+
+    def test_every_input_is_part_of_the_key(self):
+        """Test that changing any input gives a different key"""
+        keys = {
+            key(),
+            key(dataset_id="def5678"),
+            key(version=2),
+            key(layout="logical"),
+            key(datatype="live"),
+            key(output_type="svg"),
+            key(node_template="<rect/>"),
+            key(query_params=[("a", "1")]),
+            key(source_version=1),
+        }
+        assert len(keys) == 9
+
+
+class TestTopologyCache:
+    """Tests for the rendered topology cache"""
+
+    @pytest.fixture
+    def path(self):
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".sqlite")
+        os.close(temp_fd)
+        yield temp_path
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(temp_path + suffix):
+                os.remove(temp_path + suffix)
+
+    def test_memory_lru(self):
+        """Test that the least recently used output is evicted when the cache is full"""
+        cache = TopologyCache(max_entries=2, path=None)
+        cache.set("a", "google_sheets", None, topology("a"))
+        cache.set("b", "google_sheets", None, topology("b"))
+        cache.get("a", "google_sheets")
+        cache.set("c", "google_sheets", None, "<svg/>")
+
+        assert cache.get("b", "google_sheets") is None
+        assert cache.get("a", "google_sheets").name == "a"
+        assert cache.get("c", "google_sheets") == "<svg/>"
+        assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1}
+
+    def test_refresh_drops_live_output(self):
+        """Test that a new datasource cache version drops live, but not snapshot, output"""
+        cache = TopologyCache(max_entries=10, path=None)
+        cache.set("live", "google_sheets", 1, topology())
+        cache.set("snapshot", "google_sheets", None, topology())
+        cache.set("other", "esdb", 1, topology())
+
+        assert cache.get("live", "google_sheets", 1) is not None
+        cache.get("unrelated", "google_sheets", 2)
+        assert cache.get("live", "google_sheets", 2) is None
+        assert cache.get("snapshot", "google_sheets") is not None
+        assert cache.get("other", "esdb", 1) is not None
+
+    def test_file_is_shared(self, path):
+        """Test that output written by one cache is read by another using the same file"""
+        writer = TopologyCache(max_entries=10, path=path)
+        writer.set("topology", "google_sheets", None, topology("persisted"))
+        writer.set("svg", "google_sheets", None, "<svg></svg>")
+
+        reader = TopologyCache(max_entries=10, path=path)
+        assert reader.get("topology", "google_sheets") == topology("persisted")
+        assert reader.get("svg", "google_sheets") == "<svg></svg>"
+
+    def test_file_is_bounded(self, path):
+        """Test that the file keeps at most max_file_entries outputs"""
+        cache = TopologyCache(max_entries=10, path=path, max_file_entries=2)
+        for name in ("a", "b", "c"):
+            cache.set(name, "google_sheets", None, "<svg>%s</svg>" % name)
+
+        reader = TopologyCache(max_entries=10, path=path)
+        assert reader.get("a", "google_sheets") is None
+        assert reader.get("c", "google_sheets") == "<svg>c</svg>"
+
+    def test_clear_survives_file_errors(self):
+        """Test that clear() empties the memory cache when the file can't be written"""
+        with tempfile.TemporaryDirectory() as directory:
+            # a directory can't be opened as a database
+            cache = TopologyCache(max_entries=10, path=directory)
+            cache.set("a", "google_sheets", None, "<svg/>")
+            cache.clear()
+
+        assert cache.stats()["entries"] == 0
@@ -0,0 +1,111 @@
+from starlette.requests import Request
+
+from terranova import request as request_context
+from terranova.abstract_models import QueryFilter
+from terranova.api.routers import output
+from terranova.api.routers.output import _etag, _not_modified, _templated_values
+from terranova.models import Dataset
+
+
+def make_request(if_none_match=None, query_string=""):
+    headers = []
+    if if_none_match is not None:
+        headers.append((b"if-none-match", if_none_match.encode()))
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": headers,
+            "query_string": query_string.encode(),
+        }
+    )
+
+
+class TestETag:
+    """Tests for deriving ETags and evaluating If-None-Match"""
+
+    def test_etag_is_strong_and_stable(self):
+        """Test that the same keys always give the same quoted ETag"""
+        assert _etag("abc") == '"abc"'
+        assert _etag("map", "a", 1, "abc") == _etag("map", "a", 1, "abc")
+        assert _etag("map", "a", 1, "abc") != _etag("map", "a", 2, "abc")
+        assert not _etag("map", "a", 1).startswith("W/")
+
+    def test_unidentifiable_output_has_no_etag(self):
+        """Test that a missing key means there is no ETag to revalidate against"""
+        assert _etag("map", "a", 1, None) is None
+        assert _not_modified(make_request("*"), None) is False
+
+    def test_if_none_match(self):
+        """Test matching against lists, wildcards and weak validators"""
+        etag = _etag("abc")
+        assert _not_modified(make_request('"abc"'), etag)
+        assert _not_modified(make_request('"xyz", "abc"'), etag)
+        assert _not_modified(make_request('W/"abc"'), etag)
+        assert _not_modified(make_request("*"), etag)
+        assert not _not_modified(make_request('"xyz"'), etag)
+        assert not _not_modified(make_request(), etag)
+
+
+class TestConditionalPublicMap:
+    """Tests for conditional requests against the public map output"""
+
+    def test_not_modified(self, client, mock_elastic_backend, monkeypatch):
+        """Test that a request naming the current ETag gets an empty 304"""
+        monkeypatch.setattr(output, "storage_backend", mock_elastic_backend)
+        first = client.get("/public/output/map/{mapId}/")
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"].startswith("public")
+
+        second = client.get("/public/output/map/{mapId}/", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.headers["etag"] == etag
+        assert second.content == b""
+
+        changed = client.get("/public/output/map/{mapId}/", headers={"If-None-Match": '"x"'})
+        assert changed.status_code == 200
+
+    def test_output_types_have_different_etags(self, client, mock_elastic_backend, monkeypatch):
+        """Test that the svg and json output of a map revision are told apart"""
+        monkeypatch.setattr(output, "storage_backend", mock_elastic_backend)
+        json_output = client.get("/public/output/map/{mapId}/json/")
+        svg_output = client.get("/public/output/map/{mapId}/svg/")
+        assert json_output.headers["etag"] != svg_output.headers["etag"]
+        assert svg_output.headers["cache-control"].startswith("public")
+
+
+class TestTemplatedValues:
+    """Tests for the query parameters a dataset output is keyed by"""
+
+    def dataset(self, filters):
+        return Dataset(
+            datasetId="abc",
+            name="test",
+            version=1,
+            query={"endpoint": "google_sheets", "filters": filters},
+            lastUpdatedBy="test",
+            lastUpdatedOn="2000-01-01T00:00:00",
+        )
+
+    def test_only_templated_filters(self):
+        """Test that only the parameters of templated filters are part of the key"""
+        dataset = self.dataset(
+            [
+                QueryFilter(field="site", templated=True, value=[]),
+                QueryFilter(field="speed", value=["100"]),
+            ]
+        )
+        token = request_context._request_ctx_var.set(
+            make_request(query_string="speed=400&site=b&_=1&site=a")
+        )
+        try:
+            assert _templated_values(dataset) == [("site", "b"), ("site", "a")]
+        finally:
+            request_context._request_ctx_var.reset(token)
+
+    def test_without_request(self):
+        """Test that outputs prepared outside a request have no parameters"""
+        dataset = self.dataset([QueryFilter(field="site", templated=True, value=[])])
+        assert _templated_values(dataset) == []
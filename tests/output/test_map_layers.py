@@ -0,0 +1,128 @@
+import asyncio
+
+from terranova.abstract_models import Topology
+from terranova.api.routers import output
+from terranova.models import (
+    LayerConfiguration,
+    MapConfiguration,
+    MapRevision,
+    TilesetConfiguration,
+    Viewport,
+    ViewportCenter,
+)
+
+
+def make_layer(url):
+    return LayerConfiguration(
+        visible=True,
+        name=url,
+        color="#000000",
+        edgeWidth=1,
+        pathOffset=0,
+        nodeWidth=1,
+        jsonFromUrl=True,
+        mapjsonUrl=url,
+        endpointId="test",
+    )
+
+
+def make_map(urls):
+    configuration = MapConfiguration(
+        initialViewStrategy="fitBounds",
+        viewport=Viewport(center=ViewportCenter(lat=0.0, lng=0.0)),
+        background="#000000",
+        tileset=TilesetConfiguration(),
+        editMode=False,
+        showSidebar=True,
+        showViewControls=True,
+        showLegend=True,
+        enableScrolling=True,
+        enableEditing=False,
+        enableNodeAnimation=False,
+        enableEdgeAnimation=False,
+        zIndexBase=100,
+        layers=[make_layer(url) for url in urls],
+    )
+    return MapRevision(name="Test Map", configuration=configuration, overrides={})
+
+
+class FakeRender:
+    def __init__(self, dataset_id):
+        self.dataset_id = dataset_id
+
+
+class TestNormalizeMap:
+    """Tests for resolving map layers into their topologies"""
+
+    def patch_rendering(self, monkeypatch, delay=0.05):
+        """Replaces dataset output resolution and rendering with counting fakes"""
+        calls = {"prepare": [], "render": [], "in_flight": 0, "max_in_flight": 0}
+
+        async def prepare(dataset_id, layout, datatype, **kwargs):
+            calls["prepare"].append((dataset_id, layout, datatype, kwargs))
+            return FakeRender(dataset_id)
+
+        async def render(render, semaphore):
+            async with semaphore:
+                calls["render"].append(render.dataset_id)
+                calls["in_flight"] += 1
+                calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+                await asyncio.sleep(delay)
+                calls["in_flight"] -= 1
+            return Topology(nodes=[], edges=[], name=render.dataset_id, pathLayout={})
+
+        monkeypatch.setattr(output, "_prepare_dataset_output", prepare)
+        monkeypatch.setattr(output, "_render_layer", render)
+        return calls
+
+    def test_identical_layers_render_once(self, monkeypatch):
+        """Test that layers showing the same dataset output share one render"""
+        calls = self.patch_rendering(monkeypatch)
+        map_revision = make_map(
+            [
+                "http://x/output/dataset/aaa/geographic/live/",
+                "http://x/output/dataset/aaa/geographic/live/",
+                "http://x/output/dataset/aaa/logical/live/",
+                "http://x/output/dataset/bbb/geographic/live/?version=2",
+                "http://x/output/dataset/bbb/geographic/live/?version=2",
+            ]
+        )
+        asyncio.run(output._normalize_map(map_revision))
+
+        assert len(calls["prepare"]) == 3
+        assert sorted(calls["render"]) == ["aaa", "aaa", "bbb"]
+        names = ['"name":"%s"' % n for n in ("aaa", "aaa", "aaa", "bbb", "bbb")]
+        for layer, name in zip(map_revision.configuration.layers, names):
+            assert name in layer.mapjson
+
+    def test_layers_render_concurrently(self, monkeypatch):
+        """Test that distinct layers render at the same time, up to the configured bound"""
+        calls = self.patch_rendering(monkeypatch)
+        monkeypatch.setattr(output, "OUTPUT_LAYER_CONCURRENCY", 3)
+        map_revision = make_map(
+            ["http://x/output/dataset/d%d/geographic/live/" % i for i in range(8)]
+        )
+        asyncio.run(output._normalize_map(map_revision))
+
+        assert len(calls["render"]) == 8
+        assert calls["max_in_flight"] == 3
+
+    def test_topologies_without_serializing(self, monkeypatch):
+        """Test that layer topologies can be returned without filling in mapjson"""
+        self.patch_rendering(monkeypatch)
+        map_revision = make_map(["http://x/output/dataset/aaa/geographic/live/"])
+        topologies = asyncio.run(output._normalize_map(map_revision, serialize=False))
+
+        assert topologies == [
+            {"nodes": [], "edges": [], "layer": "tail", "name": "aaa", "pathLayout": {}}
+        ]
+        assert map_revision.configuration.layers[0].mapjson is None
+
+    def test_unknown_urls_are_skipped(self, monkeypatch):
+        """Test that layers without a dataset output url are left alone"""
+        calls = self.patch_rendering(monkeypatch)
+        map_revision = make_map(["http://example.com/topology.json"])
+        asyncio.run(output._normalize_map(map_revision))
+
+        assert calls["prepare"] == []
+        assert map_revision.configuration.layers[0].mapjson is None
@@ -0,0 +1,70 @@
+import copy
+import random
+
+from terranova.api.routers.output import _do_override
+from terranova.models import OverrideRule, OverrideType
+
+NAMES = ["a", "b", "c", "d", "e", "f"]
+
+
+def reference_do_override(overrides, json_data):
+    """The previous implementation of _do_override: a linear search per override"""
+    for identifier, override in overrides.items():
+        if not override.render:
+            continue
+        existing_index = next(
+            (i for (i, d) in enumerate(json_data) if d["name"] == identifier), None
+        )
+        if existing_index is None and override.operation in (
+            OverrideType.add,
+            OverrideType.override,
+        ):
+            json_data.append(override.state)
+        if existing_index is not None and override.operation == OverrideType.override:
+            json_data[existing_index] = override.state
+        if existing_index is not None and override.operation == OverrideType.delete:
+            del json_data[existing_index]
+
+
+def random_case(rng):
+    # a small pool of names makes duplicates, and states renaming elements to names
+    # that are overridden later, likely
+    json_data = [
+        {"name": rng.choice(NAMES), "id": i} for i in range(rng.randint(0, 10))
+    ]
+    overrides = {}
+    for identifier in rng.sample(NAMES, rng.randint(0, len(NAMES))):
+        operation = rng.choice(list(OverrideType))
+        state = None
+        if operation != OverrideType.delete or rng.random() < 0.5:
+            state = {"name": rng.choice(NAMES + [identifier] * 3), "state": identifier}
+        overrides[identifier] = OverrideRule(
+            operation=operation, state=state, render=rng.random() < 0.9
+        )
+    return overrides, json_data
+
+
+class TestDoOverride:
+    """Tests that applying overrides by index gives the same results as a linear search"""
+
+    def test_matches_reference(self):
+        """Test random overrides against random lists of nodes or edges"""
+        for seed in range(2000):
+            rng = random.Random(seed)
+            overrides, json_data = random_case(rng)
+            expected = copy.deepcopy(json_data)
+            reference_do_override(overrides, expected)
+
+            _do_override(overrides, json_data)
+            assert json_data == expected, "seed %d" % seed
+
+    def test_modifies_list_in_place(self):
+        """Test that the caller's list is updated, as topologies are passed by reference"""
+        json_data = [{"name": "a"}, {"name": "b"}, {"name": "a"}]
+        overrides = {
+            "a": OverrideRule(operation=OverrideType.delete, render=True),
+            "c": OverrideRule(operation=OverrideType.add, state={"name": "c"}, render=True),
+        }
+        original = json_data
+        _do_override(overrides, json_data)
+        assert original == [{"name": "b"}, {"name": "a"}, {"name": "c"}]
@@ -0,0 +1,51 @@
+import orjson as json
+
+from terranova.models import MapOverrides, OverrideRule
+from terranova.output.svg import render_map_svg
+from terranova.api.routers.output import _apply_layer_overrides
+from tests.output.test_map_layers import make_map
+
+
+def make_topology():
+    return {
+        "name": "topology",
+        "layer": "tail",
+        "pathLayout": {"type": "curveLinear"},
+        "nodes": [
+            {"name": "a", "coordinate": [1.0, 2.0], "meta": {"svg": "<g/>"}, "children": None},
+            {"name": "b", "coordinate": [3.0, 4.0], "meta": {"svg": "<g/>"}, "children": None},
+        ],
+        "edges": [
+            {
+                "name": "a--b",
+                "coordinates": [[1.0, 2.0], [3.0, 4.0]],
+                "meta": {"endpoint_identifiers": {"names": ["a", "b"]}},
+            }
+        ],
+    }
+
+
+class TestRenderMapSvg:
+    """Tests for rendering a map as svg"""
+
+    def test_topologies_match_mapjson(self):
+        """Test that passing layer topologies renders the same svg as reading mapjson"""
+        from_mapjson = make_map(["http://example.com/topology.json"])
+        from_mapjson.configuration.layers[0].mapjson = json.dumps(make_topology()).decode()
+        from_topologies = make_map(["http://example.com/topology.json"])
+
+        assert render_map_svg(from_topologies, [make_topology()]) == render_map_svg(
+            from_mapjson
+        )
+
+    def test_override_state_is_not_modified(self):
+        """Test that rendering doesn't modify the override states added to a topology"""
+        state = {"name": "c", "coordinate": [5.0, 6.0], "meta": {}, "children": None}
+        overrides = MapOverrides(
+            nodes={"c": OverrideRule(operation="add", state=state, render=True)}, edges={}
+        )
+        topology = make_topology()
+        _apply_layer_overrides(topology, overrides)
+        render_map_svg(make_map(["http://example.com/topology.json"]), [topology])
+
+        assert overrides.nodes["c"].state["coordinate"] == [5.0, 6.0]
@@ -0,0 +1,109 @@
+import importlib
+from unittest.mock import patch
+
+from terranova.output.templates import (
+    compile_template,
+    render_key,
+    template_references,
+    TEMPLATE_CACHE_SIZE,
+)
+from terranova.settings import DEFAULT_NODE_TEMPLATES
+
+
+class TestCompileTemplate:
+    """Tests for the shared compiled-template cache"""
+
+    def test_same_source_compiles_once(self):
+        """Test that the same source returns the same compiled template"""
+        source = "<g><text>{{ endpoint_name }}</text></g>"
+        assert compile_template(source) is compile_template(source)
+        assert compile_template(source).render(endpoint_name="A") == "<g><text>A</text></g>"
+
+    def test_different_sources(self):
+        """Test that different sources get their own compiled template"""
+        first = compile_template("<g>{{ name }}</g>")
+        second = compile_template("<rect>{{ name }}</rect>")
+        assert first is not second
+        assert second.render(name="B") == "<rect>B</rect>"
+
+    def test_cache_is_bounded(self):
+        """Test that the cache never holds more than TEMPLATE_CACHE_SIZE templates"""
+        for i in range(TEMPLATE_CACHE_SIZE + 10):
+            compile_template("<g data-index='%d'>{{ name }}</g>" % i)
+        assert compile_template.cache_info().currsize == TEMPLATE_CACHE_SIZE
+
+
+class TestTemplateReferences:
+    """Tests for finding the parts of the render context a template reads"""
+
+    def test_whole_variables_and_paths(self):
+        """Test that plain variables and constant lookups are reported as paths"""
+        source = "{{ endpoint_name }} {{ meta.site_type }} {{ meta['region'] }}"
+        assert template_references(source) == (
+            ("endpoint_name",),
+            ("meta", "region"),
+            ("meta", "site_type"),
+        )
+
+    def test_local_variables_are_ignored(self):
+        """Test that variables the template sets itself aren't reported"""
+        source = "{% for child in children %}{{ child }}{% endfor %}{% set x = 1 %}{{ x }}"
+        assert template_references(source) == (("children",),)
+
+    def test_dynamic_lookups_use_the_whole_variable(self):
+        """Test that lookups the template computes fall back to the whole variable"""
+        assert template_references("{% for k in keys %}{{ meta[k] }}{% endfor %}") == (
+            ("keys",),
+            ("meta",),
+        )
+        assert template_references("{{ meta.items() | list }}") == (("meta",),)
+
+    def test_render_key(self):
+        """Test that only the referenced values, with their types, make up the key"""
+        references = template_references("{{ meta.site_type }} {{ name }}")
+        key = render_key({"name": "a", "meta": {"site_type": "hub", "x": 1}}, references)
+        assert key == render_key({"name": "a", "meta": {"site_type": "hub", "x": 2}}, references)
+        assert key != render_key({"name": "a", "meta": {"site_type": "pop"}}, references)
+        assert key != render_key({"meta": {"site_type": "hub"}}, references)
+        assert render_key({"name": 1}, (("name",),)) != render_key({"name": True}, (("name",),))
+        assert render_key({"name": None}, (("name",),)) != render_key({}, (("name",),))
+
+
+class TestRenderGeographic:
+    """Tests for node rendering in the Google Sheets datasource"""
+
+    def edges(self):
+        def endpoint(name, site_type):
+            return {
+                "name": name,
+                "latitude": "1.0",
+                "longitude": "2.0",
+                "site_type": site_type,
+                "svg": '<g data-width="30" data-height="15"></g>',
+            }
+
+        return [
+            {"id": "1", "name": "a-b", "endpoints": [endpoint("a", "hub"), endpoint("b", "pop")]},
+            {"id": "2", "name": "b-c", "endpoints": [endpoint("b", "pop"), endpoint("c", "pop")]},
+            {"id": "3", "name": "c-d", "endpoints": [endpoint("c", "pop"), endpoint("d", "hub")]},
+        ]
+
+    def test_memoized_rendering_matches_per_node_rendering(self):
+        """Test that nodes get the same svg as rendering each node on its own"""
+        google_sheets = importlib.import_module("terranova.datasources.google_sheets.backend")
+        backend = google_sheets.GoogleSheetsBackend()
+        templates = [
+            DEFAULT_NODE_TEMPLATES["GEOGRAPHIC"],
+            DEFAULT_NODE_TEMPLATES["LOGICAL"],
+            "<circle r=\"{{ 6 if meta.site_type == 'hub' else 4 }}\" />",
+            "<g>{{ meta }}</g>",
+        ]
+        for template in templates:
+            memoized = backend._render_geographic(self.edges(), template, [])
+            with patch.object(google_sheets, "render_key", return_value=None):
+                per_node = backend._render_geographic(self.edges(), template, [])
+            assert memoized == per_node
+            assert len(memoized["nodes"]) == 4
+            for node in memoized["nodes"]:
+                assert node["meta"]["computed_width"] == 30
+                assert node["meta"]["computed_height"] == 15
@@ -0,0 +1,171 @@
+import fcntl
+import os
+import tempfile
+import threading
+
+import pytest
+
+from terranova import datacacher
+from terranova.settings import TOKEN_SCOPES
+from tests.fixtures.local_jwt import _make_jwt
+
+
+@pytest.fixture
+def status_path():
+    """A path for a status file, removed along with the job lock files afterwards"""
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, "status.json")
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+class TestRefreshJob:
+    """Tests for refreshing one datasource and recording the outcome"""
+
+    def test_success_is_recorded(self, status_path):
+        """Test that a refresh records its duration and the counts fetch returns"""
+        status = datacacher.RefreshStatus(status_path)
+        job = datacacher.RefreshJob("source", lambda: {"rows_written": 3}, status)
+        assert job.run() is True
+
+        recorded = datacacher.read_status(status_path)["source"]
+        assert recorded["state"] == "ok"
+        assert recorded["result"] == {"rows_written": 3}
+        assert recorded["consecutive_failures"] == 0
+        assert recorded["last_duration"] >= 0
+        assert "last_success" in recorded
+
+    def test_failures_back_off(self, status_path):
+        """Test that consecutive failures double the delay, up to max_backoff"""
+
+        def failing_fetch():
+            raise RuntimeError("quota exceeded")
+
+        status = datacacher.RefreshStatus(status_path)
+        job = datacacher.RefreshJob(
+            "source", failing_fetch, status, interval=10, jitter=0, max_backoff=50
+        )
+        assert job.next_delay() == 10
+        delays = []
+        for _ in range(4):
+            assert job.run() is False
+            delays.append(job.next_delay())
+        assert delays == [20, 40, 50, 50]
+
+        recorded = datacacher.read_status(status_path)["source"]
+        assert recorded["state"] == "failed"
+        assert recorded["consecutive_failures"] == 4
+        assert recorded["last_error"] == "RuntimeError: quota exceeded"
+
+        job.fetch = lambda: None
+        assert job.run() is True
+        assert job.next_delay() == 10
+        assert datacacher.read_status(status_path)["source"]["consecutive_failures"] == 0
+
+    def test_jitter(self, status_path):
+        """Test that delays are spread around the interval"""
+        status = datacacher.RefreshStatus(status_path)
+        job = datacacher.RefreshJob("source", lambda: None, status, interval=100, jitter=0.1)
+        delays = [job.next_delay() for _ in range(100)]
+        assert all(90 <= delay <= 110 for delay in delays)
+        assert len(set(delays)) > 1
+
+    def test_failures_survive_restarts(self, status_path):
+        """Test that a new job picks up the backoff of the previous process"""
+        status = datacacher.RefreshStatus(status_path)
+        status.update("source", consecutive_failures=2)
+        job = datacacher.RefreshJob(
+            "source", lambda: None, datacacher.RefreshStatus(status_path), interval=10, jitter=0
+        )
+        assert job.next_delay() == 40
+
+    def test_overlapping_refreshes_are_skipped(self, status_path):
+        """Test that a refresh doesn't start while another process holds the lock"""
+        calls = []
+        status = datacacher.RefreshStatus(status_path)
+        job = datacacher.RefreshJob("source", lambda: calls.append(1), status)
+
+        # flock locks belong to the open file, so this stands in for another process
+        with open(job.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            assert job.run() is None
+        assert calls == []
+        assert job.run() is True
+        assert calls == [1]
+
+    def test_loop_until_stopped(self, status_path):
+        """Test that a job refreshes repeatedly until it is stopped"""
+        stop = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            if len(calls) == 3:
+                stop.set()
+
+        status = datacacher.RefreshStatus(status_path)
+        job = datacacher.RefreshJob("source", fetch, status, interval=0.01)
+        thread = threading.Thread(target=job.loop, args=(stop,))
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert len(calls) == 3
+        assert "next_run" in datacacher.read_status(status_path)["source"]
+
+
+class TestScheduler:
+    """Tests for scheduling every datasource"""
+
+    def test_per_datasource_options(self, status_path, monkeypatch):
+        """Test that datasource settings override the defaults"""
+        options = {"google_sheets": {"interval": 5}}
+        monkeypatch.setattr(datacacher, "DATACACHER_DATASOURCES", options)
+        jobs = datacacher.refresh_jobs(datacacher.RefreshStatus(status_path))
+        job = next(job for job in jobs if job.name == "google_sheets")
+        assert job.interval == 5
+        assert job.jitter == datacacher.DATACACHER_JITTER
+
+    def test_unknown_options_are_ignored(self, status_path, monkeypatch, caplog):
+        """Test that a misspelled datasource setting is logged rather than failing"""
+        options = {"google_sheets": {"interval": 5, "intervall": 10}}
+        monkeypatch.setattr(datacacher, "DATACACHER_DATASOURCES", options)
+        jobs = datacacher.refresh_jobs(datacacher.RefreshStatus(status_path))
+        job = next(job for job in jobs if job.name == "google_sheets")
+        assert job.interval == 5
+        assert "unknown datacacher option 'intervall' for 'google_sheets'" in caplog.text
+
+    def test_run_once(self, status_path):
+        """Test that --once refreshes every datasource a single time"""
+        status = datacacher.RefreshStatus(status_path)
+        calls = []
+        jobs = [
+            datacacher.RefreshJob(name, lambda name=name: calls.append(name), status)
+            for name in ("a", "b")
+        ]
+        datacacher.run_once(jobs)
+        assert sorted(calls) == ["a", "b"]
+        assert set(datacacher.read_status(status_path)) == {"a", "b"}
+
+
+class TestStatusEndpoint:
+    """Tests for the datasource refresh status endpoint"""
+
+    def test_status(self, client, status_path, monkeypatch):
+        """Test that admins can read the status file"""
+        datacacher.RefreshStatus(status_path).update("source", state="ok")
+        monkeypatch.setattr(datacacher, "DATACACHER_STATUS_FILE", status_path)
+
+        response = client.get(
+            "/cache/datasources/",
+            headers={"Authorization": "Bearer %s" % _make_jwt(scopes=[TOKEN_SCOPES["admin"]])},
+        )
+        assert response.status_code == 200
+        assert response.json() == {"source": {"state": "ok"}}
+
+    def test_requires_admin(self, client, readonly_jwt):
+        """Test that the status needs the admin scope"""
+        response = client.get(
+            "/cache/datasources/", headers={"Authorization": "Bearer %s" % readonly_jwt}
+        )
+        assert response.status_code == 401